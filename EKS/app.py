@@ -1,23 +1,46 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, Request, render_template, request, jsonify, Response
 import subprocess
 from pathlib import Path
 import os
+import tempfile
 import time
 import json
+import sys
 import logging
-import boto3
+import threading
+import yaml
 from botocore.exceptions import ClientError
 from werkzeug.utils import secure_filename
+from config_store import ConfigStore
+from helm_values import load_diff
+from pem_store import PemStore
+import sizing
+import log_filters
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import init_app, instrument_boto3, track_subprocess
+from ec2_inventory import EC2Inventory, filter_instances, paginate, DEFAULT_PAGE_SIZE
 
 UPLOAD_FOLDER = '/opt/observability/EKS/PEM_FILES'  # or another secure location
 ALLOWED_EXTENSIONS = {'pem'}
+# Overlays in loki-profiles/ for the Loki query path
+LOKI_PROFILES = ('small', 'medium', 'large')
+
+class DiskSpooledRequest(Request):
+    """Spool every uploaded file to disk instead of keeping small ones in memory."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.TemporaryFile('wb+')
 
 app = Flask(__name__)
+app.request_class = DiskSpooledRequest
+init_app(app, "eks")
+instrument_boto3()
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Create upload folder if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Create upload folder if it doesn't exist; keys are stored once per content hash
+pem_store = PemStore(UPLOAD_FOLDER)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -36,43 +59,40 @@ logger = logging.getLogger(__name__)
 BASE_DIR = "/opt/observability/EKS/"
 VARIABLES_FILE = "variables.sh"
 GKE_VARIABLES_FILE = "gke-variables.sh"
+PROFILES_FILE = "eks-profiles.json"
+GKE_PROFILES_FILE = "gke-profiles.json"
+PROFILES_DIR = f"{BASE_DIR}profiles"
 SETUP_SCRIPT = f"{BASE_DIR}monitoring_setup.sh"
 GKE_SETUP_SCRIPT = f"{BASE_DIR}gke_monitoring_setup.sh"
 
 deployment_progress = {"progress": 0, "status": "Initializing..."}
 
-def read_variables(var_file):
-    """Read variables from variables.sh and return them as a dictionary."""
-    variables = {}
-    with open(var_file, "r") as file:
-        for line in file:
-            line = line.strip()
-            if line and not line.startswith("#"):  # Ignore comments
-                key, value = line.split("=", 1)
-                variables[key.strip()] = value.strip().strip('"')  # Remove quotes if present
-    return variables
-
-def write_variables(updated_vars, var_file):
-    """Write updated variables to variables.sh."""
-    with open(var_file, "r") as file:
-        lines = file.readlines()
-
-    with open(var_file, "w") as file:
-        for line in lines:
-            if line.strip() and not line.startswith("#"):  # Ignore empty and comment lines
-                key = line.split("=")[0].strip()
-                if key in updated_vars:
-                    # Handle array variables
-                    if key in ['EC2_INSTANCES', 'EC2_INSTANCE_IDS', 'EC2_INSTANCE_NAMES', 'EC2_PEM_FILES']:
-                        file.write(f'{key}={updated_vars[key]}\n')  # Arrays are already formatted
-                    else:
-                        file.write(f'{key}="{updated_vars[key]}"\n')
-                else:
-                    file.write(line)
-            else:
-                file.write(line)
-
-def run_setup(script_file):
+# Shared, TTL-cached EC2 inventory backing the instance picker
+ec2_inventory = EC2Inventory()
+
+# Deploy profiles per cluster; variables.sh / gke-variables.sh are only templates
+eks_config = ConfigStore(PROFILES_FILE, VARIABLES_FILE)
+gke_config = ConfigStore(GKE_PROFILES_FILE, GKE_VARIABLES_FILE)
+profile_locks = {}
+profile_locks_guard = threading.Lock()
+
+def profile_lock(kind, profile):
+    """Lock guarding deploys of one cluster profile; different clusters deploy in parallel."""
+    with profile_locks_guard:
+        return profile_locks.setdefault((kind, profile), threading.Lock())
+
+def render_profile(store, kind, profile, var_file):
+    """Render a profile to its own variables file and return the env the setup script needs."""
+    profile_dir = os.path.join(PROFILES_DIR, kind, secure_filename(profile) or 'default')
+    variables_path = store.render(profile, os.path.join(profile_dir, var_file))
+    return {
+        'VARIABLES_FILE': variables_path,
+        'STATE_DIR': profile_dir,
+        # Keep kubectl/helm contexts of concurrent deploys apart
+        'KUBECONFIG': os.path.join(profile_dir, 'kubeconfig')
+    }
+
+def run_setup(script_file, extra_env=None):
     try:
         script_path = Path(script_file)
 
@@ -101,19 +121,21 @@ def run_setup(script_file):
 
         # *****************
 
-        result = subprocess.run(
-            ["/bin/bash", str(script_path)],
-            check=True,
-            capture_output=True,
-            text=True,
-            cwd=str(script_path.parent),
-            env={
-                **os.environ.copy(),
-                'PWD': str(script_path.parent),
-                'SHELL': '/bin/bash',
-                'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
-            }
-        )
+        with track_subprocess(script_path.name):
+            result = subprocess.run(
+                ["/bin/bash", str(script_path)],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=str(script_path.parent),
+                env={
+                    **os.environ.copy(),
+                    'PWD': str(script_path.parent),
+                    'SHELL': '/bin/bash',
+                    'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin',
+                    **(extra_env or {})
+                }
+            )
         
         logger.info(f"Script stdout: {result.stdout}")
         logger.info(f"Script stderr: {result.stderr}")
@@ -152,18 +174,63 @@ def index():
 
 @app.route("/eks", methods=["GET"])
 def form():
-    variables = read_variables(VARIABLES_FILE)
+    variables = eks_config.get_profile(request.args.get('profile'))
     return render_template("eks-form.html", variables=variables)
 
 @app.route("/gke", methods=["GET"])
 def gke_form():
-    variables = read_variables(GKE_VARIABLES_FILE)
+    variables = gke_config.get_profile(request.args.get('profile'))
     return render_template("gke-form.html", variables=variables)
 
 @app.route("/documentation")
 def decumentation():
     return render_template("documentation.html")
 
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify({
+        'eks': eks_config.list_profiles(),
+        'gke': gke_config.list_profiles()
+    })
+
+@app.route('/api/helm-diff', methods=['GET'])
+def helm_diff():
+    """Changed keys of the effective Helm values from the last deploy of a profile."""
+    kind = request.args.get('kind', 'eks')
+    profile = request.args.get('profile', '')
+    release = request.args.get('release', 'prometheus-stack')
+    if kind not in ('eks', 'gke') or not profile:
+        return jsonify({'error': 'kind (eks/gke) and profile are required'}), 400
+
+    profile_dir = os.path.join(PROFILES_DIR, kind, secure_filename(profile) or 'default')
+    report = load_diff(profile_dir, secure_filename(release))
+    if report is None:
+        return jsonify({'error': f"No values diff recorded for {release} in profile '{profile}'"}), 404
+    return jsonify(report)
+
+@app.route('/api/sizing', methods=['POST'])
+def sizing_estimate():
+    """Capacity estimate and the deploy variables it would set, for the sizing inputs of the form."""
+    variables = request.get_json(silent=True) or request.form.to_dict()
+    estimate = sizing.estimate(sizing.inputs_from_variables(variables))
+    return jsonify({
+        'estimate': estimate,
+        'variables': sizing.deploy_variables(estimate)
+    })
+
+@app.route('/api/log-filters', methods=['POST'])
+def log_filters_preview():
+    """Promtail values the log filter rules and guards of the form compile to."""
+    variables = request.get_json(silent=True) or request.form.to_dict()
+    try:
+        values = log_filters.deploy_values(variables)
+    except log_filters.RuleError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'values': values,
+        'yaml': yaml.safe_dump(values, sort_keys=False, default_flow_style=False) if values else ''
+    })
+
 @app.route('/deployment-progress')
 def deployment_progress():
     def generate():
@@ -175,35 +242,44 @@ def deployment_progress():
 @app.route('/api/fetch-instances', methods=['POST'])
 def fetch_instances():
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         region = data.get('region')
-        
-        if not region:
-            return jsonify({'error': 'Region is required'}), 400
+        all_regions = bool(data.get('all_regions'))
+        regions = data.get('regions') or []
+        # A bare string would be fanned out one character at a time
+        if not isinstance(regions, list) or not all(isinstance(r, str) and r for r in regions):
+            return jsonify({'error': 'regions must be a list of region names'}), 400
 
-        # Create EC2 client without explicitly providing credentials
-        # It will automatically use the IAM role attached to the instance
-        ec2 = boto3.client('ec2', region_name=region)
+        if not region and not regions and not all_regions:
+            return jsonify({'error': 'Region is required'}), 400
 
-        # Fetch running instances
-        response = ec2.describe_instances(
-            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
+        refresh = bool(data.get('refresh'))
+        errors = {}
+        if all_regions or regions:
+            if all_regions:
+                regions = ec2_inventory.list_regions()
+            fetched_at, instances, errors = ec2_inventory.get_regions(regions, refresh=refresh)
+        else:
+            fetched_at, instances = ec2_inventory.get_region(region, refresh=refresh)
+
+        instances = filter_instances(
+            instances,
+            tag=data.get('tag'),
+            name_prefix=data.get('name_prefix'),
+            vpc_id=data.get('vpc_id'),
+            subnet_id=data.get('subnet_id')
         )
-
-        instances = []
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_data = {
-                    'id': instance['InstanceId'],
-                    'ip': instance.get('PrivateIpAddress', ''),
-                    'name': next((tag['Value'] for tag in instance.get('Tags', []) 
-                                if tag['Key'] == 'Name'), 'Unnamed')
-                }
-                instances.append(instance_data)
+        result = paginate(instances, data.get('page', 1), data.get('page_size', DEFAULT_PAGE_SIZE))
 
         return jsonify({
             'success': True,
-            'instances': instances
+            'instances': result['items'],
+            'page': result['page'],
+            'page_size': result['page_size'],
+            'total': result['total'],
+            'has_more': result['has_more'],
+            'cache_age': round(time.time() - fetched_at, 1),
+            'region_errors': errors
         })
 
     except ClientError as e:
@@ -212,6 +288,7 @@ def fetch_instances():
             'error': str(e)
         }), 500
     except Exception as e:
+        logger.error(f"Error fetching instances: {str(e)}")
         return jsonify({
             'success': False,
             'error': 'An unexpected error occurred'
@@ -241,12 +318,11 @@ def deploy():
                 instance_id = key.replace('pem_file_', '')
                 
                 if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(f"{instance_id}_{file.filename}")
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(filepath)
-                    # Set proper permissions for the PEM file
-                    os.chmod(filepath, 0o600)
+                    # Identical keys map to the same file, stored with 0600 permissions
+                    filepath = pem_store.save(file)
                     instance_details[instance_id] = {'pem_path': filepath}
+
+        pem_store.cleanup()
         
         # Parse form data for EC2 instances
         instance_count = 0
@@ -273,12 +349,32 @@ def deploy():
 
         # Update variables dictionary
         updated_vars = {key: request.form[key] for key in request.form}
-        # Format arrays for variables.sh
-        updated_vars['EC2_INSTANCES'] = "(" + " ".join([f'"{ip}"' for ip in selected_instances]) + ")"
-        updated_vars['EC2_INSTANCE_IDS'] = "(" + " ".join([f'"{id}"' for id in instance_ids]) + ")"
-        updated_vars['EC2_INSTANCE_NAMES'] = "(" + " ".join([f'"{name}"' for name in instance_names]) + ")"
-        updated_vars['EC2_PEM_FILES'] = "(" + " ".join([f'"{path}"' for path in pem_file_paths]) + ")"
-        updated_vars['EC2_INSTANCE_COUNT'] = str(instance_count)
+        if updated_vars.get('LOKI_PROFILE', 'small') not in LOKI_PROFILES:
+            return jsonify({
+                "success": False,
+                "message": f"❌ Unknown Loki profile '{updated_vars['LOKI_PROFILE']}', expected {', '.join(LOKI_PROFILES)}"
+            }), 400
+        if updated_vars.get('LOKI_PROFILE') in sizing.LOKI_OBJECT_STORE_PROFILES:
+            return jsonify({
+                "success": False,
+                "message": f"❌ The {updated_vars['LOKI_PROFILE']} Loki profile needs an object store; "
+                           f"Loki keeps chunks on the ingester's volume, so use the small profile"
+            }), 400
+        try:
+            log_filters.deploy_values(updated_vars)
+        except log_filters.RuleError as e:
+            return jsonify({"success": False, "message": f"❌ Invalid log filters: {e}"}), 400
+        updated_vars['EC2_INSTANCES'] = selected_instances
+        updated_vars['EC2_INSTANCE_IDS'] = instance_ids
+        updated_vars['EC2_INSTANCE_NAMES'] = instance_names
+        updated_vars['EC2_PEM_FILES'] = pem_file_paths
+        updated_vars['EC2_INSTANCE_COUNT'] = instance_count
+
+        # PV sizes, retention, memory and replicas follow the expected load instead of the form
+        if updated_vars.get('SIZING_MODE') == 'auto':
+            sized_vars = sizing.deploy_variables(sizing.estimate(sizing.inputs_from_variables(updated_vars)))
+            app.logger.info(f"Sized deploy variables: {sized_vars}")
+            updated_vars.update(sized_vars)
         
         # Debug logging
         app.logger.debug(f"Selected instances: {selected_instances}")
@@ -286,13 +382,25 @@ def deploy():
         app.logger.debug(f"Instance names: {instance_names}")
         app.logger.debug(f"PEM file paths: {pem_file_paths}")
         
-        write_variables(updated_vars, VARIABLES_FILE)
-
-        deployment_progress = {"progress": 40, "status": "Preparing deployment..."}
-        
-        # Run setup script
-        deployment_progress = {"progress": 60, "status": "Executing deployment script..."}
-        result = run_setup(SETUP_SCRIPT)
+        # Only the deploy holding the lock may overwrite the stored profile
+        profile = eks_config.profile_name(updated_vars)
+        lock = profile_lock('eks', profile)
+        if not lock.acquire(blocking=False):
+            return jsonify({
+                "success": False,
+                "message": f"❌ A deployment for cluster '{profile}' is already running"
+            }), 409
+
+        try:
+            eks_config.save_profile(updated_vars)
+            deployment_progress = {"progress": 40, "status": "Preparing deployment..."}
+            setup_env = render_profile(eks_config, 'eks', profile, VARIABLES_FILE)
+
+            # Run setup script
+            deployment_progress = {"progress": 60, "status": "Executing deployment script..."}
+            result = run_setup(SETUP_SCRIPT, setup_env)
+        finally:
+            lock.release()
         
         deployment_progress = {"progress": 100, "status": "Deployment completed successfully!"}
         
@@ -319,13 +427,25 @@ def gke_deploy():
         # Update variables
         deployment_progress = {"progress": 20, "status": "Updating configuration..."}
         updated_vars = {key: request.form[key] for key in request.form}
-        write_variables(updated_vars, GKE_VARIABLES_FILE)
-
-        deployment_progress = {"progress": 40, "status": "Preparing deployment..."}
-        
-        # Run setup script
-        deployment_progress = {"progress": 60, "status": "Executing deployment script..."}
-        result = run_setup(GKE_SETUP_SCRIPT)
+        # Only the deploy holding the lock may overwrite the stored profile
+        profile = gke_config.profile_name(updated_vars)
+        lock = profile_lock('gke', profile)
+        if not lock.acquire(blocking=False):
+            return jsonify({
+                "success": False,
+                "message": f"❌ A deployment for cluster '{profile}' is already running"
+            }), 409
+
+        try:
+            gke_config.save_profile(updated_vars)
+            deployment_progress = {"progress": 40, "status": "Preparing deployment..."}
+            setup_env = render_profile(gke_config, 'gke', profile, GKE_VARIABLES_FILE)
+
+            # Run setup script
+            deployment_progress = {"progress": 60, "status": "Executing deployment script..."}
+            result = run_setup(GKE_SETUP_SCRIPT, setup_env)
+        finally:
+            lock.release()
         
         deployment_progress = {"progress": 100, "status": "Deployment completed successfully!"}
         
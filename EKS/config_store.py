@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Keys rendered as bash arrays and as bare integers; everything else is a quoted string
+ARRAY_KEYS = {'EC2_INSTANCES', 'EC2_INSTANCE_IDS', 'EC2_INSTANCE_NAMES', 'EC2_PEM_FILES'}
+INT_KEYS = {'EC2_INSTANCE_COUNT'}
+
+ASSIGNMENT_RE = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)=(.*)$')
+
+
+def _bash_quote(value):
+    """Quote a value for a double-quoted bash assignment."""
+    escaped = str(value)
+    for char in ('\\', '"', '$', '`'):
+        escaped = escaped.replace(char, '\\' + char)
+    return f'"{escaped}"'
+
+
+# Characters a backslash escapes inside double quotes, exactly the ones _bash_quote escapes
+DOUBLE_QUOTE_ESCAPES = ('\\', '"', '$', '`')
+
+
+def _bash_words(raw):
+    """Split an assignment value into words the way bash removes quotes.
+
+    Inside double quotes a backslash only escapes the characters _bash_quote
+    escapes, so values round-trip; shlex would keep the backslash before
+    ``$`` and backticks. Stops at an unquoted ``#`` comment or ``)``.
+    """
+    words, word, in_word = [], [], False
+    i = 0
+    while i < len(raw):
+        char = raw[i]
+        if char in ' \t':
+            if in_word:
+                words.append(''.join(word))
+                word, in_word = [], False
+        elif char == ')' or (char == '#' and not in_word):
+            break
+        elif char == "'":
+            end = raw.index("'", i + 1)
+            word.append(raw[i + 1:end])
+            in_word, i = True, end
+        elif char == '"':
+            i += 1
+            while raw[i] != '"':
+                if raw[i] == '\\' and raw[i + 1] in DOUBLE_QUOTE_ESCAPES:
+                    i += 1
+                word.append(raw[i])
+                i += 1
+            in_word = True
+        elif char == '\\' and i + 1 < len(raw):
+            i += 1
+            word.append(raw[i])
+            in_word = True
+        else:
+            word.append(char)
+            in_word = True
+        i += 1
+    if in_word:
+        words.append(''.join(word))
+    return words
+
+
+def _parse_value(key, raw):
+    raw = raw.strip()
+    if raw.startswith('('):
+        return _bash_words(raw[1:])
+    tokens = _bash_words(raw)
+    value = tokens[0] if tokens else ''
+    if key in INT_KEYS:
+        try:
+            return int(value)
+        except ValueError:
+            return 0
+    return value
+
+
+def parse_variables_file(path):
+    """Parse a variables.sh template into an ordered dict of typed defaults."""
+    variables = {}
+    with open(path, 'r') as file:
+        for line in file:
+            match = ASSIGNMENT_RE.match(line.strip())
+            if match:
+                key, raw = match.groups()
+                variables[key] = _parse_value(key, raw)
+    return variables
+
+
+def coerce(key, value):
+    """Convert a form or JSON value to the type the template declares for it."""
+    if key in ARRAY_KEYS:
+        if isinstance(value, (list, tuple)):
+            return [str(v) for v in value]
+        value = str(value).strip()
+        if value.startswith('('):
+            return _parse_value(key, value)
+        return [value] if value else []
+    if key in INT_KEYS:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+    return '' if value is None else str(value)
+
+
+def render_line(key, value):
+    if key in ARRAY_KEYS:
+        return f'{key}=(' + ' '.join(_bash_quote(v) for v in value) + ')'
+    if key in INT_KEYS:
+        return f'{key}={int(value)}'
+    return f'{key}={_bash_quote(value)}'
+
+
+def round_trip(key, value):
+    """The value a variables file rendered with ``value`` gives back when parsed."""
+    return _parse_value(key, render_line(key, coerce(key, value)).split('=', 1)[1])
+
+
+def atomic_write(path, content, mode=0o600):
+    """Write to a temp file in the same directory and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ConfigStore:
+    """Per-cluster deploy profiles stored as JSON and cached by mtime.
+
+    The variables.sh template is only read to learn the keys, their types and
+    defaults; it is never rewritten. A profile is rendered to its own
+    variables file when a deploy starts, so deploys to different clusters do
+    not overwrite each other's configuration.
+    """
+
+    def __init__(self, store_path, template_path, profile_key='CLUSTER_NAME'):
+        self.store_path = store_path
+        self.template_path = template_path
+        self.profile_key = profile_key
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._profiles_mtime = None
+        self._defaults = {}
+        self._defaults_mtime = None
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def defaults(self):
+        mtime = self._mtime(self.template_path)
+        if mtime != self._defaults_mtime:
+            with self._lock:
+                self._defaults = parse_variables_file(self.template_path)
+                self._defaults_mtime = mtime
+        return self._defaults
+
+    def _load_profiles(self):
+        mtime = self._mtime(self.store_path)
+        if mtime != self._profiles_mtime:
+            with self._lock:
+                if mtime is None:
+                    self._profiles = {}
+                else:
+                    with open(self.store_path, 'r') as file:
+                        self._profiles = json.load(file).get('profiles', {})
+                self._profiles_mtime = mtime
+        return self._profiles
+
+    def list_profiles(self):
+        return sorted(self._load_profiles().keys())
+
+    def get_profile(self, name=None):
+        """Template defaults overlaid with the named profile, if it exists."""
+        variables = dict(self.defaults())
+        if name:
+            variables.update(self._load_profiles().get(name, {}))
+        return variables
+
+    def profile_name(self, values):
+        """Name of the profile ``save_profile`` would store ``values`` under."""
+        return str(values.get(self.profile_key, '')).strip() or 'default'
+
+    def save_profile(self, values):
+        """Store the known keys from ``values`` under the profile named by ``profile_key``."""
+        defaults = self.defaults()
+        name = self.profile_name(values)
+        profile = {key: coerce(key, value) for key, value in values.items() if key in defaults}
+
+        with self._lock:
+            profiles = {}
+            if os.path.exists(self.store_path):
+                with open(self.store_path, 'r') as file:
+                    profiles = json.load(file).get('profiles', {})
+            profiles[name] = {**profiles.get(name, {}), **profile}
+            atomic_write(self.store_path, json.dumps({'profiles': profiles}, indent=2, sort_keys=True))
+            self._profiles = profiles
+            self._profiles_mtime = self._mtime(self.store_path)
+        logger.info(f"Saved deploy profile '{name}' to {self.store_path}")
+        return name
+
+    def render(self, name, dest_path):
+        """Render a profile to a variables.sh file that the setup scripts can source."""
+        variables = self.get_profile(name)
+        lines = [f'# Rendered from profile "{name}" by the monitoring portal']
+        lines.extend(render_line(key, value) for key, value in variables.items())
+        atomic_write(dest_path, '\n'.join(lines) + '\n')
+        return dest_path
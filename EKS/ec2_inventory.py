@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# How long a region's instance list is served from memory before it is re-read
+INVENTORY_TTL_SECONDS = 120
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_REGION_WORKERS = 8
+
+
+class EC2Inventory:
+    """Paginated, TTL-cached view of running EC2 instances per region.
+
+    Clients are created once per region and reused. Each region is refreshed
+    at most once per TTL, even when several requests ask for it at the same
+    time, so the form can re-filter and page through thousands of instances
+    without going back to the EC2 API.
+    """
+
+    def __init__(self, ttl=INVENTORY_TTL_SECONDS):
+        self.ttl = ttl
+        self._clients = {}
+        self._cache = {}  # region -> (fetched_at, [instances])
+        self._lock = threading.Lock()
+        self._region_locks = {}
+
+    def _client(self, region):
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                # Uses the IAM role attached to the instance
+                client = boto3.client('ec2', region_name=region)
+                self._clients[region] = client
+            return client
+
+    def _region_lock(self, region):
+        with self._lock:
+            return self._region_locks.setdefault(region, threading.Lock())
+
+    def _describe_region(self, region):
+        """Read every running instance in a region, following NextToken."""
+        paginator = self._client(region).get_paginator('describe_instances')
+        pages = paginator.paginate(
+            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}],
+            PaginationConfig={'PageSize': 1000}
+        )
+        instances = []
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+                    instances.append({
+                        'id': instance['InstanceId'],
+                        'ip': instance.get('PrivateIpAddress', ''),
+                        'public_ip': instance.get('PublicIpAddress', ''),
+                        'name': tags.get('Name', 'Unnamed'),
+                        'type': instance.get('InstanceType', ''),
+                        'vpc_id': instance.get('VpcId', ''),
+                        'subnet_id': instance.get('SubnetId', ''),
+                        'az': instance.get('Placement', {}).get('AvailabilityZone', ''),
+                        'region': region,
+                        'tags': tags
+                    })
+        instances.sort(key=lambda i: (i['name'].lower(), i['id']))
+        return instances
+
+    def get_region(self, region, refresh=False):
+        """Return (fetched_at, instances) for a region, re-reading it if stale."""
+        cached = self._cache.get(region)
+        if not refresh and cached and time.time() - cached[0] < self.ttl:
+            return cached
+
+        # Only one request per region hits the API; the rest wait for its result
+        with self._region_lock(region):
+            cached = self._cache.get(region)
+            if not refresh and cached and time.time() - cached[0] < self.ttl:
+                return cached
+            started = time.time()
+            instances = self._describe_region(region)
+            logger.info(f"Fetched {len(instances)} running instances in {region} "
+                        f"in {time.time() - started:.2f}s")
+            cached = (time.time(), instances)
+            self._cache[region] = cached
+            return cached
+
+    def list_regions(self):
+        """Regions enabled for this account, used by the cross-region mode."""
+        response = self._client('us-east-1').describe_regions()
+        return sorted(region['RegionName'] for region in response['Regions'])
+
+    def get_regions(self, regions, refresh=False):
+        """Fan out over several regions. Regions that fail are reported, not raised."""
+        instances, errors, oldest = [], {}, time.time()
+        with ThreadPoolExecutor(max_workers=min(MAX_REGION_WORKERS, len(regions)) or 1) as executor:
+            futures = {executor.submit(self.get_region, region, refresh): region for region in regions}
+            for future in as_completed(futures):
+                region = futures[future]
+                try:
+                    fetched_at, region_instances = future.result()
+                    instances.extend(region_instances)
+                    oldest = min(oldest, fetched_at)
+                except Exception as e:
+                    logger.warning(f"Could not fetch instances in region {region}: {str(e)}")
+                    errors[region] = str(e)
+        instances.sort(key=lambda i: (i['region'], i['name'].lower(), i['id']))
+        return oldest, instances, errors
+
+    def invalidate(self, region=None):
+        with self._lock:
+            if region:
+                self._cache.pop(region, None)
+            else:
+                self._cache.clear()
+
+
+def filter_instances(instances, tag=None, name_prefix=None, vpc_id=None, subnet_id=None):
+    """Apply the picker's server-side filters.
+
+    ``tag`` is either ``key`` (tag present) or ``key=value``.
+    """
+    tag_key, tag_value = None, None
+    if tag:
+        tag_key, _, tag_value = tag.partition('=')
+        tag_key = tag_key.strip()
+        tag_value = tag_value.strip() if '=' in tag else None
+    prefix = name_prefix.lower() if name_prefix else None
+
+    result = []
+    for instance in instances:
+        if vpc_id and instance['vpc_id'] != vpc_id:
+            continue
+        if subnet_id and instance['subnet_id'] != subnet_id:
+            continue
+        if prefix and not instance['name'].lower().startswith(prefix):
+            continue
+        if tag_key:
+            if tag_key not in instance['tags']:
+                continue
+            if tag_value is not None and instance['tags'][tag_key] != tag_value:
+                continue
+        result.append(instance)
+    return result
+
+
+def paginate(items, page=1, page_size=DEFAULT_PAGE_SIZE):
+    """Slice a list into a 1-based page, clamping bad input instead of failing."""
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    start = (page - 1) * page_size
+    return {
+        'items': items[start:start + page_size],
+        'page': page,
+        'page_size': page_size,
+        'total': len(items),
+        'has_more': start + page_size < len(items)
+    }
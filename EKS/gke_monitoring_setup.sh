@@ -4,7 +4,10 @@ set -e  # Exit on error
 
 clear
 
-source ./gke-variables.sh
+source "${VARIABLES_FILE:-./gke-variables.sh}"
+
+# Per-cluster state (rendered values, last released values hash) lives next to the variables file
+STATE_DIR="${STATE_DIR:-$(pwd)/.state}"
 
 PROMETHEUS_CHART="prometheus-community/kube-prometheus-stack"
 LOKI_CHART="grafana/loki-distributed"
@@ -1076,11 +1079,33 @@ check_and_add_helm_repo() {
 
 deploy_prometheus() {
   echo "Deploying prometheus..."
-  helm upgrade --install prometheus-stack $PROMETHEUS_CHART -n $NAMESPACE -f values.yaml --version $PROMETHEUS_VERSION --values - <<EOF
+  mkdir -p "$STATE_DIR"
+  local overrides="$STATE_DIR/prometheus-overrides.yaml"
+  cat > "$overrides" <<EOF
 $NODE_PLACEMENT_CONFIG
 $STORAGE_CLASS
 $PROMETHEUS_STORAGE_CLASS
 EOF
+
+  # Skip the chart render and rollout when the merged values match the last successful release
+  local force_flag=""
+  if ! helm status prometheus-stack -n "$NAMESPACE" 2>/dev/null | grep -q "STATUS: deployed"; then
+    force_flag="--force"
+  fi
+  local check_status=0
+  python3 helm_values.py check --state-dir "$STATE_DIR" --release prometheus-stack \
+    --chart "$PROMETHEUS_CHART" --version "$PROMETHEUS_VERSION" \
+    -f values.yaml -f "$overrides" $force_flag || check_status=$?
+
+  if [ "$check_status" -eq 3 ]; then
+    echo "✅ prometheus-stack values unchanged since the last successful release, skipping helm upgrade."
+    return 0
+  elif [ "$check_status" -ne 0 ]; then
+    echo "⚠️ Could not compare prometheus-stack values, upgrading anyway."
+  fi
+
+  helm upgrade --install prometheus-stack $PROMETHEUS_CHART -n $NAMESPACE -f values.yaml --version $PROMETHEUS_VERSION -f "$overrides"
+  python3 helm_values.py record --state-dir "$STATE_DIR" --release prometheus-stack || true
 }
 
 patch_service() {
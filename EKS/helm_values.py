@@ -0,0 +1,193 @@
+"""Effective Helm values hashing and diffing for the setup scripts.
+
+``monitoring_setup.sh`` calls this before ``helm upgrade`` so that a redeploy
+with unchanged values skips the chart render and rollout:
+
+    python3 helm_values.py check --state-dir DIR --release NAME --chart CHART \\
+        --version VERSION -f values.yaml -f overrides.yaml
+
+exits 0 when an upgrade is needed and 3 when the merged values match the
+last successful release. ``record`` is called after a successful upgrade.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from config_store import atomic_write
+
+UNCHANGED_EXIT_CODE = 3
+MAX_DIFF_ENTRIES = 200
+
+
+def deep_merge(base, override):
+    """Merge like Helm does for multiple -f files: maps merge, everything else is replaced."""
+    result = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = deep_merge(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def load_values(files):
+    merged = {}
+    for path in files:
+        with open(path, 'r') as file:
+            data = yaml.safe_load(file) or {}
+        if not isinstance(data, dict):
+            raise ValueError(f"{path} does not contain a YAML mapping")
+        merged = deep_merge(merged, data)
+    return merged
+
+
+def values_hash(values, chart, version):
+    canonical = json.dumps({'chart': chart, 'version': version, 'values': values},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def flatten(values, prefix=''):
+    """Flatten nested maps into dotted key paths; lists are compared as a whole."""
+    flat = {}
+    for key, value in values.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+def diff_values(old, new):
+    """Structured diff of changed keys between two merged value trees."""
+    old_flat, new_flat = flatten(old or {}), flatten(new or {})
+    added = {k: new_flat[k] for k in sorted(new_flat.keys() - old_flat.keys())}
+    removed = {k: old_flat[k] for k in sorted(old_flat.keys() - new_flat.keys())}
+    changed = {
+        k: {'old': old_flat[k], 'new': new_flat[k]}
+        for k in sorted(old_flat.keys() & new_flat.keys())
+        if old_flat[k] != new_flat[k]
+    }
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+def _state_path(state_dir, release):
+    return os.path.join(state_dir, f"{release}.release.json")
+
+
+def _diff_path(state_dir, release):
+    return os.path.join(state_dir, f"{release}.diff.json")
+
+
+def _pending_path(state_dir, release):
+    return os.path.join(state_dir, f"{release}.pending.json")
+
+
+def load_state(state_dir, release):
+    try:
+        with open(_state_path(state_dir, release), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_diff(state_dir, release):
+    """Last diff computed for a release, as shown to the user before applying."""
+    try:
+        with open(_diff_path(state_dir, release), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def check(state_dir, release, chart, version, files, force=False):
+    """Compare the effective values with the last successful release.
+
+    Writes the pending values (recorded after a successful upgrade) and the
+    diff, and returns True when an upgrade is needed.
+    """
+    values = load_values(files)
+    digest = values_hash(values, chart, version)
+    previous = load_state(state_dir, release)
+
+    diff = diff_values(previous['values'] if previous else {}, values)
+    needs_upgrade = (
+        force
+        or previous is None
+        # An empty version means "latest", which can change without the values changing
+        or not version
+        or previous.get('hash') != digest
+    )
+    report = {
+        'release': release,
+        'chart': chart,
+        'version': version,
+        'hash': digest,
+        'previous_hash': previous.get('hash') if previous else None,
+        'upgrade': needs_upgrade,
+        'first_release': previous is None,
+        'checked_at': time.time(),
+        'summary': {name: len(entries) for name, entries in diff.items()},
+        'diff': diff
+    }
+    atomic_write(_diff_path(state_dir, release), json.dumps(report, indent=2, default=str))
+    atomic_write(_pending_path(state_dir, release),
+                 json.dumps({'hash': digest, 'chart': chart, 'version': version, 'values': values}, default=str))
+
+    print(f"Effective values hash for {release}: {digest}")
+    if previous is None:
+        print(f"No previous successful release of {release} recorded")
+    else:
+        for name, entries in diff.items():
+            print(f"  {name}: {len(entries)} key(s)")
+            for index, (key, value) in enumerate(entries.items()):
+                if index >= MAX_DIFF_ENTRIES:
+                    print(f"    ... {len(entries) - MAX_DIFF_ENTRIES} more")
+                    break
+                print(f"    {key}: {json.dumps(value, default=str)}")
+    return needs_upgrade
+
+
+def record(state_dir, release):
+    """Promote the pending values to the last successful release."""
+    pending = _pending_path(state_dir, release)
+    with open(pending, 'r') as file:
+        state = json.load(file)
+    state['recorded_at'] = time.time()
+    atomic_write(_state_path(state_dir, release), json.dumps(state, default=str))
+    os.remove(pending)
+    print(f"Recorded values hash {state['hash']} for {release}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check_parser = subparsers.add_parser('check')
+    check_parser.add_argument('--state-dir', required=True)
+    check_parser.add_argument('--release', required=True)
+    check_parser.add_argument('--chart', required=True)
+    check_parser.add_argument('--version', default='')
+    check_parser.add_argument('-f', '--values', dest='files', action='append', required=True)
+    check_parser.add_argument('--force', action='store_true')
+
+    record_parser = subparsers.add_parser('record')
+    record_parser.add_argument('--state-dir', required=True)
+    record_parser.add_argument('--release', required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == 'check':
+        needed = check(args.state_dir, args.release, args.chart, args.version, args.files, args.force)
+        return 0 if needed else UNCHANGED_EXIT_CODE
+    record(args.state_dir, args.release)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Promtail pipeline stages from declarative per-namespace/per-app log filters.
+
+``LOG_FILTER_RULES`` in variables.sh is a JSON list of rules. Each rule
+selects streams by ``namespace`` and/or ``app`` (regexes, matched in full
+like any label matcher) and says what to do with their lines before they
+leave the node:
+
+    {"name": "dev-api", "namespace": "dev|staging", "app": "api",
+     "drop_levels": ["debug", "trace"], "drop_regex": "GET /healthz",
+     "sample": 0.25, "rate_limit": 200, "drop_labels": ["pod"]}
+
+- ``drop_levels``: drop lines logged at these levels (logfmt or JSON ``level``)
+- ``drop_regex``: drop lines matching this RE2 expression
+- ``sample``: keep this fraction of the remaining lines
+- ``rate_limit``: at most this many lines per second on each node, the rest dropped
+- ``drop_labels``: labels removed from the streams, to cap their cardinality
+
+``PROMTAIL_MAX_STREAMS`` and ``PROMTAIL_MAX_LINE_SIZE`` are global guards:
+Promtail stops creating streams past the first and truncates lines longer
+than the second.
+
+``monitoring_setup.sh`` compiles the rendered variables into a values
+overlay for the promtail release:
+
+    python3 log_filters.py overrides --variables variables.sh --output-dir DIR
+
+writes ``promtail-filters.yaml``; without rules or guards it is empty.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import yaml
+
+from config_store import atomic_write, parse_variables_file, round_trip
+
+FILTER_VARIABLES = ('LOG_FILTER_RULES', 'PROMTAIL_MAX_STREAMS', 'PROMTAIL_MAX_LINE_SIZE')
+LEVELS = ('trace', 'debug', 'info', 'warn', 'error')
+# How each level is spelt in log lines
+LEVEL_PATTERNS = {'trace': 'trace', 'debug': 'debug|dbg', 'info': 'info', 'warn': 'warn(?:ing)?',
+                  'error': 'error|err'}
+RULE_KEYS = {'name', 'namespace', 'app', 'drop_levels', 'drop_regex', 'sample', 'rate_limit', 'drop_labels'}
+# Rules select streams and dashboards group them by these, so they are never dropped
+PROTECTED_LABELS = {'namespace', 'app', 'job'}
+# Perl syntax that Python accepts but Promtail's RE2 rejects
+UNSUPPORTED_REGEX_RE = re.compile(r'\(\?<?[=!]|\\[1-9]')
+LABEL_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+LINE_SIZE_RE = re.compile(r'^[0-9]+(?:[KMG]i?B)?$')
+# Helm replaces lists, so the overlay repeats the stages of promtail-values.yaml
+BASE_STAGES = [{'cri': {}}]
+RATE_LIMIT_BURST_FACTOR = 2
+
+
+class RuleError(ValueError):
+    """A log filter rule that cannot be compiled."""
+
+
+def _regex(value, field, name):
+    if not isinstance(value, str) or not value:
+        raise RuleError(f"{name}: {field} must be a non-empty regex")
+    if '`' in value:
+        raise RuleError(f"{name}: {field} cannot contain a backtick")
+    if UNSUPPORTED_REGEX_RE.search(value):
+        raise RuleError(f"{name}: {field} uses lookarounds or backreferences, which RE2 does not support")
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise RuleError(f"{name}: invalid {field} regex: {e}") from None
+    return value
+
+
+def _label_names(value, name):
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(',') if v.strip()]
+    if not isinstance(value, list) or not all(isinstance(v, str) and LABEL_NAME_RE.match(v) for v in value):
+        raise RuleError(f"{name}: drop_labels must be a list of label names")
+    protected = PROTECTED_LABELS.intersection(value)
+    if protected:
+        raise RuleError(f"{name}: cannot drop the {', '.join(sorted(protected))} label")
+    return value
+
+
+def normalize_rule(rule, index):
+    """Validate a rule and fill in its defaults; raises RuleError."""
+    if not isinstance(rule, dict):
+        raise RuleError(f"Rule {index + 1} must be an object")
+    name = re.sub(r'[^a-zA-Z0-9_]+', '_', str(rule.get('name') or '')).strip('_') or f'rule{index + 1}'
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise RuleError(f"{name}: unknown keys {', '.join(sorted(unknown))}")
+
+    normalized = {'name': name}
+    for field in ('namespace', 'app'):
+        if rule.get(field):
+            normalized[field] = _regex(rule[field], field, name)
+
+    levels = rule.get('drop_levels') or []
+    if isinstance(levels, str):
+        levels = [v.strip() for v in levels.split(',') if v.strip()]
+    levels = [str(level).lower() for level in levels]
+    unknown_levels = [level for level in levels if level not in LEVELS]
+    if unknown_levels:
+        raise RuleError(f"{name}: unknown levels {', '.join(unknown_levels)}, expected {', '.join(LEVELS)}")
+    if levels:
+        normalized['drop_levels'] = levels
+
+    if rule.get('drop_regex'):
+        normalized['drop_regex'] = _regex(rule['drop_regex'], 'drop_regex', name)
+
+    if rule.get('sample') not in (None, ''):
+        try:
+            sample = float(rule['sample'])
+        except (TypeError, ValueError):
+            sample = 0
+        if not 0 < sample <= 1:
+            raise RuleError(f"{name}: sample must be a fraction above 0 and at most 1")
+        if sample < 1:
+            normalized['sample'] = sample
+
+    if rule.get('rate_limit') not in (None, ''):
+        try:
+            rate_limit = int(rule['rate_limit'])
+        except (TypeError, ValueError):
+            rate_limit = 0
+        if rate_limit < 1:
+            raise RuleError(f"{name}: rate_limit must be a positive number of lines per second")
+        normalized['rate_limit'] = rate_limit
+
+    if rule.get('drop_labels'):
+        normalized['drop_labels'] = _label_names(rule['drop_labels'], name)
+
+    if not set(normalized) - {'name', 'namespace', 'app'}:
+        raise RuleError(f"{name}: nothing to drop, sample or limit")
+    return normalized
+
+
+def parse_rules(text):
+    """Parse and validate the LOG_FILTER_RULES JSON; raises RuleError."""
+    if not text or not str(text).strip():
+        return []
+    try:
+        rules = json.loads(text)
+    except ValueError as e:
+        raise RuleError(f"LOG_FILTER_RULES is not valid JSON: {e}") from None
+    if not isinstance(rules, list):
+        raise RuleError("LOG_FILTER_RULES must be a list of rules")
+    normalized = [normalize_rule(rule, index) for index, rule in enumerate(rules)]
+    names = [rule['name'] for rule in normalized]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise RuleError(f"Duplicate rule names: {', '.join(duplicates)}")
+    return normalized
+
+
+def _selector(rule):
+    matchers = []
+    for field in ('namespace', 'app'):
+        if field in rule:
+            escaped = rule[field].replace('\\', '\\\\').replace('"', '\\"')
+            matchers.append(f'{field}=~"{escaped}"')
+    # The kubernetes-pods job sets namespace on every stream
+    return '{' + (', '.join(matchers) or 'namespace=~".+"') + '}'
+
+
+def level_regex(levels):
+    """Line filter for logfmt ``level=debug`` and JSON ``"level":"debug"`` style levels."""
+    spellings = '|'.join(LEVEL_PATTERNS[level] for level in levels)
+    return rf'(?i)\b(?:level|lvl|severity)"?\s*[=:]\s*"?(?:{spellings})\b'
+
+
+def rule_stages(rule):
+    """Promtail stages for one normalized rule; drops come first so sampling sees fewer lines."""
+    selector = _selector(rule)
+    stages = []
+    if 'drop_levels' in rule:
+        stages.append({'match': {
+            'selector': f"{selector} |~ `{level_regex(rule['drop_levels'])}`",
+            'action': 'drop',
+            'drop_counter_reason': f"{rule['name']}_level",
+        }})
+    if 'drop_regex' in rule:
+        stages.append({'match': {
+            'selector': f"{selector} |~ `{rule['drop_regex']}`",
+            'action': 'drop',
+            'drop_counter_reason': f"{rule['name']}_regex",
+        }})
+    nested = []
+    if 'sample' in rule:
+        nested.append({'sampling': {'rate': rule['sample']}})
+    if 'rate_limit' in rule:
+        nested.append({'limit': {
+            'rate': rule['rate_limit'],
+            'burst': rule['rate_limit'] * RATE_LIMIT_BURST_FACTOR,
+            'drop': True,
+        }})
+    if 'drop_labels' in rule:
+        nested.append({'labeldrop': rule['drop_labels']})
+    if nested:
+        stages.append({'match': {'selector': selector, 'pipeline_name': rule['name'], 'stages': nested}})
+    return stages
+
+
+def pipeline_stages(rules):
+    stages = list(BASE_STAGES)
+    for rule in rules:
+        stages.extend(rule_stages(rule))
+    return stages
+
+
+def limits_config(variables):
+    """Promtail limits_config lines for the stream and line size guards."""
+    lines = []
+    max_streams = str(variables.get('PROMTAIL_MAX_STREAMS') or '').strip()
+    if max_streams:
+        if not max_streams.isdigit() or int(max_streams) < 1:
+            raise RuleError("PROMTAIL_MAX_STREAMS must be a positive number")
+        lines.append(f"max_streams: {int(max_streams)}")
+    max_line_size = str(variables.get('PROMTAIL_MAX_LINE_SIZE') or '').strip()
+    if max_line_size:
+        if not LINE_SIZE_RE.match(max_line_size):
+            raise RuleError("PROMTAIL_MAX_LINE_SIZE must be a size such as 256KB")
+        lines += [f"max_line_size: {max_line_size}", "max_line_size_truncate: true"]
+    return lines
+
+
+def promtail_values(variables):
+    """promtail chart overrides for the filter rules and guards; raises RuleError."""
+    rules = parse_rules(variables.get('LOG_FILTER_RULES'))
+    limits = limits_config(variables)
+    snippets = {}
+    if rules:
+        snippets['pipelineStages'] = pipeline_stages(rules)
+    if limits:
+        snippets['extraLimitsConfig'] = '\n'.join(limits) + '\n'
+    return {'config': {'snippets': snippets}} if snippets else {}
+
+
+def deploy_values(variables):
+    """promtail_values of the variables as monitoring_setup.sh reads them back from the rendered profile.
+
+    Regexes are full of characters bash quoting cares about ($, \\, "), so
+    a value that would change on its way through variables.sh is an error
+    here rather than a rule that silently stops matching.
+    """
+    rendered = {key: round_trip(key, variables.get(key) or '') for key in FILTER_VARIABLES}
+    changed = [key for key in FILTER_VARIABLES if rendered[key] != str(variables.get(key) or '')]
+    if changed:
+        raise RuleError(f"{', '.join(changed)} would change when written to variables.sh")
+    return promtail_values(rendered)
+
+
+def write_overrides(variables_path, output_dir):
+    values = promtail_values(parse_variables_file(variables_path))
+    path = os.path.join(output_dir, 'promtail-filters.yaml')
+    atomic_write(path, yaml.safe_dump(values, sort_keys=False, default_flow_style=False) if values else '{}\n',
+                 mode=0o644)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    overrides_parser = subparsers.add_parser('overrides')
+    overrides_parser.add_argument('--variables', required=True)
+    overrides_parser.add_argument('--output-dir', required=True)
+
+    args = parser.parse_args(argv)
+    try:
+        path = write_overrides(args.variables, args.output_dir)
+    except RuleError as e:
+        print(f"Invalid log filters: {e}", file=sys.stderr)
+        return 1
+    print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,7 +18,10 @@ env
 
 # ********************
 
-source ./variables.sh
+source "${VARIABLES_FILE:-./variables.sh}"
+
+# Per-cluster state (rendered values, last released values hash) lives next to the variables file
+STATE_DIR="${STATE_DIR:-$(pwd)/.state}"
 
 
 PROMETHEUS_CHART="prometheus-community/kube-prometheus-stack"
@@ -710,6 +713,7 @@ EOF
   kubectl create secret generic thanos --from-file=object-store.yaml=$FILE --namespace $NAMESPACE
 
   # Deploy Thanos manifest files
+  configure_thanos_caches
 
   kubectl apply -n $NAMESPACE -f - <<EOF
 apiVersion: apps/v1
@@ -717,7 +721,7 @@ kind: Deployment
 metadata:
   name: thanos-query
 spec:
-  replicas: 1
+  replicas: ${THANOS_QUERY_REPLICAS:-1}
   selector:
     matchLabels:
       app: thanos-query
@@ -735,6 +739,11 @@ spec:
           - --grpc-address=0.0.0.0:10901
           - --http-address=0.0.0.0:10902
           - --store=thanos-store:10901
+          # The sidecars of the Prometheus replicas serve the blocks not uploaded yet
+          - --store=dnssrv+_grpc._tcp.prometheus-operated.$NAMESPACE.svc.cluster.local
+          - --query.replica-label=prometheus_replica
+          # Long ranges read the 5m and 1h blocks of the compactor instead of raw samples
+          - --query.auto-downsampling
         ports:
         - containerPort: 10901
           name: grpc
@@ -760,6 +769,12 @@ spec:
 
 EOF
 
+  local store_cache_args=""
+  if [ "$THANOS_STORE_CACHE" = "yes" ]; then
+    store_cache_args="
+          - --store.caching-bucket.config-file=/etc/thanos-cache/caching-bucket.yaml"
+  fi
+
   kubectl apply -n $NAMESPACE -f - <<EOF
 apiVersion: apps/v1
 kind: Deployment
@@ -783,8 +798,11 @@ spec:
           - store
           - --data-dir=/data
           - --objstore.config-file=/etc/thanos/object-store.yaml
-          - --index-cache-size=500MB
-          - --chunk-pool-size=2GB
+          - --index-cache-size=${THANOS_STORE_INDEX_CACHE_SIZE:-500MB}
+          - --chunk-pool-size=${THANOS_STORE_CHUNK_POOL_SIZE:-2GB}${store_cache_args}
+        resources:
+          requests:
+            memory: ${THANOS_STORE_MEMORY_REQUEST:-3Gi}
         ports:
         - containerPort: 10901
           name: grpc
@@ -794,10 +812,22 @@ spec:
           - name: thanos-config
             mountPath: /etc/thanos
             readOnly: true
+          - name: thanos-cache-config
+            mountPath: /etc/thanos-cache
+            readOnly: true
+          - name: data
+            mountPath: /data
       volumes:
         - name: thanos-config
           secret:
             secretName: thanos
+        - name: thanos-cache-config
+          configMap:
+            name: thanos-cache-config
+        # Index headers of every block in the bucket; evicting the pod is better than filling the node
+        - name: data
+          emptyDir:
+            sizeLimit: ${THANOS_STORE_DATA_SIZE:-10}Gi
 ---
 apiVersion: v1
 kind: Service
@@ -816,7 +846,14 @@ spec:
   type: ClusterIP
 EOF
 
-  # 5. Prepare Helm values for Prometheus with S3 storage
+  deploy_thanos_query_frontend
+  deploy_thanos_compactor
+
+  # 5. Prepare Helm values for Prometheus with S3 storage; sizing only keeps a day of blocks locally
+  local local_pv_size=10
+  if [ "$SIZING_MODE" = "auto" ]; then
+    local_pv_size=$PR_PV_SIZE_DY
+  fi
   PROMETHEUS_STORAGE_CLASS=$(cat <<EOF
 
 prometheus:
@@ -830,7 +867,7 @@ prometheus:
           accessModes: ["ReadWriteOnce"]
           resources:
             requests:
-              storage: 10Gi
+              storage: ${local_pv_size}Gi
 
     thanos:
       objectStorageConfig:
@@ -890,6 +927,188 @@ EOF
   echo "Prometheus with S3 storage using IRSA has been configured successfully!"
 }
 
+configure_thanos_caches() {
+  # In-memory caches: query-frontend results, and store-gateway chunks and block metadata
+  kubectl apply -n $NAMESPACE -f - <<EOF
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: thanos-cache-config
+data:
+  response-cache.yaml: |
+    type: IN-MEMORY
+    config:
+      max_size: ${THANOS_QUERY_FRONTEND_CACHE_SIZE:-512MB}
+      max_size_items: 0
+      validity: 0s
+  caching-bucket.yaml: |
+    type: IN-MEMORY
+    config:
+      max_size: ${THANOS_STORE_CHUNK_CACHE_SIZE:-1GB}
+      max_item_size: 16MB
+    chunk_subrange_size: 16000
+    max_chunks_get_range_requests: 3
+    chunk_object_attrs_ttl: 24h
+    chunk_subrange_ttl: 24h
+    blocks_iter_ttl: 5m
+    metafile_exists_ttl: 2h
+    metafile_doesnt_exist_ttl: 15m
+    metafile_content_ttl: 24h
+    metafile_max_size: 1MiB
+EOF
+}
+
+deploy_thanos_query_frontend() {
+  if [ "$THANOS_QUERY_FRONTEND" != "yes" ]; then
+    kubectl delete deployment,service thanos-query-frontend -n $NAMESPACE --ignore-not-found=true
+    return 0
+  fi
+
+  echo "Deploying the Thanos query frontend..."
+  # Splits range queries by day, aligns them to their step and caches the results
+  kubectl apply -n $NAMESPACE -f - <<EOF
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: thanos-query-frontend
+spec:
+  replicas: ${THANOS_QUERY_FRONTEND_REPLICAS:-1}
+  selector:
+    matchLabels:
+      app: thanos-query-frontend
+  template:
+    metadata:
+      labels:
+        app: thanos-query-frontend
+    spec:
+      containers:
+      - name: thanos-query-frontend
+        image: quay.io/thanos/thanos:v0.28.1
+        args:
+          - query-frontend
+          - --http-address=0.0.0.0:10902
+          - --query-frontend.downstream-url=http://thanos-query.$NAMESPACE.svc.cluster.local:10902
+          - --query-frontend.compress-responses
+          - --query-frontend.log-queries-longer-than=10s
+          - --query-range.split-interval=24h
+          - --query-range.align-range-with-step
+          - --query-range.request-downsampled
+          - --query-range.max-retries-per-request=3
+          - --query-range.response-cache-config-file=/etc/thanos-cache/response-cache.yaml
+          - --labels.split-interval=24h
+          - --labels.response-cache-config-file=/etc/thanos-cache/response-cache.yaml
+        resources:
+          requests:
+            memory: ${THANOS_QUERY_FRONTEND_MEMORY_REQUEST:-768Mi}
+        ports:
+        - containerPort: 10902
+          name: http
+        volumeMounts:
+          - name: thanos-cache-config
+            mountPath: /etc/thanos-cache
+            readOnly: true
+      volumes:
+        - name: thanos-cache-config
+          configMap:
+            name: thanos-cache-config
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: thanos-query-frontend
+spec:
+  selector:
+    app: thanos-query-frontend
+  ports:
+    - name: http
+      port: 10902
+      targetPort: 10902
+  type: ClusterIP
+EOF
+}
+
+deploy_thanos_compactor() {
+  if [ "$THANOS_COMPACTOR" != "yes" ]; then
+    # The data volume is kept, so re-enabling the compactor does not download the bucket again
+    kubectl delete deployment thanos-compact -n $NAMESPACE --ignore-not-found=true
+    return 0
+  fi
+
+  echo "Deploying the Thanos compactor..."
+  # Raw blocks only until the 5m and 1h downsamples replace them; never longer than those
+  local retention=${THANOS_RETENTION_DAYS:-90}
+  local raw_retention=${THANOS_RAW_RETENTION_DAYS:-14}
+  if [ "$raw_retention" -gt "$retention" ]; then
+    raw_retention=$retention
+  fi
+  # A single compactor per bucket: Recreate, so two never run during a rollout
+  kubectl apply -n $NAMESPACE -f - <<EOF
+apiVersion: v1
+kind: PersistentVolumeClaim
+metadata:
+  name: thanos-compact-data
+spec:
+  storageClassName: gp3-sc
+  accessModes: ["ReadWriteOnce"]
+  resources:
+    requests:
+      storage: ${THANOS_COMPACT_DATA_SIZE:-100}Gi
+---
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: thanos-compact
+spec:
+  replicas: 1
+  strategy:
+    type: Recreate
+  selector:
+    matchLabels:
+      app: thanos-compact
+  template:
+    metadata:
+      labels:
+        app: thanos-compact
+    spec:
+      serviceAccountName: $SERVICE_ACCOUNT_NAME
+      containers:
+      - name: thanos-compact
+        image: quay.io/thanos/thanos:v0.28.1
+        args:
+          - compact
+          - --wait
+          - --wait-interval=5m
+          - --data-dir=/data
+          - --objstore.config-file=/etc/thanos/object-store.yaml
+          - --http-address=0.0.0.0:10902
+          - --delete-delay=48h
+          # One group per Prometheus replica; each replica uploads its own copy of the blocks
+          - --compact.concurrency=${PROMETHEUS_REPLICAS:-1}
+          - --retention.resolution-raw=${raw_retention}d
+          - --retention.resolution-5m=${retention}d
+          - --retention.resolution-1h=${retention}d
+        resources:
+          requests:
+            memory: ${THANOS_COMPACT_MEMORY_REQUEST:-1Gi}
+        ports:
+        - containerPort: 10902
+          name: http
+        volumeMounts:
+          - name: thanos-config
+            mountPath: /etc/thanos
+            readOnly: true
+          - name: data
+            mountPath: /data
+      volumes:
+        - name: thanos-config
+          secret:
+            secretName: thanos
+        - name: data
+          persistentVolumeClaim:
+            claimName: thanos-compact-data
+EOF
+}
+
 configure_prometheus_storage() {
 
   case $PROMETHEUS_STORAGE_CHOICE in
@@ -1421,14 +1640,112 @@ check_and_add_helm_repo() {
   helm repo update
 }
 
+configure_sizing() {
+  # Retention, memory and replica overrides from the sizing variables, computed or as entered
+  mkdir -p "$STATE_DIR"
+  local static_pv_flag=""
+  if [ "$PROMETHEUS_STORAGE_CHOICE" = "1" ] && [ -n "$PR_PV_SIZE_ST" ]; then
+    static_pv_flag="--static-pv-size $PR_PV_SIZE_ST"
+  fi
+  python3 sizing.py overrides --variables "${VARIABLES_FILE:-./variables.sh}" --output-dir "$STATE_DIR" $static_pv_flag
+}
+
+# helm_release <release> <chart> <version> <values files...>
+helm_release() {
+  local release=$1 chart=$2 version=$3
+  shift 3
+  local value_flags=()
+  for file in "$@"; do
+    value_flags+=(-f "$file")
+  done
+
+  # Skip the chart render and rollout when the merged values match the last successful release
+  local force_flag=""
+  if ! helm status "$release" -n "$NAMESPACE" 2>/dev/null | grep -q "STATUS: deployed"; then
+    force_flag="--force"
+  fi
+  local check_status=0
+  python3 helm_values.py check --state-dir "$STATE_DIR" --release "$release" \
+    --chart "$chart" --version "$version" \
+    "${value_flags[@]}" $force_flag || check_status=$?
+
+  if [ "$check_status" -eq 3 ]; then
+    echo "✅ $release values unchanged since the last successful release, skipping helm upgrade."
+    return 0
+  elif [ "$check_status" -ne 0 ]; then
+    echo "⚠️ Could not compare $release values, upgrading anyway."
+  fi
+
+  helm upgrade --install "$release" "$chart" -n $NAMESPACE --version "$version" "${value_flags[@]}"
+  python3 helm_values.py record --state-dir "$STATE_DIR" --release "$release" || true
+}
+
 deploy_prometheus() {
   echo "Deploying prometheus..."
-  helm upgrade --install prometheus-stack $PROMETHEUS_CHART -n $NAMESPACE -f values.yaml --version $PROMETHEUS_VERSION --values - <<EOF
+  mkdir -p "$STATE_DIR"
+  local overrides="$STATE_DIR/prometheus-overrides.yaml"
+  cat > "$overrides" <<EOF
 $NODE_PLACEMENT_CONFIG
 $STORAGE_CLASS
 $PROMETHEUS_STORAGE_CLASS
 $PROMETHEUS_EC2_CONFIG
 EOF
+
+  # With S3 storage Grafana reads long ranges through Thanos, via the query frontend when deployed
+  local thanos_datasource="$STATE_DIR/prometheus-thanos.yaml"
+  if [ "$PROMETHEUS_STORAGE_CHOICE" = "3" ]; then
+    local thanos_url="http://thanos-query.$NAMESPACE.svc.cluster.local:10902"
+    if [ "$THANOS_QUERY_FRONTEND" = "yes" ]; then
+      thanos_url="http://thanos-query-frontend.$NAMESPACE.svc.cluster.local:10902"
+    fi
+    cat > "$thanos_datasource" <<EOF
+grafana:
+  additionalDataSources:
+    - name: Thanos
+      type: prometheus
+      access: proxy
+      url: $thanos_url
+EOF
+  else
+    echo "{}" > "$thanos_datasource"
+  fi
+
+  helm_release prometheus-stack "$PROMETHEUS_CHART" "$PROMETHEUS_VERSION" \
+    values.yaml "$overrides" "$STATE_DIR/prometheus-sizing.yaml" "$thanos_datasource"
+}
+
+deploy_loki() {
+  local profile=${LOKI_PROFILE:-small}
+  case $profile in
+    small)
+      ;;
+    medium|large)
+      # Their queriers could not read the chunks flushed to the ingester's filesystem volume
+      echo "The $profile Loki profile needs an object store; loki-values.yaml keeps chunks on the ingester's volume. Exiting."
+      exit 1
+      ;;
+    *)
+      echo "Invalid Loki profile '$profile', expected small, medium or large. Exiting."
+      exit 1
+      ;;
+  esac
+
+  echo "Deploying loki with the $profile query profile..."
+  # Sizing comes last: its ingester replicas, memory and volumes win over the profile
+  helm_release loki "$LOKI_CHART" "$LOKI_VERSION" \
+    loki-values.yaml "loki-profiles/$profile.yaml" "$STATE_DIR/loki-sizing.yaml"
+}
+
+deploy_promtail() {
+  # Drop, sample and rate-limit rules compiled into pipeline stages, so noisy lines never leave the node
+  mkdir -p "$STATE_DIR"
+  if ! python3 log_filters.py overrides --variables "${VARIABLES_FILE:-./variables.sh}" --output-dir "$STATE_DIR"; then
+    echo "Log filter rules could not be compiled. Exiting."
+    exit 1
+  fi
+
+  echo "Deploying promtail..."
+  helm_release promtail "$PROMTAIL_CHART" "$PROMTAIL_VERSION" promtail-values.yaml "$STATE_DIR/promtail-filters.yaml"
 }
 
 patch_service() {
@@ -1466,11 +1783,19 @@ main (){
   configure_node_placement
   configure_grafana_storage
   configure_prometheus_storage
+  configure_sizing
   check_and_add_helm_repo
   if [[ "$ENABLE_EC2_MONITORING" == "1" ]]; then
     monitor_ec2
   fi
   deploy_prometheus
+  # Loki and Promtail are deployed when their chart versions are set
+  if [ -n "$LOKI_VERSION" ]; then
+    deploy_loki
+    if [ -n "$PROMTAIL_VERSION" ]; then
+      deploy_promtail
+    fi
+  fi
   patch_service
   echo "** Setup completed! **"
 }
@@ -0,0 +1,81 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Keys not used by any deploy for this long are removed
+PEM_TTL_SECONDS = 24 * 60 * 60
+CLEANUP_INTERVAL_SECONDS = 10 * 60
+
+
+class PemStore:
+    """Content-addressed storage for uploaded PEM keys.
+
+    Uploads are streamed to a temp file while being hashed and then renamed
+    to ``<sha256>.pem``, so a key shared by many instances is written once
+    and every instance references the same path.
+    """
+
+    def __init__(self, folder, ttl=PEM_TTL_SECONDS):
+        self.folder = folder
+        self.ttl = ttl
+        self._last_cleanup = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def save(self, file):
+        """Store an uploaded file and return the path of its deduplicated copy."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+            os.chmod(tmp_path, 0o600)
+
+            path = os.path.join(self.folder, f"{digest.hexdigest()}.pem")
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                # Refresh the TTL of a key that is still in use
+                os.utime(path)
+            else:
+                os.replace(tmp_path, path)
+            return path
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def cleanup(self, force=False):
+        """Remove keys and stale partial uploads older than the TTL.
+
+        Runs at most once per CLEANUP_INTERVAL_SECONDS unless forced.
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return 0
+            self._last_cleanup = now
+
+        removed = 0
+        for entry in os.scandir(self.folder):
+            if not entry.is_file():
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} expired PEM file(s) from {self.folder}")
+        return removed
@@ -0,0 +1,412 @@
+"""Storage, retention and resource sizing for the EKS monitoring stack.
+
+``estimate`` turns the expected load (scrape targets, series per target,
+scrape interval, log volume) and the wanted retention into active series,
+samples per second, Loki ingestion and Thanos block sizes. The expected
+dashboard query rate sets the Thanos query and query-frontend replicas.
+``deploy_variables`` turns an estimate into the variables.sh keys that
+``monitoring_setup.sh`` reads: PVC sizes, retention, memory requests and
+replica counts.
+
+The constants are the usual rules of thumb from the Prometheus, Loki and
+Thanos capacity planning guides, rounded towards more disk.
+
+``monitoring_setup.sh`` turns the rendered variables into Helm overrides:
+
+    python3 sizing.py overrides --variables variables.sh --output-dir DIR \\
+        [--static-pv-size GIB]
+
+writes ``prometheus-sizing.yaml`` and ``loki-sizing.yaml``; empty variables
+leave the chart defaults alone.
+"""
+import argparse
+import math
+import os
+import sys
+
+import yaml
+
+from config_store import atomic_write, parse_variables_file
+
+MIB = 1024 ** 2
+GIB = 1024 ** 3
+DAY_SECONDS = 86400
+
+# Compressed TSDB block bytes per sample; Prometheus reports 1-2 bytes per sample
+BYTES_PER_SAMPLE = 2
+# The WAL holds about three hours of samples, stored far less compactly than blocks
+WAL_HOURS = 3
+WAL_BYTES_PER_SAMPLE = 8
+# Head memory per active series: labels, head chunks, postings and room for queries
+MEMORY_BYTES_PER_SERIES = 8 * 1024
+PROMETHEUS_BASE_MEMORY = 512 * MIB
+MEMORY_LIMIT_FACTOR = 1.5
+# Pods replaced within the retention leave their series behind in the blocks
+SERIES_CHURN_FACTOR = 1.3
+# Compaction writes the new block before it deletes the blocks it replaces
+DISK_HEADROOM = 1.3
+# retentionSize as a share of the PVC, so Prometheus deletes blocks before the disk fills
+RETENTION_SIZE_SHARE = 0.8
+# Active series one Prometheus shard handles comfortably
+MAX_SERIES_PER_SHARD = 2000000
+MIN_PV_GIB = 10
+GRAFANA_PV_GIB = 10
+STORAGE_CLASS = 'gp3-sc'
+
+# With Thanos, Prometheus keeps a day locally and older blocks are read from S3
+THANOS_LOCAL_RETENTION_DAYS = 1
+THANOS_BLOCK_HOURS = 2
+THANOS_MAX_BLOCK_DAYS = 14
+# Raw blocks are kept this long, the 5m and 1h downsamples for the whole Thanos retention
+THANOS_RAW_RETENTION_DAYS = 14
+# Downsampled resolutions keep five aggregates (count, sum, min, max, counter) per point
+DOWNSAMPLE_AGGREGATES = 5
+# store-gateway index headers on disk, as a share of the bucket
+INDEX_HEADER_SHARE = 0.01
+# The index cache holds a share of the index headers, the chunk pool a share of the largest block
+INDEX_CACHE_SHARE = 0.25
+CHUNK_POOL_SHARE = 0.02
+THANOS_STORE_BASE_MEMORY = 512 * MIB
+# The store-gateway chunk cache holds a share of the largest compacted block
+CHUNK_CACHE_SHARE = 0.05
+# The query frontend splits range queries by day; dashboards mostly span a few days
+SUBQUERIES_PER_QUERY = 3
+# Share of the subqueries answered from the results cache, as dashboards refresh the same ranges
+RESULTS_CACHE_HIT_RATIO = 0.5
+# Subqueries over S3 blocks one querier answers per second, and range queries one frontend schedules
+QUERIER_QPS_PER_REPLICA = 10
+QUERY_FRONTEND_QPS_PER_REPLICA = 50
+QUERY_FRONTEND_CACHE_BYTES = 512 * MIB
+QUERY_FRONTEND_BASE_MEMORY = 256 * MIB
+# The compactor holds the symbols and postings of the blocks it merges
+COMPACT_MEMORY_BYTES_PER_SERIES = 1024
+THANOS_COMPACT_BASE_MEMORY = 512 * MIB
+
+# Snappy chunks, the chunk_encoding of loki-values.yaml
+LOKI_COMPRESSION_RATIO = 5
+# Ingestion one ingester absorbs comfortably
+LOKI_INGESTER_BYTES_PER_SECOND = 4 * MIB
+# loki-values.yaml keeps chunks and indexes on the ingester's own volume (filesystem
+# object store), so a second ingester would split them across volumes nothing else reads
+LOKI_INGESTER_REPLICAS = 1
+# Run the compactor inside the ingester, the only process that sees those chunks
+LOKI_INGESTER_TARGET = '-target=ingester,compactor'
+# Compressed chunks stay in ingester memory until chunk_idle_period (30m in loki-values.yaml) or they fill
+LOKI_CHUNK_SECONDS_IN_MEMORY = 30 * 60
+LOKI_BASE_MEMORY = 512 * MIB
+# Query profiles of loki-profiles/ by daily ingestion, the first whose limit is not exceeded
+LOKI_PROFILE_MAX_GIB_PER_DAY = (('small', 10), ('medium', 100), ('large', None))
+# Profiles whose extra queriers need a shared object store to read flushed chunks; with
+# loki-values.yaml's filesystem storage those chunks only exist on the ingester's volume
+LOKI_OBJECT_STORE_PROFILES = ('medium', 'large')
+
+DEFAULT_INPUTS = {
+    'targets': 20,
+    'series_per_target': 1000,
+    'scrape_interval': 30,
+    'log_lines_per_second': 20,
+    'log_line_bytes': 250,
+    'prometheus_retention_days': 10,
+    'loki_retention_days': 7,
+    'thanos_retention_days': 90,
+    'queries_per_second': 2,
+    'thanos': False,
+    'thanos_store_cache': False,
+    'high_availability': False,
+}
+
+# variables.sh keys the inputs are read from
+INPUT_VARIABLES = {
+    'targets': 'SIZING_TARGETS',
+    'series_per_target': 'SIZING_SERIES_PER_TARGET',
+    'scrape_interval': 'SIZING_SCRAPE_INTERVAL',
+    'log_lines_per_second': 'SIZING_LOG_LINES_PER_SECOND',
+    'log_line_bytes': 'SIZING_LOG_LINE_BYTES',
+    'prometheus_retention_days': 'PROMETHEUS_RETENTION_DAYS',
+    'loki_retention_days': 'LOKI_RETENTION_DAYS',
+    'thanos_retention_days': 'THANOS_RETENTION_DAYS',
+    'queries_per_second': 'SIZING_QUERIES_PER_SECOND',
+}
+
+
+def _number(value, default, minimum=0):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    # inf would overflow the int() and ceil() of the estimates
+    if not math.isfinite(number) or number < minimum:
+        return default
+    return int(number) if number.is_integer() else number
+
+
+def inputs_from_variables(variables):
+    """Sizing inputs from deploy variables; missing or invalid values fall back to the defaults."""
+    inputs = dict(DEFAULT_INPUTS)
+    for name, key in INPUT_VARIABLES.items():
+        minimum = 1 if name in ('targets', 'scrape_interval', 'log_line_bytes') else 0
+        inputs[name] = _number(variables.get(key), DEFAULT_INPUTS[name], minimum)
+    inputs['thanos'] = str(variables.get('PROMETHEUS_STORAGE_CHOICE', '')) == '3'
+    inputs['thanos_store_cache'] = str(variables.get('THANOS_STORE_CACHE', '')).lower() == 'yes'
+    inputs['high_availability'] = str(variables.get('SIZING_HIGH_AVAILABILITY', '')).lower() in ('yes', 'true', '1')
+    return inputs
+
+
+def _gib(size_bytes, minimum=MIN_PV_GIB):
+    return max(minimum, int(math.ceil(size_bytes / GIB)))
+
+
+def _memory(size_bytes):
+    """Kubernetes memory quantity rounded up to 256Mi."""
+    return f"{int(math.ceil(size_bytes / (256 * MIB))) * 256}Mi"
+
+
+def prometheus_estimate(inputs):
+    active_series = int(inputs['targets'] * inputs['series_per_target'])
+    samples_per_second = active_series / inputs['scrape_interval']
+    retention_days = THANOS_LOCAL_RETENTION_DAYS if inputs['thanos'] else inputs['prometheus_retention_days']
+    retention_seconds = retention_days * DAY_SECONDS
+
+    block_bytes = samples_per_second * retention_seconds * BYTES_PER_SAMPLE * SERIES_CHURN_FACTOR
+    wal_bytes = samples_per_second * WAL_HOURS * 3600 * WAL_BYTES_PER_SAMPLE
+    pvc_gib = _gib((block_bytes + wal_bytes) * DISK_HEADROOM)
+    shards = max(1, int(math.ceil(active_series / MAX_SERIES_PER_SHARD)))
+    if not inputs['thanos']:
+        # Without Thanos query in front, Grafana's prometheus-operated Service would
+        # load-balance across the shards and every query would see only part of the data
+        shards = 1
+    memory = PROMETHEUS_BASE_MEMORY + active_series / shards * MEMORY_BYTES_PER_SERIES
+
+    return {
+        'active_series': active_series,
+        'samples_per_second': round(samples_per_second, 1),
+        'bytes_per_sample': BYTES_PER_SAMPLE,
+        'retention_days': retention_days,
+        'block_bytes': int(block_bytes),
+        'wal_bytes': int(wal_bytes),
+        'pvc_gib': pvc_gib,
+        # Blocks and WAL both count towards retentionSize
+        'retention_size_gb': max(1, int(pvc_gib * RETENTION_SIZE_SHARE)),
+        'memory_request_bytes': int(memory),
+        'memory_limit_bytes': int(memory * MEMORY_LIMIT_FACTOR),
+        'shards': shards,
+        # Thanos query deduplicates the replicas of an HA pair
+        'replicas': 2 if inputs['high_availability'] or inputs['thanos'] else 1,
+    }
+
+
+def loki_estimate(inputs):
+    ingest_bytes_per_second = inputs['targets'] * inputs['log_lines_per_second'] * inputs['log_line_bytes']
+    stored_bytes_per_day = ingest_bytes_per_second * DAY_SECONDS / LOKI_COMPRESSION_RATIO
+    retention_days = max(1, int(math.ceil(inputs['loki_retention_days'])))
+    replicas = LOKI_INGESTER_REPLICAS
+    # The one ingester's volume holds every chunk of the retention
+    pvc_gib = _gib(stored_bytes_per_day * retention_days * DISK_HEADROOM / replicas)
+    memory = LOKI_BASE_MEMORY + (ingest_bytes_per_second / replicas * LOKI_CHUNK_SECONDS_IN_MEMORY
+                                 / LOKI_COMPRESSION_RATIO)
+    ingest_gib_per_day = ingest_bytes_per_second * DAY_SECONDS / GIB
+    profile = next(name for name, limit in LOKI_PROFILE_MAX_GIB_PER_DAY
+                   if limit is None or ingest_gib_per_day <= limit)
+
+    return {
+        'ingest_bytes_per_second': int(ingest_bytes_per_second),
+        'ingest_gib_per_day': round(ingest_gib_per_day, 2),
+        'stored_gib_per_day': round(stored_bytes_per_day / GIB, 2),
+        'retention_days': retention_days,
+        'pvc_gib': pvc_gib,
+        'ingester_replicas': replicas,
+        'ingester_memory_request_bytes': int(memory),
+        # Beyond this Loki needs an object store, so ingesters can be added
+        'exceeds_single_ingester': ingest_bytes_per_second > LOKI_INGESTER_BYTES_PER_SECOND,
+        'suggested_profile': profile,
+        'profile_needs_object_store': profile in LOKI_OBJECT_STORE_PROFILES,
+    }
+
+
+def thanos_estimate(inputs, prometheus):
+    samples_per_second = prometheus['samples_per_second']
+    active_series = prometheus['active_series'] * SERIES_CHURN_FACTOR
+    retention_seconds = inputs['thanos_retention_days'] * DAY_SECONDS
+    raw_retention_days = min(THANOS_RAW_RETENTION_DAYS, inputs['thanos_retention_days'])
+    # Every Prometheus replica's sidecar uploads its own copy of the blocks; the compactor
+    # does not deduplicate them, so the bucket, index headers and compaction scale with it
+    copies = prometheus['replicas']
+
+    block_bytes = samples_per_second * THANOS_BLOCK_HOURS * 3600 * BYTES_PER_SAMPLE
+    max_block_days = min(THANOS_MAX_BLOCK_DAYS, inputs['thanos_retention_days']) or 1
+    compacted_block_bytes = samples_per_second * max_block_days * DAY_SECONDS * BYTES_PER_SAMPLE
+    raw_bytes = samples_per_second * raw_retention_days * DAY_SECONDS * BYTES_PER_SAMPLE
+    downsampled_bytes = sum(active_series * retention_seconds / resolution * DOWNSAMPLE_AGGREGATES * BYTES_PER_SAMPLE
+                            for resolution in (300, 3600))
+    bucket_bytes = (raw_bytes + downsampled_bytes) * copies
+    index_header_bytes = bucket_bytes * INDEX_HEADER_SHARE
+    index_cache_bytes = min(max(256 * MIB, index_header_bytes * INDEX_CACHE_SHARE), 4 * GIB)
+    chunk_pool_bytes = min(max(GIB, compacted_block_bytes * CHUNK_POOL_SHARE), 8 * GIB)
+    chunk_cache_bytes = min(max(512 * MIB, compacted_block_bytes * CHUNK_CACHE_SHARE), 4 * GIB)
+    store_memory = THANOS_STORE_BASE_MEMORY + index_cache_bytes + chunk_pool_bytes
+    if inputs['thanos_store_cache']:
+        store_memory += chunk_cache_bytes
+
+    min_replicas = 2 if inputs['high_availability'] else 1
+    subqueries_per_second = inputs['queries_per_second'] * SUBQUERIES_PER_QUERY * (1 - RESULTS_CACHE_HIT_RATIO)
+    query_replicas = max(min_replicas, int(math.ceil(subqueries_per_second / QUERIER_QPS_PER_REPLICA)))
+    frontend_replicas = max(min_replicas,
+                            int(math.ceil(inputs['queries_per_second'] / QUERY_FRONTEND_QPS_PER_REPLICA)))
+
+    return {
+        'block_bytes': int(block_bytes),
+        'compacted_block_bytes': int(compacted_block_bytes),
+        'bucket_gib': round(bucket_bytes / GIB, 1),
+        'store_data_gib': _gib(index_header_bytes * DISK_HEADROOM, minimum=1),
+        'store_index_cache_mb': int(math.ceil(index_cache_bytes / MIB)),
+        'store_chunk_pool_mb': int(math.ceil(chunk_pool_bytes / MIB)),
+        'store_chunk_cache_mb': int(math.ceil(chunk_cache_bytes / MIB)),
+        'store_memory_request_bytes': int(store_memory),
+        'subqueries_per_second': round(subqueries_per_second, 1),
+        'query_replicas': query_replicas,
+        'query_frontend_replicas': frontend_replicas,
+        'query_frontend_cache_mb': QUERY_FRONTEND_CACHE_BYTES // MIB,
+        'query_frontend_memory_request_bytes': QUERY_FRONTEND_BASE_MEMORY + QUERY_FRONTEND_CACHE_BYTES,
+        # The compactor downloads the blocks of a group and writes the merged block next to them;
+        # each replica's blocks form a group, compacted concurrently
+        'compact_data_gib': _gib(compacted_block_bytes * 2 * DISK_HEADROOM * copies),
+        'compact_memory_request_bytes': int(THANOS_COMPACT_BASE_MEMORY
+                                            + active_series * COMPACT_MEMORY_BYTES_PER_SERIES * copies),
+        'copies': copies,
+        'raw_retention_days': raw_retention_days,
+        'retention_days': inputs['thanos_retention_days'],
+    }
+
+
+def estimate(inputs):
+    """Capacity estimate for the whole stack from ``inputs`` (see DEFAULT_INPUTS)."""
+    inputs = {**DEFAULT_INPUTS, **inputs}
+    prometheus = prometheus_estimate(inputs)
+    return {
+        'inputs': inputs,
+        'prometheus': prometheus,
+        'loki': loki_estimate(inputs),
+        'thanos': thanos_estimate(inputs, prometheus) if inputs['thanos'] else None,
+    }
+
+
+def deploy_variables(sizing):
+    """The variables.sh values matching an estimate."""
+    prometheus, loki, thanos = sizing['prometheus'], sizing['loki'], sizing['thanos']
+    variables = {
+        'PR_PV_SIZE_DY': str(prometheus['pvc_gib']),
+        'PV_SIZE_DY': str(GRAFANA_PV_GIB),
+        'PROMETHEUS_RETENTION': f"{prometheus['retention_days']}d",
+        'PROMETHEUS_RETENTION_SIZE': f"{prometheus['retention_size_gb']}GB",
+        'PROMETHEUS_MEMORY_REQUEST': _memory(prometheus['memory_request_bytes']),
+        'PROMETHEUS_MEMORY_LIMIT': _memory(prometheus['memory_limit_bytes']),
+        'PROMETHEUS_REPLICAS': str(prometheus['replicas']),
+        'PROMETHEUS_SHARDS': str(prometheus['shards']),
+        'LOKI_RETENTION_PERIOD': f"{loki['retention_days'] * 24}h",
+        'LOKI_PV_SIZE': str(loki['pvc_gib']),
+        'LOKI_INGESTER_REPLICAS': str(loki['ingester_replicas']),
+        'LOKI_INGESTER_MEMORY_REQUEST': _memory(loki['ingester_memory_request_bytes']),
+    }
+    if thanos:
+        variables.update({
+            'THANOS_STORE_DATA_SIZE': str(thanos['store_data_gib']),
+            'THANOS_STORE_INDEX_CACHE_SIZE': f"{thanos['store_index_cache_mb']}MB",
+            'THANOS_STORE_CHUNK_POOL_SIZE': f"{thanos['store_chunk_pool_mb']}MB",
+            'THANOS_STORE_MEMORY_REQUEST': _memory(thanos['store_memory_request_bytes']),
+            'THANOS_STORE_CHUNK_CACHE_SIZE': f"{thanos['store_chunk_cache_mb']}MB",
+            'THANOS_QUERY_REPLICAS': str(thanos['query_replicas']),
+            'THANOS_QUERY_FRONTEND_REPLICAS': str(thanos['query_frontend_replicas']),
+            'THANOS_QUERY_FRONTEND_CACHE_SIZE': f"{thanos['query_frontend_cache_mb']}MB",
+            'THANOS_QUERY_FRONTEND_MEMORY_REQUEST': _memory(thanos['query_frontend_memory_request_bytes']),
+            'THANOS_COMPACT_DATA_SIZE': str(thanos['compact_data_gib']),
+            'THANOS_COMPACT_MEMORY_REQUEST': _memory(thanos['compact_memory_request_bytes']),
+            'THANOS_RAW_RETENTION_DAYS': str(thanos['raw_retention_days']),
+        })
+    return variables
+
+
+def prometheus_values(variables, static_pv_gib=None):
+    """kube-prometheus-stack overrides for the retention, memory and replica variables."""
+    retention_size = variables.get('PROMETHEUS_RETENTION_SIZE')
+    if static_pv_gib:
+        # A static volume keeps its size, whatever the estimate asked for
+        retention_size = f"{max(1, int(static_pv_gib * RETENTION_SIZE_SHARE))}GB"
+    spec = {}
+    if variables.get('PROMETHEUS_RETENTION'):
+        spec['retention'] = variables['PROMETHEUS_RETENTION']
+    if retention_size:
+        spec['retentionSize'] = retention_size
+    for key, name in (('replicas', 'PROMETHEUS_REPLICAS'), ('shards', 'PROMETHEUS_SHARDS')):
+        if variables.get(name):
+            spec[key] = int(variables[name])
+    if spec.get('shards', 1) > 1 and str(variables.get('PROMETHEUS_STORAGE_CHOICE', '')) != '3':
+        # Only S3 storage puts Thanos query, which merges the shards, in front of Grafana
+        spec['shards'] = 1
+    resources = {}
+    if variables.get('PROMETHEUS_MEMORY_REQUEST'):
+        resources['requests'] = {'memory': variables['PROMETHEUS_MEMORY_REQUEST']}
+    if variables.get('PROMETHEUS_MEMORY_LIMIT'):
+        resources['limits'] = {'memory': variables['PROMETHEUS_MEMORY_LIMIT']}
+    if resources:
+        spec['resources'] = resources
+    return {'prometheus': {'prometheusSpec': spec}} if spec else {}
+
+
+def loki_values(variables):
+    """loki-distributed overrides for the retention, volume, memory and replica variables."""
+    values = {}
+    ingester = {}
+    retention = variables.get('LOKI_RETENTION_PERIOD')
+    if retention:
+        # A compactor pod of its own would only see its own empty volume; inside the
+        # ingester it deletes the expired chunks and index entries where they live
+        values['loki'] = {'structuredConfig': {
+            'limits_config': {'retention_period': retention},
+            'compactor': {'retention_enabled': True},
+        }}
+        values['compactor'] = {'enabled': False}
+        ingester['extraArgs'] = [LOKI_INGESTER_TARGET]
+    if variables.get('LOKI_INGESTER_REPLICAS'):
+        # More ingesters need an object store first, whatever was entered
+        ingester['replicas'] = min(int(variables['LOKI_INGESTER_REPLICAS']), LOKI_INGESTER_REPLICAS)
+    if variables.get('LOKI_INGESTER_MEMORY_REQUEST'):
+        ingester['resources'] = {'requests': {'memory': variables['LOKI_INGESTER_MEMORY_REQUEST']}}
+    if variables.get('LOKI_PV_SIZE'):
+        ingester['persistence'] = {
+            'enabled': True,
+            'claims': [{'name': 'data', 'size': f"{variables['LOKI_PV_SIZE']}Gi", 'storageClass': STORAGE_CLASS}],
+        }
+    if ingester:
+        values['ingester'] = ingester
+    return values
+
+
+def write_overrides(variables_path, output_dir, static_pv_gib=None):
+    variables = parse_variables_file(variables_path)
+    written = []
+    for name, values in (('prometheus-sizing.yaml', prometheus_values(variables, static_pv_gib)),
+                         ('loki-sizing.yaml', loki_values(variables))):
+        path = os.path.join(output_dir, name)
+        atomic_write(path, yaml.safe_dump(values, sort_keys=False, default_flow_style=False) if values else '{}\n',
+                     mode=0o644)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    overrides_parser = subparsers.add_parser('overrides')
+    overrides_parser.add_argument('--variables', required=True)
+    overrides_parser.add_argument('--output-dir', required=True)
+    overrides_parser.add_argument('--static-pv-size', type=int, default=None)
+
+    args = parser.parse_args(argv)
+    for path in write_overrides(args.variables, args.output_dir, args.static_pv_size):
+        print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,15 @@ PROMETHEUS_VERSION=""
 LOKI_VERSION=""
 PROMTAIL_VERSION=""
 
+# Loki query-path profile: small (see loki-profiles/); medium and large need an object store
+LOKI_PROFILE="small"
+
+# Promtail log filters: a JSON list of per-namespace/per-app rules (see log_filters.py),
+# e.g. [{"namespace": "dev", "drop_levels": ["debug"], "sample": 0.5}]
+LOG_FILTER_RULES=""
+PROMTAIL_MAX_STREAMS=""     # streams per Promtail pod, empty for no limit
+PROMTAIL_MAX_LINE_SIZE=""   # e.g. 256KB; longer lines are truncated
+
 # *************************************************************
 
 # Choose a node placement strategy:
@@ -82,11 +91,60 @@ PR_PV_SIZE_DY=""
 S3_BUCKET_NAME=""
 AWS_ACCESS_KEY=""
 AWS_SECRET_KEY=""
+# Thanos query path (yes/no): a query frontend with results caching, a chunk
+# and metadata cache in the store gateway, and a compactor that downsamples and
+# applies THANOS_RETENTION_DAYS to the bucket (raw blocks: THANOS_RAW_RETENTION_DAYS)
+THANOS_QUERY_FRONTEND="no"
+THANOS_STORE_CACHE="no"
+THANOS_COMPACTOR="no"
 
 # if 4. No Storage Required
 
 # *************************************************************
 
+# Storage and retention sizing
+# "auto" in SIZING_MODE computes the PV sizes, retention, memory requests and
+# replica counts below from the expected load when deploying; "manual" uses
+# them as entered. Empty values keep the chart defaults.
+SIZING_MODE="manual"
+SIZING_TARGETS="20"                # scrape targets: nodes, pods, services and EC2 instances
+SIZING_SERIES_PER_TARGET="1000"
+SIZING_SCRAPE_INTERVAL="30"        # seconds
+SIZING_LOG_LINES_PER_SECOND="20"   # per target
+SIZING_LOG_LINE_BYTES="250"
+SIZING_HIGH_AVAILABILITY="no"      # yes: two Prometheus replicas
+SIZING_QUERIES_PER_SECOND="2"      # dashboard range queries per second, for the Thanos query path
+PROMETHEUS_RETENTION_DAYS="10"
+LOKI_RETENTION_DAYS="7"
+THANOS_RETENTION_DAYS="90"         # if 3. S3 Bucket Storage
+
+PROMETHEUS_RETENTION=""
+PROMETHEUS_RETENTION_SIZE=""
+PROMETHEUS_MEMORY_REQUEST=""
+PROMETHEUS_MEMORY_LIMIT=""
+PROMETHEUS_REPLICAS=""
+PROMETHEUS_SHARDS=""
+
+LOKI_RETENTION_PERIOD=""
+LOKI_PV_SIZE=""
+LOKI_INGESTER_REPLICAS=""
+LOKI_INGESTER_MEMORY_REQUEST=""
+
+THANOS_STORE_DATA_SIZE=""
+THANOS_STORE_INDEX_CACHE_SIZE=""
+THANOS_STORE_CHUNK_POOL_SIZE=""
+THANOS_STORE_MEMORY_REQUEST=""
+THANOS_STORE_CHUNK_CACHE_SIZE=""
+THANOS_QUERY_REPLICAS=""
+THANOS_QUERY_FRONTEND_REPLICAS=""
+THANOS_QUERY_FRONTEND_CACHE_SIZE=""
+THANOS_QUERY_FRONTEND_MEMORY_REQUEST=""
+THANOS_COMPACT_DATA_SIZE=""
+THANOS_COMPACT_MEMORY_REQUEST=""
+THANOS_RAW_RETENTION_DAYS=""
+
+# *************************************************************
+
 # Option to enable monitoring for ec2.
 # Enter your choice (yes/no)
 # EC2 Instances Configuration
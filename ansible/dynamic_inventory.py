@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Dynamic Ansible inventory built from a local cache of running EC2 instances.
+
+Ansible calls this script with ``--list``. The answer always comes from
+``.cache/ec2_inventory.json``, so a playbook run starts without any AWS calls.
+When the cache is older than EC2_INVENTORY_TTL, a refresh starts in the
+background and this run uses the cached copy. Only the very first run, with
+no cache at all, waits for EC2. The refresh reuses the portal's paginated,
+multi-region ``EC2Inventory`` from ``EKS/ec2_inventory.py``.
+
+Groups:
+
+* ``master``: instances tagged ``Role=master`` (the tag key is EC2_INVENTORY_ROLE_TAG)
+* ``bastion``: instances tagged ``Role=bastion``
+* ``prometheus``: extra Prometheus servers (``Role=prometheus``) that share the scraping with the master
+* ``clients``: every other matching instance
+* ``tag_<key>_<value>``, ``region_<region>`` and ``vpc_<id>`` for every instance
+
+Instances are reached by private IP through a bastion in the same VPC: a
+``bastion`` host or, failing that, the ``master``. Instances without a
+bastion in their VPC are reached by public IP. Settings come from the
+environment:
+
+    EC2_INVENTORY_REGIONS   comma-separated regions (default: every enabled region)
+    EC2_INVENTORY_FILTERS   comma-separated KEY=VALUE tags that instances must carry
+    EC2_INVENTORY_TTL       cache age in seconds before a background refresh (default 300)
+    EC2_INVENTORY_CACHE     cache file (default .cache/ec2_inventory.json)
+
+Run ``./dynamic_inventory.py --refresh`` to re-read EC2 in the foreground.
+"""
+import argparse
+import configparser
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+ANSIBLE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ANSIBLE_DIR, '..', 'EKS'))
+
+DEFAULT_CACHE_FILE = os.path.join(ANSIBLE_DIR, '.cache', 'ec2_inventory.json')
+DEFAULT_TTL_SECONDS = 300
+# A refresh that has held the lock this long is assumed to have died
+REFRESH_LOCK_TIMEOUT_SECONDS = 600
+ROLE_TAG = os.environ.get('EC2_INVENTORY_ROLE_TAG', 'Role')
+MASTER_ROLE = 'master'
+BASTION_ROLE = 'bastion'
+SHARD_ROLE = 'prometheus'
+ROLES = (MASTER_ROLE, BASTION_ROLE, SHARD_ROLE)
+
+
+def settings():
+    regions = os.environ.get('EC2_INVENTORY_REGIONS', '')
+    filters = {}
+    for item in os.environ.get('EC2_INVENTORY_FILTERS', '').split(','):
+        key, _, value = item.strip().partition('=')
+        if key:
+            filters[key] = value
+    return {
+        'regions': [r.strip() for r in regions.split(',') if r.strip()],
+        'filters': filters,
+        'ttl': int(os.environ.get('EC2_INVENTORY_TTL', DEFAULT_TTL_SECONDS)),
+        'cache_file': os.environ.get('EC2_INVENTORY_CACHE', DEFAULT_CACHE_FILE),
+    }
+
+
+def ssh_defaults():
+    """Remote user and private key from ansible.cfg, for the bastion's ProxyCommand."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ANSIBLE_DIR, 'ansible.cfg'))
+    return (config.get('defaults', 'remote_user', fallback='ubuntu'),
+            config.get('defaults', 'private_key_file', fallback=None))
+
+
+def refresh(config):
+    """Read running instances from EC2 and replace the cache file atomically."""
+    from ec2_inventory import EC2Inventory
+
+    inventory = EC2Inventory()
+    regions = config['regions'] or inventory.list_regions()
+    _, instances, errors = inventory.get_regions(regions)
+    for region, error in sorted(errors.items()):
+        print(f"Could not read instances in {region}: {error}", file=sys.stderr)
+    cache_file = config['cache_file']
+    os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+    temporary = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump({'fetched_at': time.time(), 'regions': regions, 'errors': errors, 'instances': instances}, file)
+    os.replace(temporary, cache_file)
+    return instances
+
+
+def _lock_path(config):
+    return f"{config['cache_file']}.lock"
+
+
+def refresh_in_background(config):
+    """Start a detached refresh unless one is already running."""
+    lock = _lock_path(config)
+    try:
+        if time.time() - os.path.getmtime(lock) < REFRESH_LOCK_TIMEOUT_SECONDS:
+            return
+        os.remove(lock)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), '--refresh', '--release-lock'],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def load_instances(config):
+    """Cached instances, refreshed in the background when stale and in the foreground when missing."""
+    try:
+        with open(config['cache_file']) as file:
+            cache = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return refresh(config)
+    if time.time() - cache.get('fetched_at', 0) > config['ttl']:
+        refresh_in_background(config)
+    return cache['instances']
+
+
+def group_name(*parts):
+    return re.sub(r'[^A-Za-z0-9_]', '_', '_'.join(parts)).lower()
+
+
+def host_name(instance, shared_names):
+    """The Name tag, suffixed with the instance ID when other instances share it."""
+    if instance['name'] == 'Unnamed':
+        return instance['id']
+    name = re.sub(r'[^A-Za-z0-9_.-]', '-', instance['name'])
+    return f"{name}-{instance['id']}" if instance['name'] in shared_names else name
+
+
+def build_inventory(instances, filters=None, ssh_user='ubuntu', ssh_key=None):
+    """Ansible ``--list`` JSON: role and tag groups, with per-host connection settings."""
+    selected = [i for i in instances
+                if all(i['tags'].get(key) == value if value else key in i['tags'] for key, value in (filters or {}).items())]
+    groups = {'all': {'children': ['ungrouped']}, 'clients': {'hosts': []}}
+    groups.update({role: {'hosts': []} for role in ROLES})
+    counts = Counter(instance['name'] for instance in selected)
+    shared_names = {name for name, count in counts.items() if count > 1}
+    hostvars, names = {}, {}
+    for instance in selected:
+        name = host_name(instance, shared_names)
+        names[instance['id']] = name
+        role = instance['tags'].get(ROLE_TAG, '').lower()
+        groups[role if role in ROLES else 'clients']['hosts'].append(name)
+        for group in [group_name('region', instance['region']), group_name(instance['vpc_id'])] + [
+                group_name('tag', key, value) for key, value in instance['tags'].items() if key != 'Name']:
+            groups.setdefault(group, {'hosts': []})['hosts'].append(name)
+        hostvars[name] = {
+            'ansible_host': instance['public_ip'] or instance['ip'],
+            'ec2_id': instance['id'],
+            'ec2_private_ip': instance['ip'],
+            'ec2_public_ip': instance['public_ip'],
+            'ec2_region': instance['region'],
+            'ec2_vpc_id': instance['vpc_id'],
+            'ec2_instance_type': instance['type'],
+            'ec2_tags': instance['tags'],
+        }
+
+    # A bastion host in the VPC is preferred over the master
+    jump_hosts = {}
+    for role in (MASTER_ROLE, BASTION_ROLE):
+        for instance in selected:
+            if instance['tags'].get(ROLE_TAG, '').lower() == role and instance['public_ip']:
+                jump_hosts[(instance['region'], instance['vpc_id'])] = instance
+    key_option = f"-i {ssh_key} " if ssh_key else ''
+    for instance in selected:
+        jump = jump_hosts.get((instance['region'], instance['vpc_id']))
+        if not jump or instance['tags'].get(ROLE_TAG, '').lower() in (MASTER_ROLE, BASTION_ROLE):
+            continue
+        host = hostvars[names[instance['id']]]
+        host['ansible_host'] = instance['ip']
+        host['ansible_ssh_common_args'] = (
+            f"-o ProxyCommand=\"ssh {key_option}-o StrictHostKeyChecking=no -W %h:%p {ssh_user}@{jump['public_ip']}\""
+        )
+
+    for group in groups.values():
+        if 'hosts' in group:
+            group['hosts'].sort()
+    groups['all']['children'] += sorted(g for g in groups if g != 'all')
+    groups['_meta'] = {'hostvars': hostvars}
+    return groups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--list', action='store_true', help='Print the whole inventory (called by Ansible)')
+    parser.add_argument('--host', help='Print one host\'s variables (unused; --list returns _meta)')
+    parser.add_argument('--refresh', action='store_true', help='Re-read EC2 now and update the cache')
+    parser.add_argument('--release-lock', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    config = settings()
+
+    if args.host:
+        print(json.dumps({}))
+        return 0
+    if args.refresh:
+        try:
+            instances = refresh(config)
+        finally:
+            if args.release_lock:
+                try:
+                    os.remove(_lock_path(config))
+                except FileNotFoundError:
+                    pass
+        if not args.list:
+            print(f"Cached {len(instances)} running instances in {config['cache_file']}", file=sys.stderr)
+            return 0
+    else:
+        instances = load_instances(config)
+
+    ssh_user, ssh_key = ssh_defaults()
+    print(json.dumps(build_inventory(instances, config['filters'], ssh_user, ssh_key), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
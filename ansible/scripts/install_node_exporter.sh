@@ -1,11 +1,45 @@
 #!/bin/bash
 set -e
 
+# Usage: ./install_node_exporter.sh [minimal|standard|full]
+
+PROFILE=${1:-standard}
 VERSION="1.8.2"
 DOWNLOAD_URL="https://github.com/prometheus/node_exporter/releases/download/v${VERSION}/node_exporter-${VERSION}.linux-amd64.tar.gz"
 INSTALL_DIR="/usr/local/bin"
 SERVICE_FILE="/etc/systemd/system/node_exporter.service"
 
+# Collector profiles, the same as node_exporter_profiles in ansible/vars.yml
+EXCLUDES=' --collector.filesystem.fs-types-exclude=^(autofs|binfmt_misc|bpf|cgroup2?|configfs|debugfs|devpts|devtmpfs|fusectl|hugetlbfs|iso9660|mqueue|nsfs|overlay|proc|procfs|pstore|rpc_pipefs|securityfs|selinuxfs|squashfs|sysfs|tmpfs|tracefs)$'
+EXCLUDES+=' --collector.netdev.device-exclude=^(lo|veth.*|docker.*|br-.*|cni.*|flannel.*)$'
+case "$PROFILE" in
+    minimal)
+        # ~200 series: CPU, memory, load, filesystems, disks and network only
+        FLAGS='--collector.disable-defaults --collector.cpu --collector.meminfo --collector.loadavg --collector.filesystem'
+        FLAGS+=' --collector.diskstats --collector.netdev --collector.stat --collector.uname --web.disable-exporter-metrics'
+        FLAGS+="$EXCLUDES"
+        ;;
+    standard)
+        # ~450 series: the defaults without hardware, kernel-internals and per-protocol collectors
+        FLAGS=''
+        for collector in arp bcache bonding btrfs edac entropy fibrechannel hwmon infiniband ipvs mdadm netclass nfs nfsd \
+                nvme powersupplyclass rapl schedstat sockstat softnet tapestats thermal_zone timex udp_queues xfs zfs; do
+            FLAGS+="--no-collector.$collector "
+        done
+        FLAGS+='--web.disable-exporter-metrics'
+        FLAGS+=' --collector.netstat.fields=^(Tcp_(ActiveOpens|PassiveOpens|CurrEstab|RetransSegs|InErrs)|Udp_(InDatagrams|OutDatagrams|InErrors|NoPorts))$'
+        FLAGS+="$EXCLUDES"
+        ;;
+    full)
+        # ~1,200 series: every default collector
+        FLAGS=''
+        ;;
+    *)
+        echo "Unknown profile '$PROFILE', expected minimal, standard or full" >&2
+        exit 1
+        ;;
+esac
+
 wget $DOWNLOAD_URL
 tar xvfz node_exporter-*.tar.gz
 sudo mv node_exporter-${VERSION}.linux-amd64/node_exporter $INSTALL_DIR
@@ -24,7 +58,7 @@ Group=node_exporter
 Type=simple
 Restart=on-failure
 RestartSec=5s
-ExecStart=$INSTALL_DIR/node_exporter
+ExecStart=$INSTALL_DIR/node_exporter $FLAGS
 
 [Install]
 WantedBy=multi-user.target
@@ -32,4 +66,4 @@ EOF
 
 sudo systemctl daemon-reload
 sudo systemctl enable node_exporter
-sudo systemctl start node_exporter
+sudo systemctl restart node_exporter
@@ -1,12 +1,38 @@
 #!/bin/bash
+# Usage: ./install_process_exporter.sh [minimal|standard|full]
+
+PROFILE=${1:-standard}
+# Collector profiles, the same as process_exporter_profiles in ansible/vars.yml
+case "$PROFILE" in
+    minimal)
+        # ~10 groups x ~20 series: one group per user, no per-thread or smaps metrics
+        GROUP_BY='{{.Username}}'
+        FLAGS='-threads=false -gather-smaps=false'
+        ;;
+    standard)
+        # ~100 groups x ~20 series: one group per command name, no per-thread or smaps metrics
+        GROUP_BY='{{.Comm}}'
+        FLAGS='-threads=false -gather-smaps=false'
+        ;;
+    full)
+        # ~100 groups x ~20 series, plus ~6 series per thread name and proportional memory
+        GROUP_BY='{{.Comm}}'
+        FLAGS=''
+        ;;
+    *)
+        echo "Unknown profile '$PROFILE', expected minimal, standard or full" >&2
+        exit 1
+        ;;
+esac
+
 curl -LO https://github.com/ncabatoff/process-exporter/releases/download/v0.7.10/process-exporter-0.7.10.linux-amd64.tar.gz
 tar xzvf process-exporter-*.linux-amd64.tar.gz
 cp -rvi process-exporter-*.linux-amd64/process-exporter /usr/local/bin
-useradd --no-create-home --shell /bin/false process_exporter
+useradd --no-create-home --shell /bin/false process_exporter || true
 
 tee /etc/process-exporter.yml > /dev/null << EOF
 process_names:
-  - name: "{{.Comm}}"
+  - name: "$GROUP_BY"
     cmdline:
     - '.+'
 EOF
@@ -20,7 +46,7 @@ After=network-online.target
 [Service]
 User=process_exporter
 Type=simple
-ExecStart=/usr/local/bin/process-exporter --config.path /etc/process-exporter.yml
+ExecStart=/usr/local/bin/process-exporter --config.path /etc/process-exporter.yml $FLAGS
 Restart=always
 
 [Install]
@@ -28,5 +54,5 @@ WantedBy=multi-user.target
 EOF
 
 systemctl daemon-reload
-systemctl start process-exporter
+systemctl restart process-exporter
 systemctl enable process-exporter
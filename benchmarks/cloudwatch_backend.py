@@ -0,0 +1,245 @@
+"""Offline benchmark of the CloudWatch backend against moto's mock AWS.
+
+For each fleet size the mock account is seeded with that many resources
+spread across the benchmark regions, then the Flask test client measures:
+
+* ``/api/resources/<service>`` latency across all regions
+* ``/api/configure`` latency, alarms created per second and dashboard build
+  time, read from the trace of each request
+
+No network access or AWS credentials are used:
+
+    python benchmarks/cloudwatch_backend.py --fleet 10 --fleet 1000 --fleet 10000
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+BACKEND_APP = os.path.join(REPO_ROOT, 'cloudwatch', 'backend', 'app.py')
+
+# Fake credentials and a throwaway trace directory must be set before boto3 and the app load
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_SECURITY_TOKEN': 'testing',
+    'AWS_SESSION_TOKEN': 'testing',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    # ensure_instance_role attaches AWS managed policies, which moto only knows when asked to load them
+    'MOTO_IAM_LOAD_MANAGED_POLICIES': 'true',
+})
+os.environ.setdefault('TRACE_DIR', tempfile.mkdtemp(prefix='cloudwatch-bench-traces-'))
+
+# moto registers its botocore handlers on import, so it has to load before the app creates its session
+from moto import mock_aws  # noqa: E402
+import boto3  # noqa: E402
+
+from harness import add_common_arguments, finish, latency_metrics, measure, metric  # noqa: E402
+
+# The regions enabled by default on a new AWS account
+BENCH_REGIONS = (
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1', 'eu-north-1',
+    'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+    'ap-southeast-1', 'ap-southeast-2', 'sa-east-1',
+)
+DEFAULT_FLEETS = (10, 1000, 10000)
+RUN_INSTANCES_BATCH = 500
+THRESHOLDS = {'warning': 70, 'critical': 90}
+
+
+def load_backend():
+    # The backend imports its sibling modules the way it does when run from its own directory
+    sys.path.insert(0, os.path.dirname(BACKEND_APP))
+    spec = importlib.util.spec_from_file_location('cloudwatch_backend_app', BACKEND_APP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # The app logs every alarm and dashboard response, and an error for every
+    # instance without an uploaded key; failed requests still raise below
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(module.__name__).setLevel(logging.CRITICAL)
+    return module
+
+
+def limit_regions(session, regions):
+    """Trim DescribeRegions to the benchmark regions; moto reports every region it knows."""
+    def trim(parsed, **kwargs):
+        if parsed and 'Regions' in parsed:
+            parsed['Regions'] = [r for r in parsed['Regions'] if r['RegionName'] in regions]
+
+    session.events.register('after-call.ec2.DescribeRegions', trim)
+
+
+def split_fleet(size, regions):
+    """Spread ``size`` resources over the regions as evenly as possible."""
+    base, extra = divmod(size, len(regions))
+    return {region: base + (1 if index < extra else 0) for index, region in enumerate(regions)}
+
+
+def seed_ec2(region, count):
+    ec2 = boto3.client('ec2', region_name=region)
+    images = ec2.describe_images(Owners=['amazon']).get('Images', [])
+    image_id = images[0]['ImageId'] if images else 'ami-12c6146b'
+    created = 0
+    while created < count:
+        batch = min(RUN_INSTANCES_BATCH, count - created)
+        ec2.run_instances(
+            ImageId=image_id,
+            InstanceType='t3.micro',
+            MinCount=batch,
+            MaxCount=batch,
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [{'Key': 'Name', 'Value': f"bench-{region}-{created}"}],
+            }],
+        )
+        created += batch
+
+
+def seed_sqs(region, count):
+    sqs = boto3.client('sqs', region_name=region)
+    for index in range(count):
+        sqs.create_queue(QueueName=f"bench-{region}-{index}")
+
+
+def seed_dynamodb(region, count):
+    dynamodb = boto3.client('dynamodb', region_name=region)
+    for index in range(count):
+        dynamodb.create_table(
+            TableName=f"bench-{region}-{index}",
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+
+
+SEEDERS = {
+    'EC2': seed_ec2,
+    'SQS': seed_sqs,
+    'DynamoDB': seed_dynamodb,
+}
+
+
+def configure_payload(backend, service, region, resources):
+    metrics = [
+        {'name': m['name'], 'namespace': m['namespace']}
+        for m in backend.AWS_SERVICES[service.upper()]['metrics']
+    ]
+    return {
+        'region': region,
+        'service': service,
+        'resources': resources,
+        'metrics': metrics,
+        'alerts': True,
+        'thresholds': {m['name']: dict(THRESHOLDS) for m in metrics},
+    }
+
+
+def span_duration_ms(trace, name):
+    return sum(s['duration_ms'] for s in trace['spans'] if s['name'] == name)
+
+
+def bench_fleet(backend, client, args, size):
+    prefix = f"{args.service.lower()}.fleet_{size}"
+    metrics = {}
+
+    with mock_aws():
+        # mock_aws replaces boto3's default session; hook the one the backend will use
+        limit_regions(backend.aws_sessions.session(), args.regions)
+        backend.aws_sessions.invalidate()
+        # Each fleet starts from an empty AWS account, so it gets an empty state store too
+        backend.state_store = backend.StateStore(os.path.join(os.environ['TRACE_DIR'], f"state-{size}.db"))
+        start = time.perf_counter()
+        for region, count in split_fleet(size, args.regions).items():
+            if count:
+                SEEDERS[args.service](region, count)
+        metrics[f"{prefix}.seed_s"] = metric(time.perf_counter() - start, 's')
+
+        listed = {}
+
+        def list_resources():
+            response = client.get(f"/api/resources/{args.service}")
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/resources/{args.service} returned {response.status_code}")
+            listed['resources'] = response.get_json()
+
+        samples = measure(list_resources, args.iterations, warmup=1)
+        metrics.update(latency_metrics(f"{prefix}.resources", samples))
+        metrics[f"{prefix}.resources.count"] = metric(len(listed['resources']), 'resources', better='higher')
+
+        region = args.regions[0]
+        targets = [r for r in listed['resources'] if r['Region'] == region][:args.configure_resources]
+        if not targets:
+            return metrics
+        payload = configure_payload(backend, args.service, region, targets)
+
+        traces = []
+
+        def configure(force=True):
+            # "force" rewrites every alarm and the dashboard instead of skipping the unchanged ones
+            response = client.post('/api/configure', json={**payload, 'force': force})
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/configure returned {response.status_code}: {response.get_data(as_text=True)}")
+            traces.append(backend.load_trace(response.headers['X-Trace-Id']))
+
+        # The first EC2 configure creates the instance profile and waits for IAM; keep it out of the samples
+        samples = measure(configure, args.iterations, warmup=1)
+        measured = traces[1:]
+        metrics.update(latency_metrics(f"{prefix}.configure", samples))
+
+        # A warning and a critical alarm per resource and metric
+        created = 2 * len(payload['metrics']) * len(targets) * len(measured)
+        alarms_ms = sum(span_duration_ms(t, 'alarms') for t in measured)
+        if alarms_ms:
+            metrics[f"{prefix}.configure.alarms_per_s"] = metric(created / (alarms_ms / 1000), 'alarms/s',
+                                                                 better='higher')
+        dashboard_ms = [span_duration_ms(t, 'dashboard') for t in measured]
+        metrics[f"{prefix}.configure.dashboard_ms"] = metric(sum(dashboard_ms) / len(dashboard_ms), 'ms')
+
+        # Reconfiguring with an unchanged payload only diffs against the state store
+        samples = measure(lambda: configure(force=False), args.iterations, warmup=0)
+        metrics.update(latency_metrics(f"{prefix}.reconfigure", samples))
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fleet', type=int, action='append', dest='fleets',
+                        help=f"Resources to seed per run; repeatable (default: {', '.join(map(str, DEFAULT_FLEETS))})")
+    parser.add_argument('--regions', type=int, default=len(BENCH_REGIONS),
+                        help=f"Number of regions to spread the fleet over (max {len(BENCH_REGIONS)})")
+    parser.add_argument('--service', choices=sorted(SEEDERS), default='EC2')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--configure-resources', type=int, default=10,
+                        help='Resources per /api/configure request')
+    add_common_arguments(parser, os.path.join(BENCH_DIR, 'results', 'cloudwatch_backend.json'))
+    args = parser.parse_args(argv)
+
+    args.fleets = args.fleets or list(DEFAULT_FLEETS)
+    args.regions = BENCH_REGIONS[:max(1, min(args.regions, len(BENCH_REGIONS)))]
+
+    backend = load_backend()
+    client = backend.app.test_client()
+
+    metrics = {}
+    for size in args.fleets:
+        print(f"Benchmarking {args.service} with {size} resources across {len(args.regions)} regions")
+        metrics.update(bench_fleet(backend, client, args, size))
+
+    parameters = {
+        'service': args.service,
+        'fleets': args.fleets,
+        'regions': list(args.regions),
+        'iterations': args.iterations,
+        'configure_resources': args.configure_resources,
+    }
+    return finish(args, 'cloudwatch_backend', parameters, metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""Config-generation scalability benchmark for the Prometheus/Alertmanager writers.
+
+Runs the grafana app's writers (``update_prometheus_config``,
+``apply_alert_rules`` and ``configure_alerting``) and renders
+``ansible/prometheus.yml.j2`` for fleets of 100/1k/10k targets. Everything
+is written to a temporary directory. ``systemctl`` and ``service`` are
+replaced by no-op stubs on PATH.
+
+For each output the benchmark records generation time, output size, peak
+Python memory and, when ``promtool``/``amtool`` are on PATH, validation time:
+
+    python benchmarks/config_generation.py --targets 100 --targets 1000 --targets 10000
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from harness import add_common_arguments, finish, latency_metrics, measure, metric, peak_memory_kib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+GRAFANA_DIR = os.path.join(REPO_ROOT, 'grafana')
+ANSIBLE_DIR = os.path.join(REPO_ROOT, 'ansible')
+
+DEFAULT_TARGETS = (100, 1000, 10000)
+ALL_ALERT_RULES = ("High CPU Usage", "Low Disk Space", "High Memory Usage", "Instance Down", "High Network Traffic")
+BASE_PROMETHEUS_CONFIG = """global:
+  scrape_interval: 15s
+  evaluation_interval: 15s
+
+scrape_configs:
+"""
+STUB_COMMANDS = ('systemctl', 'service')
+
+
+def make_workspace():
+    """Temp dir with the grafana scripts, writable /etc stand-ins and stubbed service managers."""
+    root = tempfile.mkdtemp(prefix='config-bench-')
+    shutil.copytree(os.path.join(GRAFANA_DIR, 'scripts'), os.path.join(root, 'scripts'))
+    for directory in ('bin', 'prometheus', 'alertmanager/templates', 'ansible'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    for command in STUB_COMMANDS:
+        path = os.path.join(root, 'bin', command)
+        with open(path, 'w') as file:
+            file.write('#!/bin/sh\nexit 0\n')
+        os.chmod(path, 0o755)
+    os.environ['PATH'] = os.path.join(root, 'bin') + os.pathsep + os.environ.get('PATH', '')
+    return root
+
+
+def load_grafana_app(root):
+    spec = importlib.util.spec_from_file_location('grafana_app', os.path.join(GRAFANA_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.PROMETHEUS_CONFIG_PATH = os.path.join(root, 'prometheus', 'prometheus.yml')
+    module.ALERT_RULES_FILE_PATH = os.path.join(root, 'prometheus', 'alert.rules.yml')
+    module.ALERTMANAGER_CONFIG_PATH = os.path.join(root, 'alertmanager', 'alertmanager.yml')
+    module.EMAIL_TEMPLATE_PATH = os.path.join(root, 'alertmanager', 'templates', 'email.tmpl')
+    return module
+
+
+def fleet(count):
+    return [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(count)]
+
+
+def call_writer(grafana, fn, path='/', method='POST', data=None):
+    """Run a writer in a request context and raise if it flashed an error, since the writers never raise."""
+    from flask import get_flashed_messages
+
+    with grafana.app.test_request_context(path, method=method, data=data):
+        fn()
+        errors = [message for category, message in get_flashed_messages(with_categories=True) if category == 'error']
+    if errors:
+        raise RuntimeError('; '.join(errors))
+
+
+class Validator:
+    def __init__(self):
+        self.tools = {name: shutil.which(name) for name in ('promtool', 'amtool')}
+        self.failures = []
+
+    def run(self, tool, args, path):
+        """Time a validator run; returns None when the tool is not installed."""
+        if not self.tools[tool]:
+            return None
+        start = time.perf_counter()
+        result = subprocess.run([self.tools[tool], *args, path], capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            self.failures.append({'tool': tool, 'path': os.path.basename(path),
+                                  'output': (result.stdout + result.stderr).strip()[-2000:]})
+        return elapsed * 1000
+
+
+def record_output(metrics, prefix, path, samples, peak_kib, validation_ms):
+    metrics.update(latency_metrics(f"{prefix}.generate", samples))
+    metrics[f"{prefix}.size_kib"] = metric(os.path.getsize(path) / 1024, 'KiB')
+    metrics[f"{prefix}.peak_memory_kib"] = metric(peak_kib, 'KiB')
+    if validation_ms is not None:
+        metrics[f"{prefix}.validate_ms"] = metric(validation_ms, 'ms')
+
+
+def bench_update_prometheus_config(grafana, validator, args, count, metrics):
+    prefix = f"update_prometheus_config.targets_{count}"
+    targets = [{'job_name': f"node_{i}", 'target': f"{ip}:9100", 'scrape_interval': '15s', 'scrape_timeout': '10s'}
+               for i, ip in enumerate(fleet(count))]
+
+    def generate():
+        with open(grafana.PROMETHEUS_CONFIG_PATH, 'w') as file:
+            file.write(BASE_PROMETHEUS_CONFIG)
+        call_writer(grafana, lambda: grafana.update_prometheus_config(targets))
+
+    samples = measure(generate, args.iterations)
+    peak = peak_memory_kib(generate)
+    validation = validator.run('promtool', ['check', 'config', '--syntax-only'], grafana.PROMETHEUS_CONFIG_PATH)
+    record_output(metrics, prefix, grafana.PROMETHEUS_CONFIG_PATH, samples, peak, validation)
+
+    # The /add_targets path: one more job appended to a config that already holds the fleet
+    extra = [{'job_name': 'node_extra', 'target': '10.255.255.254:9100'}]
+    samples = measure(lambda: call_writer(grafana, lambda: grafana.update_prometheus_config(extra)), args.iterations)
+    metrics.update(latency_metrics(f"{prefix}.append_one", samples))
+
+
+def bench_apply_alert_rules(grafana, validator, args, count, metrics):
+    """Rules written by the route, against a prometheus.yml that already holds ``count`` jobs."""
+    prefix = f"apply_alert_rules.targets_{count}"
+    form = {'alert_rules': list(ALL_ALERT_RULES), 'threshold_cpu': '90', 'threshold_disk': '0.1',
+            'threshold_memory': '80'}
+
+    def generate():
+        call_writer(grafana, grafana.apply_alert_rules, '/apply_alert_rules', data=form)
+
+    samples = measure(generate, args.iterations)
+    peak = peak_memory_kib(generate)
+    validation = validator.run('promtool', ['check', 'rules'], grafana.ALERT_RULES_FILE_PATH)
+    record_output(metrics, prefix, grafana.ALERT_RULES_FILE_PATH, samples, peak, validation)
+
+
+def bench_rule_set(validator, root, args, count, metrics):
+    """Per-target rule groups serialized the way apply_alert_rules writes them."""
+    prefix = f"rule_set.targets_{count}"
+    path = os.path.join(root, 'prometheus', f"rules-{count}.yml")
+    groups = [{
+        'name': f"node_{i}",
+        'rules': [{
+            'alert': 'HighCPUUsage',
+            'expr': f'100 - (avg by(instance) (rate(node_cpu_seconds_total{{mode="idle",instance="{ip}:9100"}}[5m])) * 100) > 90',
+            'for': '2m',
+            'labels': {'severity': 'critical'},
+            'annotations': {'summary': 'High CPU usage detected',
+                            'description': 'CPU usage on {{ $labels.instance }} is above 90%.'},
+        }],
+    } for i, ip in enumerate(fleet(count))]
+
+    def generate():
+        with open(path, 'w') as file:
+            yaml.dump({'groups': groups}, file, default_flow_style=False)
+
+    samples = measure(generate, args.iterations)
+    peak = peak_memory_kib(generate)
+    validation = validator.run('promtool', ['check', 'rules'], path)
+    record_output(metrics, prefix, path, samples, peak, validation)
+
+
+def bench_configure_alerting(grafana, validator, args, metrics):
+    """Alertmanager config does not grow with the fleet; measured once as a reference."""
+    prefix = 'configure_alerting'
+    form = {'email_from': 'alerts@example.com', 'email_to': 'oncall@example.com',
+            'smtp_server': 'smtp.example.com:587', 'smtp_auth_password': 'secret',
+            'slack_webhook': 'https://hooks.slack.com/services/T0/B0/X', 'slack_channel': '#alerts',
+            'google_chat_webhook': 'https://chat.googleapis.com/v1/spaces/X/messages'}
+
+    def generate():
+        call_writer(grafana, grafana.configure_alerting, '/configure_alerting', data=form)
+
+    samples = measure(generate, args.iterations)
+    peak = peak_memory_kib(generate)
+    validation = validator.run('amtool', ['check-config'], grafana.ALERTMANAGER_CONFIG_PATH)
+    record_output(metrics, prefix, grafana.ALERTMANAGER_CONFIG_PATH, samples, peak, validation)
+
+
+def bench_ansible_template(validator, root, args, count, metrics):
+    import jinja2
+
+    prefix = f"prometheus_yml_j2.targets_{count}"
+    path = os.path.join(root, 'ansible', f"prometheus-{count}.yml")
+    # Ansible renders templates with trim_blocks and keeps the trailing newline
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(ANSIBLE_DIR), trim_blocks=True,
+                             keep_trailing_newline=True, undefined=jinja2.StrictUndefined)
+    with open(os.path.join(ANSIBLE_DIR, 'vars.yml'), 'r') as file:
+        variables = yaml.safe_load(file) or {}
+    hosts = {f"client-server-{i}": {'ansible_host': ip} for i, ip in enumerate(fleet(count))}
+    variables.update({'groups': {'clients': list(hosts)}, 'hostvars': hosts})
+
+    def generate():
+        template = env.get_template('prometheus.yml.j2')
+        with open(path, 'w') as file:
+            file.write(template.render(**variables))
+
+    samples = measure(generate, args.iterations)
+    peak = peak_memory_kib(generate)
+    validation = validator.run('promtool', ['check', 'config', '--syntax-only'], path)
+    record_output(metrics, prefix, path, samples, peak, validation)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', type=int, action='append', dest='sizes',
+                        help=f"Fleet sizes; repeatable (default: {', '.join(map(str, DEFAULT_TARGETS))})")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--keep', action='store_true', help='Keep the generated configs for inspection')
+    add_common_arguments(parser, os.path.join(BENCH_DIR, 'results', 'config_generation.json'))
+    args = parser.parse_args(argv)
+    args.sizes = args.sizes or list(DEFAULT_TARGETS)
+
+    root = make_workspace()
+    cwd = os.getcwd()
+    # The writers use ./scripts relative to the working directory
+    os.chdir(root)
+    try:
+        grafana = load_grafana_app(root)
+        validator = Validator()
+        metrics = {}
+        bench_configure_alerting(grafana, validator, args, metrics)
+        for count in args.sizes:
+            print(f"Generating configs for {count} targets")
+            bench_update_prometheus_config(grafana, validator, args, count, metrics)
+            bench_apply_alert_rules(grafana, validator, args, count, metrics)
+            bench_rule_set(validator, root, args, count, metrics)
+            bench_ansible_template(validator, root, args, count, metrics)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Generated configs kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    parameters = {'targets': args.sizes, 'iterations': args.iterations,
+                  'validators': {name: bool(path) for name, path in validator.tools.items()}}
+    notes = {'validation_failures': validator.failures} if validator.failures else None
+    return finish(args, 'config_generation', parameters, metrics, notes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Shared timing, reporting and baseline comparison for the portal benchmarks.
+
+Every benchmark writes a JSON report of named metrics. Each metric has a
+value, a unit, and the direction that counts as better. When a baseline
+report is passed with ``--baseline``, any metric that got worse by more than
+``--tolerance`` is listed and the run exits with status 1, so CI can catch
+regressions in the hot paths.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+REGRESSION_EXIT_CODE = 1
+DEFAULT_TOLERANCE = 0.2
+
+
+def add_common_arguments(parser, default_output):
+    parser.add_argument('--output', default=default_output, help='Path of the JSON report to write')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative slowdown before a metric counts as a regression')
+
+
+def measure(fn, iterations, warmup=1):
+    """Call ``fn`` ``warmup`` times untimed, then ``iterations`` times; return the durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_memory_kib(fn):
+    """Peak Python heap allocated while running ``fn`` once, in KiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds."""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def latency_metrics(prefix, samples):
+    """Report the p50 and p95 of a latency sample set as lower-is-better metrics."""
+    summary = summarize(samples)
+    return {
+        f"{prefix}.p50_ms": metric(summary['p50_ms'], 'ms'),
+        f"{prefix}.p95_ms": metric(summary['p95_ms'], 'ms'),
+    }
+
+
+def metric(value, unit, better='lower'):
+    return {'value': round(value, 4), 'unit': unit, 'better': better}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+
+def compare(metrics, baseline, tolerance):
+    """Return the metrics that regressed against ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for name, current in metrics.items():
+        previous = baseline.get('metrics', {}).get(name)
+        if not previous or not previous.get('value'):
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        if current.get('better', 'lower') == 'higher':
+            change = -change
+        if change > tolerance:
+            regressions.append({
+                'metric': name,
+                'baseline': previous['value'],
+                'current': current['value'],
+                'unit': current['unit'],
+                'change': round(change, 4),
+            })
+    return regressions
+
+
+def finish(args, name, parameters, metrics, notes=None):
+    """Write the report, compare it with the baseline and return the process exit code."""
+    report = {
+        'benchmark': name,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(),
+        'parameters': parameters,
+        'metrics': metrics,
+    }
+    if notes:
+        report['notes'] = notes
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        report['baseline'] = args.baseline
+        report['regressions'] = compare(metrics, baseline, args.tolerance)
+        if report['regressions']:
+            exit_code = REGRESSION_EXIT_CODE
+
+    directory = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+    width = max((len(k) for k in metrics), default=0)
+    for key in sorted(metrics):
+        print(f"{key:<{width}}  {metrics[key]['value']:>12} {metrics[key]['unit']}")
+    for regression in report.get('regressions', []):
+        print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+              f"{regression['unit']} ({regression['change']:+.0%})", file=sys.stderr)
+    print(f"Report written to {args.output}")
+    return exit_code
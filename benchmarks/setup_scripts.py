@@ -0,0 +1,272 @@
+"""Offline timing harness for EKS/monitoring_setup.sh and EKS/gke_monitoring_setup.sh.
+
+The scripts run in a temporary copy of EKS/. The cluster CLIs (kubectl,
+helm, aws, eksctl, gcloud) and the host tools they shell out to are replaced
+by stubs on PATH, each with a configurable artificial latency (see
+stub_tool.py). Bash xtrace with a timestamped PS4 gives each traced command
+its function stack. From that, the harness reports wall-clock time per
+function, time spent in each stubbed tool, and the serial critical path
+through the functions ``main`` calls:
+
+    python benchmarks/setup_scripts.py --script eks --latency helm=2 --redeploy
+
+``--stubs FILE`` merges a JSON file over DEFAULT_STUBS to change the canned
+outputs, add rules or give individual commands their own latency.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import add_common_arguments, finish, metric
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+EKS_DIR = os.path.join(REPO_ROOT, 'EKS')
+
+SCRIPTS = {
+    'eks': ('monitoring_setup.sh', 'variables.sh'),
+    'gke': ('gke_monitoring_setup.sh', 'gke-variables.sh'),
+}
+STUBBED_TOOLS = ('kubectl', 'helm', 'aws', 'eksctl', 'gcloud', 'jq', 'sudo', 'curl', 'wget', 'ssh', 'unzip')
+PASSTHROUGH_TOOLS = ('logger', 'sleep', 'clear')
+TRACE_LINE_RE = re.compile(r'^\++ (\d+\.\d+) ([^|]*)\|(.*)$')
+SLOWEST_LIMIT = 10
+
+# Seconds per call; rules are matched against the joined arguments, first match wins
+DEFAULT_STUBS = {
+    'latency_scale': 1.0,
+    'sleep_scale': 0.0,
+    'tools': {
+        'aws': {'latency': 0.4, 'rules': [
+            {'match': r'eks .*describe-cluster.*--query', 'stdout': 'https://oidc.eks.us-east-1.amazonaws.com/id/BENCH\n'},
+            {'match': r'sts get-caller-identity', 'stdout': '123456789012\n'},
+            {'match': r'ec2 describe-volumes', 'stdout': '20\n'},
+        ]},
+        'kubectl': {'latency': 0.3, 'rules': [
+            {'match': r'get deployment -n kube-system', 'stdout': 'ebs-csi-controller   2/2     2            2           1d\n'},
+            {'match': r'get sa -n kube-system', 'stdout': 'ebs-csi-controller-sa   0         1d\n'},
+            {'match': r'^apply ', 'latency': 0.6},
+        ]},
+        'helm': {'latency': 0.5, 'rules': [
+            {'match': r'^repo list', 'stdout': 'prometheus-community\thttps://prometheus-community.github.io/helm-charts\n'
+                                               'grafana\thttps://grafana.github.io/helm-charts\n'},
+            {'match': r'^repo update', 'latency': 3.0},
+            {'match': r'^status ', 'stdout': 'STATUS: deployed\n'},
+            {'match': r'^upgrade ', 'latency': 30.0},
+        ]},
+        'eksctl': {'latency': 1.0, 'rules': [
+            {'match': r'^create ', 'latency': 20.0},
+        ]},
+        'gcloud': {'latency': 0.8, 'rules': [
+            {'match': r'compute disks describe', 'stdout': '20\n'},
+            {'match': r'config get-value project', 'stdout': 'bench-project\n'},
+            {'match': r'iam service-accounts list', 'stdout': 'bench@bench-project.iam.gserviceaccount.com\n'},
+        ]},
+    },
+}
+
+TRACE_ENV = """unset BASH_ENV
+PS4='+ ${EPOCHREALTIME} ${FUNCNAME[*]}|'
+set -x
+"""
+
+
+def merge_stubs(base, override):
+    merged = json.loads(json.dumps(base))
+    for key, value in override.items():
+        if key == 'tools':
+            for tool, settings in value.items():
+                current = merged['tools'].setdefault(tool, {})
+                # Rules from the override are tried before the defaults
+                rules = settings.get('rules', []) + current.get('rules', [])
+                current.update(settings)
+                current['rules'] = rules
+        else:
+            merged[key] = value
+    return merged
+
+
+def make_workspace(stubs):
+    root = tempfile.mkdtemp(prefix='setup-bench-')
+    workdir = os.path.join(root, 'EKS')
+    shutil.copytree(EKS_DIR, workdir, ignore=shutil.ignore_patterns(
+        'profiles', '.state', 'static', 'templates', '__pycache__', '*-profiles.json'))
+
+    bindir = os.path.join(root, 'bin')
+    os.makedirs(bindir)
+    stub = os.path.join(BENCH_DIR, 'stub_tool.py')
+    for tool in STUBBED_TOOLS + PASSTHROUGH_TOOLS:
+        with open(os.path.join(bindir, tool), 'w') as file:
+            file.write(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" {tool} "$@"\n')
+    # helm_values.py has to run under an interpreter that has PyYAML
+    with open(os.path.join(bindir, 'python3'), 'w') as file:
+        file.write(f'#!/bin/sh\nexec "{sys.executable}" "$@"\n')
+    for name in os.listdir(bindir):
+        os.chmod(os.path.join(bindir, name), 0o755)
+
+    stub_config = os.path.join(root, 'stubs.json')
+    with open(stub_config, 'w') as file:
+        json.dump(stubs, file)
+    trace_env = os.path.join(root, 'trace.env')
+    with open(trace_env, 'w') as file:
+        file.write(TRACE_ENV)
+    return root, workdir, bindir, stub_config, trace_env
+
+
+def run_script(root, workdir, bindir, stub_config, trace_env, script, variables, label):
+    trace_path = os.path.join(root, f"{label}.trace")
+    log_path = os.path.join(root, f"{label}.log")
+    env = dict(os.environ)
+    env.update({
+        'PATH': bindir + os.pathsep + env.get('PATH', ''),
+        'BASH_ENV': trace_env,
+        'BENCH_STUB_CONFIG': stub_config,
+        'VARIABLES_FILE': variables,
+        'STATE_DIR': os.path.join(workdir, '.state'),
+        'KUBECONFIG': os.path.join(root, 'kubeconfig'),
+        'TERM': env.get('TERM', 'dumb'),
+    })
+
+    with open(trace_path, 'w') as trace, open(log_path, 'w') as log:
+        # Xtrace goes to its own descriptor so the scripts' stdout/stderr redirection does not swallow it
+        env['BASH_XTRACEFD'] = str(trace.fileno())
+        start = time.time()
+        result = subprocess.run(['bash', script], cwd=workdir, env=env, stdin=subprocess.DEVNULL,
+                                stdout=log, stderr=subprocess.STDOUT, pass_fds=(trace.fileno(),))
+        end = time.time()
+
+    if result.returncode != 0:
+        with open(log_path, 'r', errors='replace') as file:
+            tail = file.read()[-3000:]
+        raise RuntimeError(f"{script} exited with {result.returncode}; last output:\n{tail}")
+    return start, end, trace_path
+
+
+def analyze(trace_path, start, end):
+    """Attribute the time between consecutive trace lines to the command and function stack of the first."""
+    events = []
+    with open(trace_path, 'r', errors='replace') as file:
+        for line in file:
+            match = TRACE_LINE_RE.match(line.rstrip('\n'))
+            if match:
+                timestamp, stack, command = match.groups()
+                events.append((float(timestamp), stack.split()[::-1], command.split(' ', 1)[0]))
+    events.sort(key=lambda e: e[0])
+
+    phases, functions, tools, slowest = {}, {}, {}, []
+    for index, (timestamp, stack, command) in enumerate(events):
+        following = events[index + 1][0] if index + 1 < len(events) else end
+        duration = max(0.0, following - timestamp)
+        # stack[0] is bash's "main" for the script body, stack[1] the script's main(), stack[2] a phase
+        if len(stack) >= 3:
+            phase = stack[2]
+        elif len(stack) == 2:
+            phase = stack[1]
+        else:
+            phase = '(top-level)'
+        phases[phase] = phases.get(phase, 0.0) + duration
+        for name in set(stack[1:]):
+            functions[name] = functions.get(name, 0.0) + duration
+        if command in STUBBED_TOOLS:
+            tools[command] = tools.get(command, 0.0) + duration
+            slowest.append((duration, phase, command))
+
+    total = end - start
+    critical_path = [{'function': name, 'seconds': round(seconds, 3), 'share': round(seconds / total, 4)}
+                     for name, seconds in phases.items()]
+    slowest.sort(reverse=True)
+    return {
+        'total': total,
+        'phases': phases,
+        'functions': functions,
+        'tools': tools,
+        'critical_path': critical_path,
+        'slowest_calls': [{'seconds': round(d, 3), 'function': p, 'tool': c} for d, p, c in slowest[:SLOWEST_LIMIT]],
+    }
+
+
+def add_metrics(metrics, prefix, result):
+    metrics[f"{prefix}.total_s"] = metric(result['total'], 's')
+    for name, seconds in result['phases'].items():
+        metrics[f"{prefix}.phase.{name}_s"] = metric(seconds, 's')
+    for tool, seconds in result['tools'].items():
+        metrics[f"{prefix}.tool.{tool}_s"] = metric(seconds, 's')
+
+
+def parse_latency(values):
+    latencies = {}
+    for value in values or []:
+        tool, _, seconds = value.partition('=')
+        latencies[tool] = float(seconds)
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--script', choices=sorted(SCRIPTS), action='append', dest='scripts',
+                        help='Script to run; repeatable (default: both)')
+    parser.add_argument('--latency', action='append', metavar='TOOL=SECONDS',
+                        help='Default latency of a stubbed tool; repeatable')
+    parser.add_argument('--latency-scale', type=float, help='Multiply every stub latency, e.g. 0.1 for quick runs')
+    parser.add_argument('--sleep-scale', type=float,
+                        help="Fraction of each 'sleep' in the scripts to actually wait (default 0)")
+    parser.add_argument('--stubs', help='JSON file merged over the default stub rules')
+    parser.add_argument('--variables', help='variables file to source instead of the template')
+    parser.add_argument('--redeploy', action='store_true',
+                        help='Run each script a second time with the state of the first, as a redeploy')
+    parser.add_argument('--keep', action='store_true', help='Keep the workspace, traces and logs')
+    add_common_arguments(parser, os.path.join(BENCH_DIR, 'results', 'setup_scripts.json'))
+    args = parser.parse_args(argv)
+
+    stubs = DEFAULT_STUBS
+    if args.stubs:
+        with open(args.stubs, 'r') as file:
+            stubs = merge_stubs(stubs, json.load(file))
+    for tool, seconds in parse_latency(args.latency).items():
+        stubs = merge_stubs(stubs, {'tools': {tool: {'latency': seconds}}})
+    if args.latency_scale is not None:
+        stubs = merge_stubs(stubs, {'latency_scale': args.latency_scale})
+    if args.sleep_scale is not None:
+        stubs = merge_stubs(stubs, {'sleep_scale': args.sleep_scale})
+
+    metrics, notes = {}, {}
+    for name in args.scripts or sorted(SCRIPTS):
+        script, default_variables = SCRIPTS[name]
+        root, workdir, bindir, stub_config, trace_env = make_workspace(stubs)
+        variables = os.path.abspath(args.variables) if args.variables else os.path.join(workdir, default_variables)
+        try:
+            runs = ['deploy', 'redeploy'] if args.redeploy else ['deploy']
+            for run in runs:
+                print(f"Running {script} ({run})")
+                start, end, trace_path = run_script(root, workdir, bindir, stub_config, trace_env,
+                                                    script, variables, f"{name}-{run}")
+                result = analyze(trace_path, start, end)
+                add_metrics(metrics, f"{name}.{run}", result)
+                notes[f"{name}.{run}"] = {
+                    'critical_path': result['critical_path'],
+                    'slowest_calls': result['slowest_calls'],
+                    'functions': {k: round(v, 3) for k, v in sorted(result['functions'].items(),
+                                                                    key=lambda kv: kv[1], reverse=True)},
+                }
+                print(f"  critical path ({result['total']:.1f}s): " + ' -> '.join(
+                    f"{step['function']} {step['seconds']:.1f}s" for step in result['critical_path']))
+        finally:
+            if args.keep:
+                print(f"Workspace kept in {root}")
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+
+    parameters = {'scripts': args.scripts or sorted(SCRIPTS), 'redeploy': args.redeploy,
+                  'latency_scale': stubs['latency_scale'], 'sleep_scale': stubs['sleep_scale'],
+                  'latencies': {tool: settings.get('latency', 0) for tool, settings in stubs['tools'].items()}}
+    return finish(args, 'setup_scripts', parameters, metrics, notes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
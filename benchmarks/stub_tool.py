@@ -0,0 +1,39 @@
+"""Stand-in for kubectl, helm, aws, eksctl, gcloud and friends used by setup_scripts.py.
+
+Each stub on PATH runs ``stub_tool.py <tool> <args...>``. The first rule in
+the stub config whose regex matches the joined arguments supplies the
+canned stdout, exit code and latency. Without a match, the tool's default
+latency applies and the stub prints nothing.
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+
+def main(argv):
+    tool, args = argv[0], argv[1:]
+    with open(os.environ['BENCH_STUB_CONFIG'], 'r') as file:
+        config = json.load(file)
+
+    if tool == 'logger':
+        # The EKS script pipes all of its output through logger
+        shutil.copyfileobj(sys.stdin, sys.stdout)
+        return 0
+    if tool == 'sleep':
+        seconds = float(args[0].rstrip('s')) if args else 0
+        time.sleep(seconds * config['sleep_scale'])
+        return 0
+
+    settings = config['tools'].get(tool, {})
+    command = ' '.join(args)
+    rule = next((r for r in settings.get('rules', []) if re.search(r['match'], command)), {})
+    time.sleep(rule.get('latency', settings.get('latency', 0)) * config['latency_scale'])
+    sys.stdout.write(rule.get('stdout', ''))
+    return rule.get('exit', 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
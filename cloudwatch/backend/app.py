@@ -1,16 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
 import json
 import os
 import paramiko
+import re
 import subprocess
 import shutil
 import time
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from flask_cors import CORS
 from typing import Dict, List, Union
 import logging
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common.instrumentation import init_app, instrument_session, track_ssh
+from common import aws_rate_limit, tracing
+from common.tracing import start_trace, span, traced, current_span, load_trace
+import aws_services
+from aws_accounts import AccountRegistry, SessionCache, DEFAULT_ACCOUNT_ID, ACCOUNTS_FILE
+from aws_services import AWS_SERVICES, GONE_STATES, all_pages
+from state_store import StateStore, alarm_arn, content_hash, dashboard_arn
+from metric_preview import TTLCache, build_queries, fetch, suggest_thresholds, summarize, time_window
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,152 +31,52 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
+init_app(app, "cloudwatch")
+tracing.configure("cloudwatch")
 
 # Get the frontend directory path
 FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'frontend')
 
-# Updated AWS_SERVICES configuration in app.py
-AWS_SERVICES = {
-    'EC2': {
-        'namespace': 'AWS/EC2',
-        'dimension_key': 'InstanceId',
-        'resource_type': 'instances',
-        'list_function': 'describe_instances',
-        'metrics': [
-            {'name': 'CPUUtilization', 'namespace': 'AWS/EC2'},
-            {
-                'name': 'DiskSpaceUtilization',
-                'namespace': 'CWAgent',
-                'dimensions': [
-                    {'Name': 'InstanceId', 'Value': '${aws:InstanceId}'},
-                    {'Name': 'path', 'Value': '/'},
-                    {'Name': 'device', 'Value': 'xvda1'},
-                    {'Name': 'fstype', 'Value': 'ext4'}
-                ]
-            },
-            {'name': 'MemoryUtilization', 'namespace': 'CWAgent'},
-            {'name': 'NetworkIn', 'namespace': 'AWS/EC2'},
-            {'name': 'NetworkOut', 'namespace': 'AWS/EC2'}
-        ]
-    },
-    'RDS': {
-        'namespace': 'AWS/RDS',
-        'dimension_key': 'DBInstanceIdentifier',
-        'resource_type': 'db_instances',
-        'list_function': 'describe_db_instances',
-        'metrics': [
-            {'name': 'CPUUtilization', 'namespace': 'AWS/RDS'},
-            {'name': 'FreeableMemory', 'namespace': 'AWS/RDS'},
-            {'name': 'FreeStorageSpace', 'namespace': 'AWS/RDS'},
-            {'name': 'DatabaseConnections', 'namespace': 'AWS/RDS'},
-            {'name': 'ReadIOPS', 'namespace': 'AWS/RDS'},
-            {'name': 'WriteIOPS', 'namespace': 'AWS/RDS'}
-        ]
-    },
-    'Lambda': {
-        'namespace': 'AWS/Lambda',
-        'dimension_key': 'FunctionName',
-        'resource_type': 'functions',
-        'list_function': 'list_functions',
-        'metrics': [
-            {'name': 'Invocations', 'namespace': 'AWS/Lambda'},
-            {'name': 'Errors', 'namespace': 'AWS/Lambda'},
-            {'name': 'Duration', 'namespace': 'AWS/Lambda'},
-            {'name': 'Throttles', 'namespace': 'AWS/Lambda'},
-            {'name': 'ConcurrentExecutions', 'namespace': 'AWS/Lambda'},
-            {'name': 'IteratorAge', 'namespace': 'AWS/Lambda'}
-        ]
-    },
-    'DynamoDB': {
-        'namespace': 'AWS/DynamoDB',
-        'dimension_key': 'TableName',
-        'resource_type': 'tables',
-        'list_function': 'list_tables',
-        'metrics': [
-            {'name': 'ConsumedReadCapacityUnits', 'namespace': 'AWS/DynamoDB'},
-            {'name': 'ConsumedWriteCapacityUnits', 'namespace': 'AWS/DynamoDB'},
-            {'name': 'ReadThrottleEvents', 'namespace': 'AWS/DynamoDB'},
-            {'name': 'WriteThrottleEvents', 'namespace': 'AWS/DynamoDB'},
-            {'name': 'SuccessfulRequestLatency', 'namespace': 'AWS/DynamoDB'},
-            {'name': 'SystemErrors', 'namespace': 'AWS/DynamoDB'}
-        ]
-    },
-    'ECS': {
-        'namespace': 'AWS/ECS',
-        'dimension_key': 'ClusterName',
-        'resource_type': 'clusters',
-        'list_function': 'list_clusters',
-        'metrics': [
-            {'name': 'CPUUtilization', 'namespace': 'AWS/ECS'},
-            {'name': 'MemoryUtilization', 'namespace': 'AWS/ECS'},
-            {'name': 'RunningTaskCount', 'namespace': 'AWS/ECS'},
-            {'name': 'PendingTaskCount', 'namespace': 'AWS/ECS'},
-            {'name': 'StorageReadBytes', 'namespace': 'AWS/ECS'},
-            {'name': 'StorageWriteBytes', 'namespace': 'AWS/ECS'}
-        ]
-    },
-    'ElastiCache': {
-        'namespace': 'AWS/ElastiCache',
-        'dimension_key': 'CacheClusterId',
-        'resource_type': 'cache_clusters',
-        'list_function': 'describe_cache_clusters',
-        'metrics': [
-            {'name': 'CPUUtilization', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'FreeableMemory', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'NetworkBytesIn', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'NetworkBytesOut', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'CurrConnections', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'CacheHits', 'namespace': 'AWS/ElastiCache'},
-            {'name': 'CacheMisses', 'namespace': 'AWS/ElastiCache'}
-        ]
-    },
-    'ELB': {
-        'namespace': 'AWS/ELB',
-        'dimension_key': 'LoadBalancerName',
-        'resource_type': 'load_balancers',
-        'list_function': 'describe_load_balancers',
-        'metrics': [
-            {'name': 'RequestCount', 'namespace': 'AWS/ELB'},
-            {'name': 'HealthyHostCount', 'namespace': 'AWS/ELB'},
-            {'name': 'UnHealthyHostCount', 'namespace': 'AWS/ELB'},
-            {'name': 'Latency', 'namespace': 'AWS/ELB'},
-            {'name': 'HTTPCode_Backend_2XX', 'namespace': 'AWS/ELB'},
-            {'name': 'HTTPCode_Backend_5XX', 'namespace': 'AWS/ELB'}
-        ]
-    },
-    'SQS': {
-        'namespace': 'AWS/SQS',
-        'dimension_key': 'QueueName',
-        'resource_type': 'queues',
-        'list_function': 'list_queues',
-        'metrics': [
-            {'name': 'ApproximateNumberOfMessagesVisible', 'namespace': 'AWS/SQS'},
-            {'name': 'ApproximateNumberOfMessagesNotVisible', 'namespace': 'AWS/SQS'},
-            {'name': 'ApproximateAgeOfOldestMessage', 'namespace': 'AWS/SQS'},
-            {'name': 'NumberOfMessagesReceived', 'namespace': 'AWS/SQS'},
-            {'name': 'NumberOfMessagesSent', 'namespace': 'AWS/SQS'},
-            {'name': 'NumberOfMessagesDeleted', 'namespace': 'AWS/SQS'}
-        ]
-    },
-    'S3': {
-        'namespace': 'AWS/S3',
-        'dimension_key': 'BucketName',
-        'resource_type': 'buckets',
-        'list_function': 'list_buckets',
-        'metrics': [
-            {'name': 'BucketSizeBytes', 'namespace': 'AWS/S3'},
-            {'name': 'NumberOfObjects', 'namespace': 'AWS/S3'},
-            {'name': 'AllRequests', 'namespace': 'AWS/S3'},
-            {'name': '4xxErrors', 'namespace': 'AWS/S3'},
-            {'name': '5xxErrors', 'namespace': 'AWS/S3'},
-            {'name': 'FirstByteLatency', 'namespace': 'AWS/S3'},
-            {'name': 'TotalRequestLatency', 'namespace': 'AWS/S3'}
-        ]
-    }
-}
+# Every accounts x regions fan-out shares this pool, so a 30-account sweep stays bounded
+MAX_AWS_WORKERS = 32
+aws_pool = ThreadPoolExecutor(max_workers=MAX_AWS_WORKERS, thread_name_prefix='aws')
+# Throttled attempts are retried after waiting on the shared rate limiter instead of failing the call
+AWS_MAX_ATTEMPTS = 8
+account_registry = AccountRegistry(ACCOUNTS_FILE)
+# Desired configurations and created artefacts, so reconfiguration only writes what changed
+STATE_DB = os.environ.get(
+    'CLOUDWATCH_STATE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state.db')
+)
+state_store = StateStore(STATE_DB)
+DELETE_ALARMS_BATCH_SIZE = 100
+# Metric previews cover the last few hours; identical requests within a minute share one GetMetricData sweep
+PREVIEW_HOURS = 3
+MAX_PREVIEW_HOURS = 72
+PREVIEW_PERIOD_SECONDS = 300
+preview_cache = TTLCache()
+# Alarm names written by _configure_group: {resource_id}-{metric}-{Warning|Critical}
+PORTAL_ALARM_NAME = re.compile(r'^(?P<resource>.+)-(?P<metric>[A-Za-z0-9_]+)-(?:Warning|Critical)$')
+ALARM_FIELDS = ('AlarmName', 'MetricName', 'Namespace', 'Statistic', 'Period', 'EvaluationPeriods', 'Threshold',
+                'ComparisonOperator', 'AlarmActions', 'OKActions', 'AlarmDescription')
+
+
+def _instrument_session(session, account_id):
+    # Runs for the default session too, so every client the cache hands out is measured, traced and limited
+    instrument_session(session)
+    tracing.instrument_session(session)
+    # Limits apply per account, so each assumed-role session gets its own buckets
+    aws_rate_limit.instrument_session(session, account_id)
+
+
+aws_sessions = SessionCache(
+    account_registry,
+    session_hooks=(_instrument_session,),
+    client_config=Config(retries={'mode': 'standard', 'max_attempts': AWS_MAX_ATTEMPTS}),
+)
 
 # Helper function to ensure required IAM role and policies on EC2 instances
-def ensure_instance_role(instance_id: str, region: str) -> None:
+@traced("iam.ensure_instance_role", host="instance_id", region="region", account="account")
+def ensure_instance_role(instance_id: str, region: str, account: str = None) -> None:
     required_policy_arns = [
         'arn:aws:iam::aws:policy/AmazonEC2ReadOnlyAccess',
         'arn:aws:iam::aws:policy/AmazonSNSFullAccess',
@@ -172,8 +85,8 @@ def ensure_instance_role(instance_id: str, region: str) -> None:
         'arn:aws:iam::aws:policy/CloudWatchAgentServerPolicy',
         'arn:aws:iam::aws:policy/CloudWatchFullAccess'
     ]
-    ec2 = create_aws_client('ec2', region)
-    iam = boto3.client('iam')
+    ec2 = create_aws_client('ec2', region, account)
+    iam = create_aws_client('iam', account=account)
     try:
         desc = ec2.describe_instances(InstanceIds=[instance_id])
         instance = desc['Reservations'][0]['Instances'][0]
@@ -203,6 +116,7 @@ def ensure_instance_role(instance_id: str, region: str) -> None:
         role_name = "MonitoringRole"
         _create_and_attach_role(iam, ec2, instance_id, role_name, required_policy_arns)
 
+@traced("iam.create_and_attach_role", host="instance_id", role="role_name")
 def _create_and_attach_role(iam, ec2, instance_id: str, role_name: str, required_policy_arns: List[str]) -> None:
     try:
         iam.get_role(RoleName=role_name)
@@ -228,7 +142,8 @@ def _create_and_attach_role(iam, ec2, instance_id: str, role_name: str, required
     except iam.exceptions.NoSuchEntityException:
         iam.create_instance_profile(InstanceProfileName=instance_profile_name)
         iam.add_role_to_instance_profile(InstanceProfileName=instance_profile_name, RoleName=role_name)
-        time.sleep(10)
+        with span("iam.wait_for_instance_profile"):
+            time.sleep(10)
     profile = iam.get_instance_profile(InstanceProfileName=instance_profile_name)
     profile_arn = profile['InstanceProfile']['Arn']
     associations = ec2.describe_iam_instance_profile_associations(
@@ -303,13 +218,12 @@ def setup_nginx() -> None:
         logger.error(f"Error setting up nginx: {str(e)}")
         raise
     
-def create_aws_client(service: str, region: str = None) -> boto3.client:
+def create_aws_client(service: str, region: str = None, account: str = None) -> boto3.client:
+    # Clients and assumed-role sessions are cached per account; no STS call unless credentials are near expiry
     try:
-        if region:
-            return boto3.client(service, region_name=region)
-        return boto3.client(service)
+        return aws_sessions.client(service, region, account)
     except Exception as e:
-        logger.error(f"Error creating AWS {service} client: {str(e)}")
+        logger.error(f"Error creating AWS {service} client for account {account or DEFAULT_ACCOUNT_ID}: {str(e)}")
         raise
 
 @app.route('/api/services')
@@ -321,17 +235,43 @@ def get_services() -> Dict:
         logger.error(f"Error fetching services: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/accounts')
+def get_accounts() -> Dict:
+    try:
+        return jsonify(aws_sessions.status())
+    except Exception as e:
+        logger.error(f"Error fetching accounts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rate-limits')
+def get_rate_limits() -> Dict:
+    return jsonify(aws_rate_limit.limiter.status())
+
+@app.route('/api/monitoring')
+def get_monitoring() -> Dict:
+    # Answered from the local state store; no describe_alarms sweep
+    try:
+        return jsonify(state_store.configurations(
+            request.args.get('account'), request.args.get('region'), request.args.get('service', '').upper() or None
+        ))
+    except Exception as e:
+        logger.error(f"Error fetching monitoring configurations: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/regions')
 def get_regions() -> Dict:
     try:
-        ec2 = create_aws_client('ec2', region='us-east-1')
-        response = ec2.describe_regions()
-        regions = [region['RegionName'] for region in response['Regions']]
-        return jsonify(regions)
+        return jsonify(aws_sessions.regions(request.args.get('account')))
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching regions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def list_resources(service: str, region: str, account: str = None) -> List[Dict]:
+    """Resources of one service in one account and region; EC2 instances in every state."""
+    return aws_services.list_resources(create_aws_client(service.lower(), region, account), service, region)
+
 @app.route('/api/resources/<service>', methods=['GET'])
 def get_resources_all_regions(service: str) -> dict:
     try:
@@ -340,121 +280,52 @@ def get_resources_all_regions(service: str) -> dict:
         if not service_config:
             return jsonify({'error': 'Invalid service'}), 400
 
-        ec2 = create_aws_client('ec2', region='us-east-1')
-        response = ec2.describe_regions()
-        regions = [region['RegionName'] for region in response['Regions']]
+        # ?accounts=a,b limits discovery to those accounts; all registered accounts by default
+        account_ids = [a.strip() for a in request.args.get('accounts', '').split(',') if a.strip()]
+        try:
+            accounts = [account_registry.get(a) for a in account_ids] if account_ids else account_registry.accounts()
+        except KeyError as e:
+            return jsonify({'error': str(e)}), 400
         resources = []
 
-        def fetch_resources_for_region(region):
-            region_resources = []
+        def fetch_resources_for_region(account, region):
             try:
-                # Use service.lower() for the client name.
-                client = create_aws_client(service.lower(), region)
-                if service.lower() == 'ec2':
-                    instances = client.describe_instances()['Reservations']
-                    for reservation in instances:
-                        for instance in reservation['Instances']:
-                            if instance['State']['Name'] == 'running':
-                                region_resources.append({
-                                    'Id': instance['InstanceId'],
-                                    'Type': instance['InstanceType'],
-                                    'State': instance['State']['Name'],
-                                    'Name': next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'Unnamed'),
-                                    'PublicIpAddress': instance.get('PublicIpAddress'),
-                                    'PrivateIpAddress': instance.get('PrivateIpAddress'),
-                                    'Region': region
-                                })
-                elif service.lower() == 'rds':
-                    instances = client.describe_db_instances()['DBInstances']
-                    for instance in instances:
-                        region_resources.append({
-                            'Id': instance['DBInstanceIdentifier'],
-                            'Type': instance['DBInstanceClass'],
-                            'State': instance['DBInstanceStatus'],
-                            'Name': instance.get('DBName', instance['DBInstanceIdentifier']),
-                            'Region': region
-                        })
-                elif service.lower() == 'lambda':
-                    functions = client.list_functions()['Functions']
-                    for function in functions:
-                        region_resources.append({
-                            'Id': function['FunctionName'],
-                            'Type': function.get('Runtime', ''),
-                            'State': function.get('State', 'Active'),
-                            'Name': function['FunctionName'],
-                            'Region': region
-                        })
-                elif service.lower() == 'dynamodb':
-                    tables = client.list_tables()['TableNames']
-                    for table in tables:
-                        region_resources.append({
-                            'Id': table,
-                            'Type': 'DynamoDB Table',
-                            'State': 'Active',
-                            'Name': table,
-                            'Region': region
-                        })
-                elif service.lower() == 'ecs':
-                    clusters = client.list_clusters()['clusterArns']
-                    for cluster_arn in clusters:
-                        cluster_name = cluster_arn.split('/')[-1]
-                        region_resources.append({
-                            'Id': cluster_name,
-                            'Type': 'ECS Cluster',
-                            'State': 'Active',
-                            'Name': cluster_name,
-                            'Region': region
-                        })
-                elif service.lower() == 'elasticache':
-                    clusters = client.describe_cache_clusters()['CacheClusters']
-                    for cluster in clusters:
-                        region_resources.append({
-                            'Id': cluster['CacheClusterId'],
-                            'Type': cluster['Engine'],
-                            'State': cluster['CacheClusterStatus'],
-                            'Name': cluster['CacheClusterId'],
-                            'Region': region
-                        })
-                elif service.lower() == 'elb':
-                    lbs = client.describe_load_balancers()['LoadBalancerDescriptions']
-                    for lb in lbs:
-                        region_resources.append({
-                            'Id': lb['LoadBalancerName'],
-                            'Type': 'Classic Load Balancer',
-                            'State': 'Active',
-                            'Name': lb['LoadBalancerName'],
-                            'Region': region
-                        })
-                elif service.lower() == 'sqs':
-                    queues = client.list_queues()['QueueUrls']
-                    for queue in queues:
-                        queue_name = queue.split('/')[-1]
-                        region_resources.append({
-                            'Id': queue_name,
-                            'Type': 'SQS Queue',
-                            'State': 'Active',
-                            'Name': queue_name,
-                            'Region': region
-                        })
-                elif service.lower() == 's3':
-                    buckets = client.list_buckets()['Buckets']
-                    for bucket in buckets:
-                        region_resources.append({
-                            'Id': bucket['Name'],
-                            'Type': 'S3 Bucket',
-                            'State': 'Active',
-                            'Name': bucket['Name'],
-                            'Region': region
-                        })
+                region_resources = list_resources(service, region, account['id'])
             except Exception as region_error:
-                logger.warning(f"Could not fetch resources for service {service} in region {region}: {str(region_error)}")
-            return region_resources
-
-        with ThreadPoolExecutor(max_workers=len(regions)) as executor:
-            future_to_region = {executor.submit(fetch_resources_for_region, region): region for region in regions}
-            for future in as_completed(future_to_region):
-                resources.extend(future.result())
-        return jsonify(resources)
+                logger.warning(f"Could not fetch resources for service {service} in account {account['id']} region {region}: {str(region_error)}")
+                return [], f"{account['id']}:{region}"
+            if service.lower() == 'ec2':
+                region_resources = [r for r in region_resources if r['State'] == 'running']
+            for resource in region_resources:
+                resource['Account'] = account['id']
+                resource['AccountName'] = account['name']
+            return region_resources, None
+
+        # Region lists are cached per account, then every account x region pair goes through the shared pool
+        targets, errors = [], []
+        region_futures = {aws_pool.submit(aws_sessions.regions, account['id']): account for account in accounts}
+        for future in as_completed(region_futures):
+            account = region_futures[future]
+            try:
+                targets.extend((account, region) for region in future.result())
+            except Exception as e:
+                logger.warning(f"Could not list regions for account {account['id']}: {str(e)}")
+                errors.append(f"{account['id']}: {str(e)}")
+        if not targets and errors:
+            return jsonify({'error': '; '.join(errors)}), 500
+
+        futures = [aws_pool.submit(fetch_resources_for_region, account, region) for account, region in targets]
+        failed = []
+        for future in as_completed(futures):
+            region_resources, failure = future.result()
+            resources.extend(region_resources)
+            if failure:
+                failed.append(failure)
+        response = make_response(jsonify(resources))
+        # Regions that still failed after retries are reported rather than silently missing from the list
+        if failed:
+            response.headers['X-Failed-Regions'] = ','.join(sorted(failed))
+        return response
     except Exception as e:
         logger.error(f"Error fetching resources for {service} across all regions: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -471,8 +342,111 @@ def get_metrics(service: str) -> Dict:
         logger.error(f"Error fetching metrics for {service}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics/<service>/preview', methods=['POST'])
+def preview_metrics(service: str) -> Dict:
+    """Recent datapoints, percentiles and suggested thresholds for the selected resources x metrics."""
+    try:
+        service_config = next((AWS_SERVICES[k] for k in AWS_SERVICES if k.lower() == service.lower()), None)
+        if not service_config:
+            return jsonify({'error': 'Invalid service'}), 400
+        data = request.get_json(silent=True) or {}
+        resources = data.get('resources') or []
+        if not resources:
+            return jsonify({'error': 'Missing required field: resources'}), 400
+        metrics = data.get('metrics') or service_config['metrics']
+        try:
+            hours = min(float(data.get('hours', PREVIEW_HOURS)), MAX_PREVIEW_HOURS)
+            period = max(60, int(data.get('period', PREVIEW_PERIOD_SECONDS)) // 60 * 60)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'hours and period must be numbers'}), 400
+        start, end = time_window(hours, period)
+
+        # One batch of queries per account and region, like /api/configure
+        default_account = data.get('account') or DEFAULT_ACCOUNT_ID
+        groups = {}
+        for resource in resources:
+            if isinstance(resource, dict):
+                key = (resource.get('Account') or default_account, resource.get('Region') or data.get('region'))
+                resource_id = resource['Id']
+            else:
+                key = (default_account, data.get('region'))
+                resource_id = resource
+            for metric in metrics:
+                groups.setdefault(key, []).append(
+                    (resource_id, metric, metric_dimensions(resource_id, metric, service_config))
+                )
+
+        futures = {
+            aws_pool.submit(tracing.bind(_preview_group), account_id, region, group_series, period, start, end):
+                (account_id, region, group_series)
+            for (account_id, region), group_series in groups.items()
+        }
+        series, errors, samples = [], [], {}
+        for future in as_completed(futures):
+            account_id, region, group_series = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.warning(f"Could not preview metrics in account {account_id} region {region}: {str(e)}")
+                errors.append(f"{account_id}:{region}: {str(e)}")
+                continue
+            for index, (resource_id, metric, _) in enumerate(group_series):
+                timestamps, values = results.get(f"m{index}", ([], []))
+                samples.setdefault(metric['name'], []).extend(values)
+                series.append({
+                    'account': account_id,
+                    'region': region,
+                    'resource': resource_id,
+                    'metric': metric['name'],
+                    'namespace': metric['namespace'],
+                    'timestamps': timestamps,
+                    'values': [round(value, 4) for value in values],
+                    'summary': summarize(values),
+                })
+        if errors and not series:
+            return jsonify({'error': '; '.join(errors)}), 500
+
+        return jsonify({
+            'start': int(start.timestamp()),
+            'end': int(end.timestamp()),
+            'period': period,
+            'series': series,
+            'suggestions': {name: suggest_thresholds(name, values) for name, values in samples.items()},
+            'errors': errors,
+        })
+    except Exception as e:
+        logger.error(f"Error previewing metrics for {service}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _preview_group(account: str, region: str, series: List, period: int, start, end) -> Dict:
+    queries = build_queries(series, period)
+    key = (account, region, period, start.timestamp(), end.timestamp(), content_hash(queries))
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached
+    with span("get_metric_data", account=account, region=region, queries=len(queries)):
+        results = fetch(create_aws_client('cloudwatch', region, account), queries, start, end)
+    preview_cache.put(key, results)
+    return results
+
 @app.route('/api/configure', methods=['POST'])
 def configure_monitoring():
+    # Every phase and AWS/SSH call of the job becomes a span; the trace ID comes back in a header
+    with start_trace('configure_monitoring') as trace:
+        response = make_response(_configure_monitoring())
+        if response.status_code >= 400:
+            current_span().set_error(response.get_data(as_text=True))
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.route('/api/traces/<trace_id>')
+def get_trace(trace_id: str):
+    trace = load_trace(trace_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(trace)
+
+def _configure_monitoring():
     try:
         # Parse incoming data and process file uploads if any
         if request.content_type.startswith('multipart/form-data'):
@@ -483,10 +457,11 @@ def configure_monitoring():
             uploaded_keys = {}
             upload_folder = os.path.join(os.getcwd(), 'uploaded_keys')
             os.makedirs(upload_folder, exist_ok=True)
-            for field_name, file in request.files.items():
-                file_path = os.path.join(upload_folder, file.filename)
-                file.save(file_path)
-                uploaded_keys[field_name] = file_path
+            with span("save_uploads", files=len(request.files)):
+                for field_name, file in request.files.items():
+                    file_path = os.path.join(upload_folder, file.filename)
+                    file.save(file_path)
+                    uploaded_keys[field_name] = file_path
             data['uploaded_keys'] = uploaded_keys
         else:
             data = request.get_json()
@@ -503,198 +478,426 @@ def configure_monitoring():
         region = data['region']
         service = data['service'].upper()
         resources = data['resources']
-        metrics = data['metrics']
-        alerts = data['alerts']
-        thresholds = data['thresholds']
 
         service_config = AWS_SERVICES.get(service)
         if not service_config:
             return jsonify({'error': 'Invalid service'}), 400
 
-        sns = create_aws_client('sns', region)
-        cloudwatch = create_aws_client('cloudwatch', region)
+        # Resources from /api/resources carry their account and region; each pair is configured separately
+        default_account = data.get('account') or DEFAULT_ACCOUNT_ID
+        groups = {}
+        for resource in resources:
+            if isinstance(resource, dict):
+                key = (resource.get('Account') or default_account, resource.get('Region') or region)
+            else:
+                key = (default_account, region)
+            groups.setdefault(key, []).append(resource)
+        if not groups:
+            groups[(default_account, region)] = []
+        for account_id, _ in groups:
+            try:
+                account_registry.get(account_id)
+            except KeyError as e:
+                return jsonify({'error': str(e)}), 400
+
+        futures = [
+            aws_pool.submit(tracing.bind(_configure_group), account_id, group_region, group_resources,
+                            service, service_config, data)
+            for (account_id, group_region), group_resources in groups.items()
+        ]
+        results = [future.result() for future in futures]
 
-        # Compute resource IDs and add fallback if empty
-        resource_ids = [r['Id'] if isinstance(r, dict) and 'Id' in r else r for r in resources]
-        if not resource_ids or all(not str(r).strip() for r in resource_ids):
-            resource_ids = ['None']
-        dashboard_name = f"{service}-Monitor_{'-'.join(resource_ids)}"
-        topic_name = f"{service}_Monitoring_Alerts_{'-'.join(resource_ids)}"
+        failed = [result for result in results if 'error' in result]
+        if failed:
+            return jsonify({'error': failed[0]['error'], 'groups': results}), 500
 
-        try:
-            topic_response = sns.create_topic(Name=topic_name)
-            topic_arn = topic_response['TopicArn']
-        except ClientError as e:
-            logger.error(f"Error creating SNS topic: {str(e)}")
-            return jsonify({'error': f'Failed to create SNS topic: {str(e)}'}), 500
-
-        alarm_arns = []
-        if alerts:
-            for resource in resources:
-                resource_id = resource['Id'] if isinstance(resource, dict) else resource
-                for metric in metrics:
+        response = {key: value for key, value in results[0].items() if key not in ('account', 'region')}
+        response['message'] = 'Monitoring configured successfully!'
+        if len(results) > 1:
+            response['groups'] = results
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error(f"Unexpected error in configure_monitoring: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+def metric_dimensions(resource_id: str, metric: Dict, service_config: Dict) -> List[Dict]:
+    """Dimensions that identify one resource's metric, as used by its alarms and previews."""
+    dimensions = [{'Name': service_config['dimension_key'], 'Value': resource_id}]
+    if 'dimension' in metric:
+        dimensions.append(metric['dimension'])
+    if metric['namespace'] == 'CWAgent':
+        dimensions = [{'Name': 'InstanceId', 'Value': resource_id}]
+        if metric['name'] == 'DiskSpaceUtilization':
+            dimensions.extend([
+                {'Name': 'path', 'Value': '/'},
+                {'Name': 'device', 'Value': 'xvda1'},
+                {'Name': 'fstype', 'Value': 'ext4'}
+            ])
+    return dimensions
+
+def alarm_configs(resource_id: str, metric: Dict, thresholds: Dict, service_config: Dict, topic_arn: str) -> List[Dict]:
+    """put_metric_alarm arguments for the warning and critical alarm of one resource and metric."""
+    dimensions = metric_dimensions(resource_id, metric, service_config)
+    configs = []
+    for level in ('Warning', 'Critical'):
+        configs.append({
+            'AlarmName': f"{resource_id}-{metric['name']}-{level}",
+            'MetricName': metric['name'],
+            'Namespace': metric['namespace'],
+            'Statistic': 'Average',
+            'Period': 300,
+            'EvaluationPeriods': 2,
+            'Threshold': float(thresholds[metric['name']][level.lower()]),
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'AlarmActions': [topic_arn],
+            'OKActions': [topic_arn],
+            'Dimensions': dimensions,
+            'AlarmDescription': f'{level} threshold exceeded for {metric["name"]} on {resource_id}'
+        })
+    return configs
+
+def delete_alarms(cloudwatch, names: List[str]) -> None:
+    # DeleteAlarms accepts at most 100 names per call
+    for start in range(0, len(names), DELETE_ALARMS_BATCH_SIZE):
+        cloudwatch.delete_alarms(AlarmNames=names[start:start + DELETE_ALARMS_BATCH_SIZE])
+
+def _configure_group(account: str, region: str, resources: List, service: str, service_config: Dict, data: Dict) -> Dict:
+    """Topic, alarms, IAM, agent rollout and dashboard for the resources of one account and region."""
+    metrics = data['metrics']
+    alerts = data['alerts']
+    thresholds = data['thresholds']
+    result = {'account': account, 'region': region}
+    try:
+        # Alarm, IAM and dashboard writes queue behind interactive discovery calls on the shared limiter
+        with aws_rate_limit.priority(aws_rate_limit.BULK), \
+                span("configure_group", account=account, region=region, resources=len(resources)):
+            sns = create_aws_client('sns', region, account)
+            cloudwatch = create_aws_client('cloudwatch', region, account)
+
+            # Compute resource IDs and add fallback if empty
+            resource_ids = [r['Id'] if isinstance(r, dict) and 'Id' in r else r for r in resources]
+            if not resource_ids or all(not str(r).strip() for r in resource_ids):
+                resource_ids = ['None']
+            dashboard_name = f"{service}-Monitor_{'-'.join(resource_ids)}"
+            topic_name = f"{service}_Monitoring_Alerts_{'-'.join(resource_ids)}"
+
+            # Artefacts written by earlier runs; unchanged ones are skipped unless the request sets "force"
+            force = bool(data.get('force'))
+            stored = state_store.artefacts(account, region)
+            changes = {'alarmsWritten': 0, 'alarmsUnchanged': 0, 'alarmsDeleted': 0, 'dashboardWritten': False}
+
+            stored_topic = None if force else stored.get(('topic', topic_name))
+            with span("sns.create_topic", topic=topic_name, cached=bool(stored_topic)):
+                if stored_topic:
+                    topic_arn = stored_topic['arn']
+                else:
+                    try:
+                        topic_response = sns.create_topic(Name=topic_name)
+                        topic_arn = topic_response['TopicArn']
+                    except ClientError as e:
+                        logger.error(f"Error creating SNS topic: {str(e)}")
+                        return {**result, 'error': f'Failed to create SNS topic: {str(e)}'}
+                    state_store.record_artefacts(account, region, dashboard_name, 'topic',
+                                                 [(topic_name, topic_arn, None, None)])
+
+            alarm_arns = []
+            with span("alarms", resources=len(resources), metrics=len(metrics)):
+                if alerts:
+                    for resource in resources:
+                        resource_id = resource['Id'] if isinstance(resource, dict) else resource
+                        with span("alarms.resource", resource=resource_id):
+                            written = []
+                            try:
+                                for metric in metrics:
+                                    for alarm_config in alarm_configs(resource_id, metric, thresholds,
+                                                                      service_config, topic_arn):
+                                        alarm_name = alarm_config['AlarmName']
+                                        alarm_arns.append(alarm_name)
+                                        digest = content_hash(alarm_config)
+                                        known = stored.get(('alarm', alarm_name))
+                                        if not force and known and known['content_hash'] == digest:
+                                            changes['alarmsUnchanged'] += 1
+                                            continue
+                                        cloudwatch.put_metric_alarm(**alarm_config)
+                                        written.append((alarm_name, alarm_arn(topic_arn, region, alarm_name),
+                                                        digest, alarm_config))
+                            except ClientError as e:
+                                logger.error(f"Error creating alarms for {resource_id}: {str(e)}")
+                                return {**result, 'error': f'Failed to create alarms for {resource_id}: {str(e)}'}
+                            finally:
+                                state_store.record_artefacts(account, region, dashboard_name, 'alarm', written)
+                            changes['alarmsWritten'] += len(written)
+
+                # Alarms this configuration created before but no longer wants, e.g. a deselected metric
+                wanted = set(alarm_arns)
+                stale = [name for (kind, name), row in stored.items()
+                         if kind == 'alarm' and row['configuration'] == dashboard_name and name not in wanted]
+                if stale:
                     try:
-                        dimensions = [{'Name': service_config['dimension_key'], 'Value': resource_id}]
-                        if 'dimension' in metric:
-                            dimensions.append(metric['dimension'])
+                        delete_alarms(cloudwatch, stale)
+                    except ClientError as e:
+                        logger.error(f"Error deleting stale alarms: {str(e)}")
+                        return {**result, 'error': f'Failed to delete stale alarms: {str(e)}'}
+                    state_store.remove_artefacts(account, region, 'alarm', stale)
+                    changes['alarmsDeleted'] = len(stale)
+
+            # Ensure IAM roles are correct for EC2 instances.
+            if service == 'EC2':
+                with span("iam", instances=len(resources)):
+                    for resource in resources:
+                        instance_id = resource['Id']
+                        ensure_instance_role(instance_id, region, account)
+                for resource in resources:
+                    if isinstance(resource, dict):
+                        resource_id = resource.get('Id')
+                        ip_address = resource.get('PrivateIpAddress')
+                    else:
+                        resource_id = resource
+                        ip_address = None
+
+                    if not ip_address:
+                        logger.error(f"No private IP found for resource: {resource_id}")
+                        continue
+
+                    key_field = f"key_{resource_id}"
+                    key_path = data.get('uploaded_keys', {}).get(key_field)
+                    if not key_path:
+                        logger.error(f"No key file found for resource: {resource_id}")
+                        continue
+
+                    with span("agent_rollout", host=ip_address, resource=resource_id):
+                        try:
+                            os.chmod(key_path, 0o400)
+                            key = paramiko.RSAKey.from_private_key_file(key_path)
+                            ssh = paramiko.SSHClient()
+                            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                            with track_ssh("connect"):
+                                ssh.connect(ip_address, username="ubuntu", pkey=key)
+
+                            check_cmd = "if [ -x /opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl ]; then echo 'installed'; else echo 'not installed'; fi"
+                            with track_ssh("check"):
+                                stdin, stdout, stderr = ssh.exec_command(check_cmd)
+                                status = stdout.read().decode('utf-8').strip()
+                            if status == 'installed':
+                                logger.info(f"CloudWatch agent already installed on {resource_id}, skipping installation.")
+                                ssh.close()
+                                continue
+
+                            with track_ssh("upload"):
+                                sftp = ssh.open_sftp()
+                                local_script_path = os.path.join(os.path.dirname(__file__), "install_cloudwatchagent.sh")
+                                remote_script_path = "/home/ubuntu/install_cloudwatchagent.sh"
+                                sftp.put(local_script_path, remote_script_path)
+                                sftp.close()
+
+                            agent_command = f"chmod +x {remote_script_path} && sudo bash {remote_script_path}"
+                            with track_ssh("install"):
+                                stdin, stdout, stderr = ssh.exec_command(agent_command)
+                                exit_status = stdout.channel.recv_exit_status()
+                                output = stdout.read().decode('utf-8')
+                                errors = stderr.read().decode('utf-8')
+                            if exit_status != 0:
+                                logger.error(f"SSH command on {resource_id} failed with status {exit_status}. Errors: {errors}")
+                            else:
+                                logger.info(f"SSH command on {resource_id} succeeded with status {exit_status}. Output: {output}")
+                            ssh.close()
+                        except Exception as e:
+                            logger.error(f"Error running agent command on {resource_id}: {str(e)}")
+                            current_span().set_error(e)
+            else:
+                logger.info(f"Skipping CloudWatch agent installation since service is {service} (not EC2).")
+
+            # Dashboard creation
+            with span("dashboard", dashboard=dashboard_name, widgets=len(metrics)):
+                widgets = []
+                for metric in metrics:
+                    metric_data = [[metric['namespace'], metric['name']]]
+                    for resource in resources:
+                        resource_id = resource['Id'] if isinstance(resource, dict) else resource
+                        dimensions = [[service_config['dimension_key'], resource_id]]
                         if metric['namespace'] == 'CWAgent':
-                            dimensions = [{'Name': 'InstanceId', 'Value': resource_id}]
+                            dimensions = [['InstanceId', resource_id]]
                             if metric['name'] == 'DiskSpaceUtilization':
-                                dimensions.extend([
-                                    {'Name': 'path', 'Value': '/'},
-                                    {'Name': 'device', 'Value': 'xvda1'},
-                                    {'Name': 'fstype', 'Value': 'ext4'}
-                                ])
-                        warning_alarm_name = f"{resource_id}-{metric['name']}-Warning"
-                        warning_alarm_config = {
-                            'AlarmName': warning_alarm_name,
-                            'MetricName': metric['name'],
-                            'Namespace': metric['namespace'],
-                            'Statistic': 'Average',
-                            'Period': 300,
-                            'EvaluationPeriods': 2,
-                            'Threshold': float(thresholds[metric['name']]['warning']),
-                            'ComparisonOperator': 'GreaterThanThreshold',
-                            'AlarmActions': [topic_arn],
-                            'OKActions': [topic_arn],
-                            'Dimensions': dimensions,
-                            'AlarmDescription': f'Warning threshold exceeded for {metric["name"]} on {resource_id}'
-                        }
-                        cloudwatch.put_metric_alarm(**warning_alarm_config)
-                        alarm_arns.append(warning_alarm_name)
-
-                        critical_alarm_name = f"{resource_id}-{metric['name']}-Critical"
-                        critical_alarm_config = {
-                            'AlarmName': critical_alarm_name,
-                            'MetricName': metric['name'],
-                            'Namespace': metric['namespace'],
-                            'Statistic': 'Average',
-                            'Period': 300,
-                            'EvaluationPeriods': 2,
-                            'Threshold': float(thresholds[metric['name']]['critical']),
-                            'ComparisonOperator': 'GreaterThanThreshold',
-                            'AlarmActions': [topic_arn],
-                            'OKActions': [topic_arn],
-                            'Dimensions': dimensions,
-                            'AlarmDescription': f'Critical threshold exceeded for {metric["name"]} on {resource_id}'
+                                dimensions.append(['path', '/'])
+                                dimensions.append(['device', 'xvda1'])
+                                dimensions.append(['fstype', 'ext4'])
+                        metric_data.append([metric['namespace'], metric['name'],
+                                            *[item for dim in dimensions for item in [dim[0], dim[1]]]])
+                    widgets.append({
+                        "type": "metric",
+                        "x": 0,
+                        "y": len(widgets) * 6,
+                        "width": 24,
+                        "height": 6,
+                        "properties": {
+                            "metrics": metric_data,
+                            "period": 300,
+                            "stat": "Average",
+                            "region": region,
+                            "title": f"{metric['name']} across {len(resources)} instances"
                         }
-                        cloudwatch.put_metric_alarm(**critical_alarm_config)
-                        alarm_arns.append(critical_alarm_name)
+                    })
+                dashboard_body = json.dumps({"widgets": widgets})
+                digest = content_hash(dashboard_body)
+                known = stored.get(('dashboard', dashboard_name))
+                if force or not known or known['content_hash'] != digest:
+                    try:
+                        response = cloudwatch.put_dashboard(
+                            DashboardName=dashboard_name,
+                            DashboardBody=dashboard_body
+                        )
+                        logger.info(f"Dashboard creation response: {response}")
                     except ClientError as e:
-                        logger.error(f"Error creating alarms for {resource_id}: {str(e)}")
-                        return jsonify({'error': f'Failed to create alarms for {resource_id}: {str(e)}'}), 500
-
-        # Ensure IAM roles are correct for EC2 instances.
-        if service == 'EC2':
-            for resource in resources:
-                instance_id = resource['Id']
-                ensure_instance_role(instance_id, region)
-            for resource in resources:
-                if isinstance(resource, dict):
-                    resource_id = resource.get('Id')
-                    ip_address = resource.get('PrivateIpAddress')
-                else:
-                    resource_id = resource
-                    ip_address = None
-
-                if not ip_address:
-                    logger.error(f"No private IP found for resource: {resource_id}")
-                    continue
-
-                key_field = f"key_{resource_id}"
-                key_path = data.get('uploaded_keys', {}).get(key_field)
-                if not key_path:
-                    logger.error(f"No key file found for resource: {resource_id}")
-                    continue
-
-                try:
-                    os.chmod(key_path, 0o400)
-                    key = paramiko.RSAKey.from_private_key_file(key_path)
-                    ssh = paramiko.SSHClient()
-                    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                    ssh.connect(ip_address, username="ubuntu", pkey=key)
-
-                    check_cmd = "if [ -x /opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl ]; then echo 'installed'; else echo 'not installed'; fi"
-                    stdin, stdout, stderr = ssh.exec_command(check_cmd)
-                    status = stdout.read().decode('utf-8').strip()
-                    if status == 'installed':
-                        logger.info(f"CloudWatch agent already installed on {resource_id}, skipping installation.")
-                        ssh.close()
-                        continue
-
-                    sftp = ssh.open_sftp()
-                    local_script_path = os.path.join(os.path.dirname(__file__), "install_cloudwatchagent.sh")
-                    remote_script_path = "/home/ubuntu/install_cloudwatchagent.sh"
-                    sftp.put(local_script_path, remote_script_path)
-                    sftp.close()
-
-                    agent_command = f"chmod +x {remote_script_path} && sudo bash {remote_script_path}"
-                    stdin, stdout, stderr = ssh.exec_command(agent_command)
-                    exit_status = stdout.channel.recv_exit_status()
-                    output = stdout.read().decode('utf-8')
-                    errors = stderr.read().decode('utf-8')
-                    if exit_status != 0:
-                        logger.error(f"SSH command on {resource_id} failed with status {exit_status}. Errors: {errors}")
-                    else:
-                        logger.info(f"SSH command on {resource_id} succeeded with status {exit_status}. Output: {output}")
-                    ssh.close()
-                except Exception as e:
-                    logger.error(f"Error running agent command on {resource_id}: {str(e)}")
-        else:
-            logger.info(f"Skipping CloudWatch agent installation since service is {service} (not EC2).")
-
-        # Dashboard creation
-        widgets = []
-        for metric in metrics:
-            metric_data = [[metric['namespace'], metric['name']]]
-            for resource in resources:
-                resource_id = resource['Id'] if isinstance(resource, dict) else resource
-                dimensions = [[service_config['dimension_key'], resource_id]]
-                if metric['namespace'] == 'CWAgent':
-                    dimensions = [['InstanceId', resource_id]]
-                    if metric['name'] == 'DiskSpaceUtilization':
-                        dimensions.append(['path', '/'])
-                        dimensions.append(['device', 'xvda1'])
-                        dimensions.append(['fstype', 'ext4'])
-                metric_data.append([metric['namespace'], metric['name'],
-                                    *[item for dim in dimensions for item in [dim[0], dim[1]]]])
-            widgets.append({
-                "type": "metric",
-                "x": 0,
-                "y": len(widgets) * 6,
-                "width": 24,
-                "height": 6,
-                "properties": {
-                    "metrics": metric_data,
-                    "period": 300,
-                    "stat": "Average",
-                    "region": region,
-                    "title": f"{metric['name']} across {len(resources)} instances"
-                }
+                        logger.error(f"Error creating dashboard: {str(e)}")
+                        return {**result, 'error': f'Failed to create dashboard: {str(e)}'}
+                    state_store.record_artefacts(account, region, dashboard_name, 'dashboard',
+                                                 [(dashboard_name, dashboard_arn(topic_arn, dashboard_name), digest, None)])
+                    changes['dashboardWritten'] = True
+
+            state_store.record_configuration(account, region, dashboard_name, service, {
+                'resources': resource_ids,
+                'metrics': metrics,
+                'thresholds': thresholds,
+                'alerts': alerts,
+                'topicArn': topic_arn,
             })
-        try:
-            response = cloudwatch.put_dashboard(
-                DashboardName=dashboard_name,
-                DashboardBody=json.dumps({"widgets": widgets})
-            )
-            logger.info(f"Dashboard creation response: {response}")
-        except ClientError as e:
-            logger.error(f"Error creating dashboard: {str(e)}")
-            return jsonify({'error': f'Failed to create dashboard: {str(e)}'}), 500
 
-        return jsonify({
-            'message': 'Monitoring configured successfully!',
+        return {
+            **result,
             'snsTopicArn': topic_arn,
             'topicName': topic_name,
             'dashboardName': dashboard_name,
             'dashboardUrl': f"https://{region}.console.aws.amazon.com/cloudwatch/home?region={region}#dashboards:name={dashboard_name}",
-            'alarms': alarm_arns
-        })
+            'alarms': alarm_arns,
+            'changes': changes
+        }
 
     except Exception as e:
-        logger.error(f"Unexpected error in configure_monitoring: {str(e)}")
+        logger.error(f"Unexpected error configuring account {account} region {region}: {str(e)}")
+        return {**result, 'error': f'Unexpected error: {str(e)}'}
+
+@app.route('/api/alarms/reconcile', methods=['POST'])
+def reconcile_alarms():
+    """Find orphaned and drifted portal alarms; fix and delete them unless ``dry_run`` (the default)."""
+    with start_trace('reconcile_alarms') as trace:
+        response = make_response(_reconcile_alarms())
+        if response.status_code >= 400:
+            current_span().set_error(response.get_data(as_text=True))
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+def _reconcile_alarms():
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = data.get('dry_run', True) is not False
+        try:
+            accounts = [account_registry.get(a) for a in data['accounts']] if data.get('accounts') \
+                else account_registry.accounts()
+        except KeyError as e:
+            return jsonify({'error': str(e)}), 400
+
+        targets = []
+        for account in accounts:
+            regions = data.get('regions') or aws_sessions.regions(account['id'])
+            targets.extend((account['id'], region) for region in regions)
+        futures = [aws_pool.submit(tracing.bind(_reconcile_region), account_id, region, dry_run)
+                   for account_id, region in targets]
+        reports = [future.result() for future in futures]
+
+        summary = {key: sum(len(r[key]) if isinstance(r[key], list) else r[key] for r in reports)
+                   for key in ('scanned', 'orphaned', 'drifted', 'missing', 'deleted', 'repaired', 'errors')}
+        return jsonify({'dry_run': dry_run, 'summary': summary, 'groups': reports})
+    except Exception as e:
+        logger.error(f"Unexpected error reconciling alarms: {str(e)}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
+def _portal_alarm(alarm: Dict):
+    """(service, resource ID) of an alarm named and shaped the way _configure_group creates them, else None."""
+    match = PORTAL_ALARM_NAME.match(alarm['AlarmName'])
+    if not match or match['metric'] != alarm.get('MetricName'):
+        return None
+    dimensions = {d['Name']: d['Value'] for d in alarm.get('Dimensions', [])}
+    for service, service_config in AWS_SERVICES.items():
+        key = 'InstanceId' if alarm.get('Namespace') == 'CWAgent' else service_config['dimension_key']
+        if dimensions.get(key) != match['resource']:
+            continue
+        if any(m['name'] == alarm['MetricName'] and m['namespace'] == alarm.get('Namespace')
+               for m in service_config['metrics']):
+            return service, match['resource']
+    return None
+
+def _alarm_fingerprint(alarm: Dict) -> str:
+    """Hash of the fields _configure_group sets, comparable between describe_alarms output and a stored spec."""
+    fields = {key: alarm.get(key) for key in ALARM_FIELDS}
+    fields['Threshold'] = float(fields['Threshold']) if fields['Threshold'] is not None else None
+    fields['Dimensions'] = sorted((d['Name'], d['Value']) for d in alarm.get('Dimensions', []))
+    return content_hash(fields)
+
+def _reconcile_region(account: str, region: str, dry_run: bool) -> Dict:
+    """Join one account and region's alarms against its live inventory and the state store."""
+    report = {'account': account, 'region': region, 'scanned': 0, 'orphaned': [], 'drifted': [], 'missing': [],
+              'deleted': 0, 'repaired': 0, 'errors': []}
+    try:
+        with aws_rate_limit.priority(aws_rate_limit.BULK), span("reconcile_region", account=account, region=region):
+            cloudwatch = create_aws_client('cloudwatch', region, account)
+            with span("describe_alarms"):
+                alarms = {}
+                for alarm in all_pages(cloudwatch, 'describe_alarms', 'MetricAlarms', PageSize=100):
+                    alarms[alarm['AlarmName']] = alarm
+            report['scanned'] = len(alarms)
+            stored = {name: row for (_, name), row in state_store.artefacts(account, region, kind='alarm').items()}
+            specs = {name: json.loads(row['spec']) for name, row in stored.items() if row.get('spec')}
+
+            # Alarms created by the portal: recorded in the store, or shaped like ours and notifying a portal topic
+            owners = {}
+            for name, alarm in alarms.items():
+                owner = _portal_alarm(alarm)
+                if owner and (name in stored or any(f":{owner[0]}_Monitoring_Alerts_" in arn
+                                                    for arn in alarm.get('AlarmActions', []))):
+                    owners[name] = owner
+            for name, spec in specs.items():
+                if name not in owners:
+                    owner = _portal_alarm(spec)
+                    if owner:
+                        owners[name] = owner
+
+            live = {}
+            with span("inventory", services=len({service for service, _ in owners.values()})):
+                for service in sorted({service for service, _ in owners.values()}):
+                    try:
+                        live[service] = {r['Id'] for r in list_resources(service, region, account)
+                                         if r['State'] not in GONE_STATES}
+                    except Exception as e:
+                        # Without the inventory nothing of this service can be called orphaned
+                        logger.warning(f"Could not list {service} in account {account} region {region}: {str(e)}")
+                        report['errors'].append(f"{service}: {str(e)}")
+
+            gone = {name for name, (service, resource_id) in owners.items()
+                    if service in live and resource_id not in live[service]}
+            report['orphaned'] = sorted(name for name in gone if name in alarms)
+            report['drifted'] = sorted(name for name, spec in specs.items()
+                                       if name in alarms and name not in gone
+                                       and _alarm_fingerprint(alarms[name]) != _alarm_fingerprint(spec))
+            report['missing'] = sorted(name for name in specs
+                                       if name not in alarms and name in owners and name not in gone
+                                       and owners[name][0] in live)
+            if dry_run:
+                return report
+
+            with span("gc", alarms=len(report['orphaned'])):
+                delete_alarms(cloudwatch, report['orphaned'])
+                state_store.remove_artefacts(account, region, 'alarm', sorted(gone & stored.keys()))
+                report['deleted'] = len(report['orphaned'])
+            with span("repair", alarms=len(report['drifted']) + len(report['missing'])):
+                for name in report['drifted'] + report['missing']:
+                    cloudwatch.put_metric_alarm(**specs[name])
+                    report['repaired'] += 1
+    except Exception as e:
+        logger.error(f"Error reconciling alarms in account {account} region {region}: {str(e)}")
+        report['errors'].append(str(e))
+    return report
+
 if __name__ == '__main__':
     try:
         sts = create_aws_client('sts')
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# The backend's own (instance profile) credentials
+DEFAULT_ACCOUNT_ID = 'default'
+SESSION_DURATION_SECONDS = 3600
+# Assumed-role credentials are replaced this long before they expire
+REFRESH_MARGIN_SECONDS = 300
+REGIONS_TTL_SECONDS = 3600
+ROLE_SESSION_NAME = 'observability-portal'
+# Accounts other than the backend's own, with the roles to assume in them
+ACCOUNTS_FILE = os.environ.get(
+    'CLOUDWATCH_ACCOUNTS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'accounts.json')
+)
+
+
+class AccountRegistry:
+    """Accounts the backend can operate in, read from a JSON file and cached by mtime.
+
+    The file looks like::
+
+        {"accounts": [{"id": "111122223333", "name": "prod",
+                       "role_arn": "arn:aws:iam::111122223333:role/cloudwatch-monitoring",
+                       "external_id": "...", "regions": ["us-east-1", "eu-west-1"]}]}
+
+    ``regions`` is optional and limits discovery to those regions. The
+    backend's own credentials are always available as the ``default``
+    account unless the file sets ``"include_default": false``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._accounts = None
+        self._mtime = None
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._accounts is not None and mtime == self._mtime:
+            return self._accounts
+
+        with self._lock:
+            data = {}
+            if mtime is not None:
+                with open(self.path, 'r') as file:
+                    data = json.load(file)
+            accounts = {}
+            if data.get('include_default', True):
+                accounts[DEFAULT_ACCOUNT_ID] = {'id': DEFAULT_ACCOUNT_ID, 'name': 'default'}
+            for entry in data.get('accounts', []):
+                account_id = str(entry.get('id', '')).strip()
+                if not account_id or not entry.get('role_arn'):
+                    logger.warning(f"Skipping account entry without id or role_arn in {self.path}: {entry}")
+                    continue
+                accounts[account_id] = {**entry, 'id': account_id, 'name': entry.get('name', account_id)}
+            self._accounts = accounts
+            self._mtime = mtime
+        return self._accounts
+
+    def accounts(self):
+        return list(self._load().values())
+
+    def get(self, account_id=None):
+        account = self._load().get(account_id or DEFAULT_ACCOUNT_ID)
+        if account is None:
+            raise KeyError(f"Unknown account: {account_id}")
+        return account
+
+
+class SessionCache:
+    """Assumed-role sessions, clients and region lists per account.
+
+    A role is assumed once and its session reused until shortly before the
+    credentials expire, so requests do not call STS. Clients are cached per
+    (account, service, region) and dropped when their session is replaced.
+    ``session_hooks`` are called with every new session and its account ID,
+    e.g. to register the metrics, tracing and rate limiter event handlers.
+    ``client_config`` (a ``botocore.config.Config``) applies to every client.
+    """
+
+    def __init__(self, registry, duration=SESSION_DURATION_SECONDS, refresh_margin=REFRESH_MARGIN_SECONDS,
+                 session_hooks=(), client_config=None):
+        self.registry = registry
+        self.duration = duration
+        self.refresh_margin = refresh_margin
+        self.session_hooks = tuple(session_hooks)
+        self.client_config = client_config
+        self._sessions = {}
+        self._clients = {}
+        self._regions = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._hooked_default = None
+
+    def _account_lock(self, account_id):
+        with self._guard:
+            return self._locks.setdefault(account_id, threading.Lock())
+
+    def _assume_role(self, account):
+        params = {
+            'RoleArn': account['role_arn'],
+            'RoleSessionName': account.get('session_name', ROLE_SESSION_NAME),
+            'DurationSeconds': int(account.get('duration', self.duration)),
+        }
+        if account.get('external_id'):
+            params['ExternalId'] = account['external_id']
+        # STS is called with the backend's own credentials
+        credentials = self.client('sts').assume_role(**params)['Credentials']
+        session = boto3.Session(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+        )
+        for hook in self.session_hooks:
+            hook(session, account['id'])
+        logger.info(f"Assumed {account['role_arn']} for account {account['id']}, valid until {credentials['Expiration']}")
+        return session, credentials['Expiration'].timestamp()
+
+    def session(self, account_id=None):
+        account = self.registry.get(account_id)
+        if not account.get('role_arn'):
+            return self._default_session()
+
+        entry = self._sessions.get(account['id'])
+        if entry and time.time() < entry[1] - self.refresh_margin:
+            return entry[0]
+        with self._account_lock(account['id']):
+            # Another thread may have refreshed it while this one waited
+            entry = self._sessions.get(account['id'])
+            if entry and time.time() < entry[1] - self.refresh_margin:
+                return entry[0]
+            self._sessions[account['id']] = self._assume_role(account)
+            return self._sessions[account['id']][0]
+
+    def _default_session(self):
+        # boto3's default session can be replaced (test mocks reset it), so hook whichever one is current
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+        if session is not self._hooked_default:
+            with self._guard:
+                if session is not self._hooked_default:
+                    for hook in self.session_hooks:
+                        hook(session, DEFAULT_ACCOUNT_ID)
+                    self._hooked_default = session
+        return session
+
+    def client(self, service, region=None, account_id=None):
+        key = (account_id or DEFAULT_ACCOUNT_ID, service, region)
+        session = self.session(account_id)
+        cached = self._clients.get(key)
+        if cached and cached[0] is session:
+            return cached[1]
+        if region:
+            client = session.client(service, region_name=region, config=self.client_config)
+        else:
+            client = session.client(service, config=self.client_config)
+        self._clients[key] = (session, client)
+        return client
+
+    def regions(self, account_id=None):
+        """Enabled regions of an account, limited to its configured ``regions`` if any."""
+        account = self.registry.get(account_id)
+        cached = self._regions.get(account['id'])
+        if cached and time.time() - cached[0] < REGIONS_TTL_SECONDS:
+            return cached[1]
+        response = self.client('ec2', 'us-east-1', account['id']).describe_regions()
+        regions = [region['RegionName'] for region in response['Regions']]
+        if account.get('regions'):
+            regions = [region for region in regions if region in account['regions']]
+        self._regions[account['id']] = (time.time(), regions)
+        return regions
+
+    def status(self):
+        """Registry entries with the remaining lifetime of their cached credentials."""
+        now = time.time()
+        result = []
+        for account in self.registry.accounts():
+            entry = self._sessions.get(account['id'])
+            result.append({
+                'id': account['id'],
+                'name': account['name'],
+                'assume_role': bool(account.get('role_arn')),
+                'regions': account.get('regions'),
+                'credentials_expire_in': int(entry[1] - now) if entry else None,
+            })
+        return result
+
+    def invalidate(self, account_id=None):
+        """Drop cached sessions, clients and regions for one account, or all of them."""
+        with self._guard:
+            for cache in (self._sessions, self._regions):
+                for key in list(cache):
+                    if account_id is None or key == account_id:
+                        cache.pop(key, None)
+            for key in list(self._clients):
+                if account_id is None or key[0] == account_id:
+                    self._clients.pop(key, None)
@@ -0,0 +1,253 @@
+"""The AWS services the portal monitors, and how to list their resources.
+
+Shared by the backend app and exporter_config.py, which must not start the app
+to read the catalogue.
+"""
+from typing import Dict, List
+
+# Resources in these states no longer need alarms
+GONE_STATES = {'terminated', 'shutting-down', 'deleting', 'deleted'}
+
+# Services the portal monitors: their CloudWatch namespace, resource dimension and metrics
+AWS_SERVICES = {
+    'EC2': {
+        'namespace': 'AWS/EC2',
+        'dimension_key': 'InstanceId',
+        'resource_type': 'instances',
+        'list_function': 'describe_instances',
+        'metrics': [
+            {'name': 'CPUUtilization', 'namespace': 'AWS/EC2'},
+            {
+                'name': 'DiskSpaceUtilization',
+                'namespace': 'CWAgent',
+                'dimensions': [
+                    {'Name': 'InstanceId', 'Value': '${aws:InstanceId}'},
+                    {'Name': 'path', 'Value': '/'},
+                    {'Name': 'device', 'Value': 'xvda1'},
+                    {'Name': 'fstype', 'Value': 'ext4'}
+                ]
+            },
+            {'name': 'MemoryUtilization', 'namespace': 'CWAgent'},
+            {'name': 'NetworkIn', 'namespace': 'AWS/EC2'},
+            {'name': 'NetworkOut', 'namespace': 'AWS/EC2'}
+        ]
+    },
+    'RDS': {
+        'namespace': 'AWS/RDS',
+        'dimension_key': 'DBInstanceIdentifier',
+        'resource_type': 'db_instances',
+        'list_function': 'describe_db_instances',
+        'metrics': [
+            {'name': 'CPUUtilization', 'namespace': 'AWS/RDS'},
+            {'name': 'FreeableMemory', 'namespace': 'AWS/RDS'},
+            {'name': 'FreeStorageSpace', 'namespace': 'AWS/RDS'},
+            {'name': 'DatabaseConnections', 'namespace': 'AWS/RDS'},
+            {'name': 'ReadIOPS', 'namespace': 'AWS/RDS'},
+            {'name': 'WriteIOPS', 'namespace': 'AWS/RDS'}
+        ]
+    },
+    'Lambda': {
+        'namespace': 'AWS/Lambda',
+        'dimension_key': 'FunctionName',
+        'resource_type': 'functions',
+        'list_function': 'list_functions',
+        'metrics': [
+            {'name': 'Invocations', 'namespace': 'AWS/Lambda'},
+            {'name': 'Errors', 'namespace': 'AWS/Lambda'},
+            {'name': 'Duration', 'namespace': 'AWS/Lambda'},
+            {'name': 'Throttles', 'namespace': 'AWS/Lambda'},
+            {'name': 'ConcurrentExecutions', 'namespace': 'AWS/Lambda'},
+            {'name': 'IteratorAge', 'namespace': 'AWS/Lambda'}
+        ]
+    },
+    'DynamoDB': {
+        'namespace': 'AWS/DynamoDB',
+        'dimension_key': 'TableName',
+        'resource_type': 'tables',
+        'list_function': 'list_tables',
+        'metrics': [
+            {'name': 'ConsumedReadCapacityUnits', 'namespace': 'AWS/DynamoDB'},
+            {'name': 'ConsumedWriteCapacityUnits', 'namespace': 'AWS/DynamoDB'},
+            {'name': 'ReadThrottleEvents', 'namespace': 'AWS/DynamoDB'},
+            {'name': 'WriteThrottleEvents', 'namespace': 'AWS/DynamoDB'},
+            {'name': 'SuccessfulRequestLatency', 'namespace': 'AWS/DynamoDB'},
+            {'name': 'SystemErrors', 'namespace': 'AWS/DynamoDB'}
+        ]
+    },
+    'ECS': {
+        'namespace': 'AWS/ECS',
+        'dimension_key': 'ClusterName',
+        'resource_type': 'clusters',
+        'list_function': 'list_clusters',
+        'metrics': [
+            {'name': 'CPUUtilization', 'namespace': 'AWS/ECS'},
+            {'name': 'MemoryUtilization', 'namespace': 'AWS/ECS'},
+            {'name': 'RunningTaskCount', 'namespace': 'AWS/ECS'},
+            {'name': 'PendingTaskCount', 'namespace': 'AWS/ECS'},
+            {'name': 'StorageReadBytes', 'namespace': 'AWS/ECS'},
+            {'name': 'StorageWriteBytes', 'namespace': 'AWS/ECS'}
+        ]
+    },
+    'ElastiCache': {
+        'namespace': 'AWS/ElastiCache',
+        'dimension_key': 'CacheClusterId',
+        'resource_type': 'cache_clusters',
+        'list_function': 'describe_cache_clusters',
+        'metrics': [
+            {'name': 'CPUUtilization', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'FreeableMemory', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'NetworkBytesIn', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'NetworkBytesOut', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'CurrConnections', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'CacheHits', 'namespace': 'AWS/ElastiCache'},
+            {'name': 'CacheMisses', 'namespace': 'AWS/ElastiCache'}
+        ]
+    },
+    'ELB': {
+        'namespace': 'AWS/ELB',
+        'dimension_key': 'LoadBalancerName',
+        'resource_type': 'load_balancers',
+        'list_function': 'describe_load_balancers',
+        'metrics': [
+            {'name': 'RequestCount', 'namespace': 'AWS/ELB'},
+            {'name': 'HealthyHostCount', 'namespace': 'AWS/ELB'},
+            {'name': 'UnHealthyHostCount', 'namespace': 'AWS/ELB'},
+            {'name': 'Latency', 'namespace': 'AWS/ELB'},
+            {'name': 'HTTPCode_Backend_2XX', 'namespace': 'AWS/ELB'},
+            {'name': 'HTTPCode_Backend_5XX', 'namespace': 'AWS/ELB'}
+        ]
+    },
+    'SQS': {
+        'namespace': 'AWS/SQS',
+        'dimension_key': 'QueueName',
+        'resource_type': 'queues',
+        'list_function': 'list_queues',
+        'metrics': [
+            {'name': 'ApproximateNumberOfMessagesVisible', 'namespace': 'AWS/SQS'},
+            {'name': 'ApproximateNumberOfMessagesNotVisible', 'namespace': 'AWS/SQS'},
+            {'name': 'ApproximateAgeOfOldestMessage', 'namespace': 'AWS/SQS'},
+            {'name': 'NumberOfMessagesReceived', 'namespace': 'AWS/SQS'},
+            {'name': 'NumberOfMessagesSent', 'namespace': 'AWS/SQS'},
+            {'name': 'NumberOfMessagesDeleted', 'namespace': 'AWS/SQS'}
+        ]
+    },
+    'S3': {
+        'namespace': 'AWS/S3',
+        'dimension_key': 'BucketName',
+        'resource_type': 'buckets',
+        'list_function': 'list_buckets',
+        'metrics': [
+            {'name': 'BucketSizeBytes', 'namespace': 'AWS/S3'},
+            {'name': 'NumberOfObjects', 'namespace': 'AWS/S3'},
+            {'name': 'AllRequests', 'namespace': 'AWS/S3'},
+            {'name': '4xxErrors', 'namespace': 'AWS/S3'},
+            {'name': '5xxErrors', 'namespace': 'AWS/S3'},
+            {'name': 'FirstByteLatency', 'namespace': 'AWS/S3'},
+            {'name': 'TotalRequestLatency', 'namespace': 'AWS/S3'}
+        ]
+    }
+}
+
+
+def all_pages(client, operation: str, key: str, **pagination) -> List:
+    # Lambda, DynamoDB, ECS and ElastiCache return 50-100 items per call; follow every page
+    if client.can_paginate(operation):
+        items = []
+        for page in client.get_paginator(operation).paginate(PaginationConfig=pagination):
+            items.extend(page.get(key, []))
+        return items
+    return getattr(client, operation)().get(key, [])
+
+
+def list_resources(client, service: str, region: str) -> List[Dict]:
+    """Resources of one service in ``client``'s account and region; EC2 instances in every state."""
+    service = service.lower()
+    region_resources = []
+    if service == 'ec2':
+        for reservation in all_pages(client, 'describe_instances', 'Reservations'):
+            for instance in reservation['Instances']:
+                region_resources.append({
+                    'Id': instance['InstanceId'],
+                    'Type': instance['InstanceType'],
+                    'State': instance['State']['Name'],
+                    'Name': next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'Unnamed'),
+                    'PublicIpAddress': instance.get('PublicIpAddress'),
+                    'PrivateIpAddress': instance.get('PrivateIpAddress'),
+                    'Region': region
+                })
+    elif service == 'rds':
+        for instance in all_pages(client, 'describe_db_instances', 'DBInstances'):
+            region_resources.append({
+                'Id': instance['DBInstanceIdentifier'],
+                'Type': instance['DBInstanceClass'],
+                'State': instance['DBInstanceStatus'],
+                'Name': instance.get('DBName', instance['DBInstanceIdentifier']),
+                'Region': region
+            })
+    elif service == 'lambda':
+        for function in all_pages(client, 'list_functions', 'Functions'):
+            region_resources.append({
+                'Id': function['FunctionName'],
+                'Type': function.get('Runtime', ''),
+                'State': function.get('State', 'Active'),
+                'Name': function['FunctionName'],
+                'Region': region
+            })
+    elif service == 'dynamodb':
+        for table in all_pages(client, 'list_tables', 'TableNames'):
+            region_resources.append({
+                'Id': table,
+                'Type': 'DynamoDB Table',
+                'State': 'Active',
+                'Name': table,
+                'Region': region
+            })
+    elif service == 'ecs':
+        for cluster_arn in all_pages(client, 'list_clusters', 'clusterArns'):
+            cluster_name = cluster_arn.split('/')[-1]
+            region_resources.append({
+                'Id': cluster_name,
+                'Type': 'ECS Cluster',
+                'State': 'Active',
+                'Name': cluster_name,
+                'Region': region
+            })
+    elif service == 'elasticache':
+        for cluster in all_pages(client, 'describe_cache_clusters', 'CacheClusters'):
+            region_resources.append({
+                'Id': cluster['CacheClusterId'],
+                'Type': cluster['Engine'],
+                'State': cluster['CacheClusterStatus'],
+                'Name': cluster['CacheClusterId'],
+                'Region': region
+            })
+    elif service == 'elb':
+        for lb in all_pages(client, 'describe_load_balancers', 'LoadBalancerDescriptions'):
+            region_resources.append({
+                'Id': lb['LoadBalancerName'],
+                'Type': 'Classic Load Balancer',
+                'State': 'Active',
+                'Name': lb['LoadBalancerName'],
+                'Region': region
+            })
+    elif service == 'sqs':
+        # Without a page size ListQueues stops at 1000 queues and returns no token
+        for queue in all_pages(client, 'list_queues', 'QueueUrls', PageSize=1000):
+            queue_name = queue.split('/')[-1]
+            region_resources.append({
+                'Id': queue_name,
+                'Type': 'SQS Queue',
+                'State': 'Active',
+                'Name': queue_name,
+                'Region': region
+            })
+    elif service == 's3':
+        for bucket in client.list_buckets()['Buckets']:
+            region_resources.append({
+                'Id': bucket['Name'],
+                'Type': 'S3 Bucket',
+                'State': 'Active',
+                'Name': bucket['Name'],
+                'Region': region
+            })
+    return region_resources
@@ -0,0 +1,252 @@
+"""Generate the prometheus/cloudwatch_exporter config from the backend's metric catalogue.
+
+Every metric of the selected ``AWS_SERVICES`` entries becomes one exporter
+rule. Each rule is limited to the resources the backend discovers
+(``aws_dimension_select``), or to resources carrying the given tags
+(``aws_tag_select``), so the exporter only queries what exists. Period,
+range and delay follow each namespace's publishing interval. Before writing
+the file, the script estimates the CloudWatch API calls per scrape and
+refuses to continue when they exceed ``--max-requests``:
+
+    python exporter_config.py --region us-east-1 --service EC2 --service RDS \\
+        --tag Environment=prod --output /tmp/cloudwatch_exporter.yml
+"""
+import argparse
+import math
+import os
+import sys
+
+import yaml
+
+from aws_accounts import ACCOUNTS_FILE, AccountRegistry, SessionCache
+from aws_services import AWS_SERVICES, GONE_STATES, list_resources
+
+# GetMetricData takes 500 queries per call; ListMetrics and GetResources pages hold 500 and 100 items
+QUERIES_PER_GET_METRIC_DATA = 500
+LIST_METRICS_PAGE_SIZE = 500
+GET_RESOURCES_PAGE_SIZE = 100
+# Dimension lists rarely change; the exporter re-runs ListMetrics only this often
+LIST_METRICS_CACHE_TTL_SECONDS = 600
+DEFAULT_SCRAPE_INTERVAL_SECONDS = 60
+DEFAULT_MAX_REQUESTS_PER_SCRAPE = 50
+BUDGET_EXCEEDED_EXIT_CODE = 3
+
+# How often each namespace publishes, and how late its datapoints arrive
+NAMESPACE_TIMING = {
+    # Basic monitoring: one datapoint every 5 minutes, available a few minutes late
+    'AWS/EC2': {'period_seconds': 300, 'range_seconds': 600, 'delay_seconds': 600},
+    'CWAgent': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/RDS': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/Lambda': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/DynamoDB': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/ECS': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/ElastiCache': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/ELB': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+    'AWS/SQS': {'period_seconds': 300, 'range_seconds': 600, 'delay_seconds': 300},
+    'AWS/S3': {'period_seconds': 60, 'range_seconds': 300, 'delay_seconds': 120},
+}
+DEFAULT_TIMING = {'period_seconds': 300, 'range_seconds': 600, 'delay_seconds': 300}
+
+# Metrics whose extra dimensions or timing differ from the rest of their namespace
+METRIC_OVERRIDES = {
+    # S3 storage metrics are published once a day per storage class
+    ('AWS/S3', 'BucketSizeBytes'): {'dimensions': ['StorageType'], 'period_seconds': 86400,
+                                    'range_seconds': 172800, 'delay_seconds': 0},
+    ('AWS/S3', 'NumberOfObjects'): {'dimensions': ['StorageType'], 'period_seconds': 86400,
+                                    'range_seconds': 172800, 'delay_seconds': 0},
+}
+# Request metrics only exist for buckets with a metrics configuration, keyed by its filter
+S3_REQUEST_METRIC_DIMENSIONS = ['FilterId']
+
+# Counters are summed over the period; everything else is averaged
+SUM_METRICS = {
+    'Invocations', 'Errors', 'Throttles', 'ConsumedReadCapacityUnits', 'ConsumedWriteCapacityUnits',
+    'ReadThrottleEvents', 'WriteThrottleEvents', 'SystemErrors', 'RequestCount', 'HTTPCode_Backend_2XX',
+    'HTTPCode_Backend_5XX', 'NumberOfMessagesReceived', 'NumberOfMessagesSent', 'NumberOfMessagesDeleted',
+    'AllRequests', '4xxErrors', '5xxErrors', 'CacheHits', 'CacheMisses', 'NetworkIn', 'NetworkOut',
+    'NetworkBytesIn', 'NetworkBytesOut', 'ReadIOPS', 'WriteIOPS', 'StorageReadBytes', 'StorageWriteBytes',
+}
+
+# Resource Groups Tagging API resource types, for aws_tag_select
+TAG_RESOURCE_TYPES = {
+    'EC2': 'ec2:instance',
+    'RDS': 'rds:db',
+    'Lambda': 'lambda:function',
+    'DynamoDB': 'dynamodb:table',
+    'ECS': 'ecs:cluster',
+    'ElastiCache': 'elasticache:cluster',
+    'ELB': 'elasticloadbalancing:loadbalancer',
+    'SQS': 'sqs',
+    'S3': 's3',
+}
+
+
+def statistics_for(metric_name):
+    return ['Sum'] if metric_name in SUM_METRICS else ['Average']
+
+
+def rule_dimensions(service_config, metric):
+    """Dimension names of a metric, matching those its alarms and previews use."""
+    if metric['namespace'] == 'CWAgent':
+        return ['InstanceId'] + [d['Name'] for d in metric.get('dimensions', []) if d['Name'] != 'InstanceId']
+    override = METRIC_OVERRIDES.get((metric['namespace'], metric['name']), {})
+    extra = override.get('dimensions')
+    if extra is None and metric['namespace'] == 'AWS/S3':
+        extra = S3_REQUEST_METRIC_DIMENSIONS
+    return [service_config['dimension_key']] + list(extra or [])
+
+
+def build_rules(services, catalogue, inventory=None, tags=None):
+    """Exporter metric rules for ``services``; ``inventory`` maps a service to its resource IDs."""
+    rules = []
+    for service in services:
+        service_config = catalogue[service]
+        resource_ids = sorted(set(inventory[service])) if inventory and service in inventory else None
+        for metric in service_config['metrics']:
+            override = METRIC_OVERRIDES.get((metric['namespace'], metric['name']), {})
+            timing = {**NAMESPACE_TIMING.get(metric['namespace'], DEFAULT_TIMING),
+                      **{k: v for k, v in override.items() if k != 'dimensions'}}
+            rule = {
+                'aws_namespace': metric['namespace'],
+                'aws_metric_name': metric['name'],
+                'aws_dimensions': rule_dimensions(service_config, metric),
+                'aws_statistics': statistics_for(metric['name']),
+                **timing,
+            }
+            key = 'InstanceId' if metric['namespace'] == 'CWAgent' else service_config['dimension_key']
+            if resource_ids is not None:
+                # A fresh list per rule; shared lists would be written as YAML anchors
+                rule['aws_dimension_select'] = {key: list(resource_ids)}
+            if tags:
+                rule['aws_tag_select'] = {
+                    'tag_selections': {name: list(values) for name, values in tags.items()},
+                    'resource_type_selection': TAG_RESOURCE_TYPES[service],
+                    'resource_id_dimension': key,
+                }
+            rules.append(rule)
+    return rules
+
+
+def build_config(region, rules, role_arn=None):
+    config = {
+        'region': region,
+        'use_get_metric_data': True,
+        'list_metrics_cache_ttl': LIST_METRICS_CACHE_TTL_SECONDS,
+        'warn_on_empty_list_dimensions': False,
+        'metrics': rules,
+    }
+    if role_arn:
+        config['role_arn'] = role_arn
+    return config
+
+
+def estimate(rules, inventory_sizes, scrape_interval=DEFAULT_SCRAPE_INTERVAL_SECONDS):
+    """Approximate CloudWatch API calls per scrape.
+
+    ``inventory_sizes`` maps each rule's dimension key to the number of
+    resources it can match. GetMetricData is called per rule in batches of 500
+    queries (one per series and statistic). ListMetrics results are cached
+    for LIST_METRICS_CACHE_TTL_SECONDS, so they are spread over the scrapes
+    within that window. Tag selection adds one GetResources page per 100
+    resources on every scrape.
+    """
+    get_metric_data = list_metrics = get_resources = queries = 0.0
+    for rule in rules:
+        key = rule['aws_dimensions'][0]
+        series = max(1, inventory_sizes.get(key, 1))
+        rule_queries = series * len(rule['aws_statistics'])
+        queries += rule_queries
+        get_metric_data += math.ceil(rule_queries / QUERIES_PER_GET_METRIC_DATA)
+        list_metrics += math.ceil(series / LIST_METRICS_PAGE_SIZE) * min(
+            1.0, scrape_interval / LIST_METRICS_CACHE_TTL_SECONDS)
+        if 'aws_tag_select' in rule:
+            get_resources += math.ceil(series / GET_RESOURCES_PAGE_SIZE)
+    scrapes_per_day = 86400 / scrape_interval
+    return {
+        'rules': len(rules),
+        'metric_queries_per_scrape': int(queries),
+        'get_metric_data_calls': int(get_metric_data),
+        'list_metrics_calls': round(list_metrics, 2),
+        'get_resources_calls': int(get_resources),
+        'requests_per_scrape': round(get_metric_data + list_metrics + get_resources, 2),
+        # GetMetricData is billed per metric queried
+        'metric_queries_per_day': int(queries * scrapes_per_day),
+    }
+
+
+def parse_tags(values):
+    tags = {}
+    for value in values or []:
+        name, _, tag_value = value.partition('=')
+        if not name or not tag_value:
+            raise ValueError(f"Tags are given as KEY=VALUE, got {value!r}")
+        tags.setdefault(name, []).append(tag_value)
+    return tags
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--region', required=True)
+    parser.add_argument('--service', action='append', dest='services',
+                        help='AWS_SERVICES entry to export; repeatable (default: EC2)')
+    parser.add_argument('--account', help='Registered account to discover resources in (default: the backend\'s own)')
+    parser.add_argument('--tag', action='append', dest='tags', help='Only export resources tagged KEY=VALUE; repeatable')
+    parser.add_argument('--no-inventory', action='store_true',
+                        help='Do not restrict rules to discovered resource IDs (no AWS calls at generation time)')
+    parser.add_argument('--role-arn', help='Role the exporter assumes')
+    parser.add_argument('--scrape-interval', type=int, default=DEFAULT_SCRAPE_INTERVAL_SECONDS,
+                        help='Prometheus scrape interval of the exporter job, in seconds')
+    parser.add_argument('--max-requests', type=float, default=DEFAULT_MAX_REQUESTS_PER_SCRAPE,
+                        help='Fail when the estimated API calls per scrape exceed this')
+    parser.add_argument('--output', help='Where to write the config (default: stdout)')
+    args = parser.parse_args(argv)
+
+    services = []
+    for name in args.services or ['EC2']:
+        service = next((k for k in AWS_SERVICES if k.lower() == name.lower()), None)
+        if service is None:
+            parser.error(f"Unknown service {name}; choose from {', '.join(AWS_SERVICES)}")
+        services.append(service)
+    try:
+        tags = parse_tags(args.tags)
+    except ValueError as e:
+        parser.error(str(e))
+
+    inventory = None
+    if not args.no_inventory:
+        inventory = {}
+        sessions = SessionCache(AccountRegistry(ACCOUNTS_FILE))
+        for service in services:
+            client = sessions.client(service.lower(), args.region, args.account)
+            resources = list_resources(client, service, args.region)
+            inventory[service] = [r['Id'] for r in resources if r['State'] not in GONE_STATES]
+
+    rules = build_rules(services, AWS_SERVICES, inventory, tags)
+    sizes = {}
+    if inventory is None:
+        print('No inventory: the estimate assumes one resource per rule', file=sys.stderr)
+    else:
+        for service in services:
+            key = AWS_SERVICES[service]['dimension_key']
+            sizes[key] = sizes.get(key, 0) + len(inventory[service])
+    calls = estimate(rules, sizes, args.scrape_interval)
+    for key, value in calls.items():
+        print(f"{key}: {value}", file=sys.stderr)
+    if calls['requests_per_scrape'] > args.max_requests:
+        print(f"Estimated {calls['requests_per_scrape']} requests per scrape exceeds --max-requests "
+              f"{args.max_requests}; narrow the services or tags, or raise the limit", file=sys.stderr)
+        return BUDGET_EXCEEDED_EXIT_CODE
+
+    content = yaml.safe_dump(build_config(args.region, rules, args.role_arn), sort_keys=False, default_flow_style=False)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            file.write(content)
+        print(f"Wrote {len(rules)} rules to {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
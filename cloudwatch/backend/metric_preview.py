@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# GetMetricData accepts at most 500 queries per request
+MAX_QUERIES_PER_CALL = 500
+PREVIEW_CACHE_TTL_SECONDS = 60
+PREVIEW_CACHE_MAX_ENTRIES = 256
+PERCENTILES = (50, 90, 95, 99)
+# Suggested thresholds leave this much headroom over the observed p95 (warning) and p99 (critical)
+WARNING_HEADROOM = 1.25
+CRITICAL_HEADROOM = 1.5
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl=PREVIEW_CACHE_TTL_SECONDS, max_entries=PREVIEW_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+            self._entries.pop(key, None)
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._entries) >= self.max_entries:
+                for stale in [k for k, (created, _) in self._entries.items() if now - created >= self.ttl]:
+                    del self._entries[stale]
+                while len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now, value)
+
+
+def time_window(hours, period):
+    """Start and end of the preview, with the end aligned to the period so repeated requests share a cache key."""
+    now = int(time.time())
+    end = datetime.fromtimestamp(now - now % period, tz=timezone.utc)
+    return end - timedelta(hours=hours), end
+
+
+def build_queries(series, period, stat='Average'):
+    """One MetricDataQuery per ``(resource_id, metric, dimensions)``; IDs map results back to the series."""
+    return [{
+        'Id': f"m{index}",
+        'MetricStat': {
+            'Metric': {
+                'Namespace': metric['namespace'],
+                'MetricName': metric['name'],
+                'Dimensions': dimensions,
+            },
+            'Period': period,
+            'Stat': stat,
+        },
+        'ReturnData': True,
+    } for index, (_, metric, dimensions) in enumerate(series)]
+
+
+def fetch(cloudwatch, queries, start, end):
+    """Run the queries in batches of 500, following NextToken; returns {query id: (timestamps, values)}."""
+    results = {}
+    for offset in range(0, len(queries), MAX_QUERIES_PER_CALL):
+        batch = queries[offset:offset + MAX_QUERIES_PER_CALL]
+        params = {'MetricDataQueries': batch, 'StartTime': start, 'EndTime': end, 'ScanBy': 'TimestampAscending'}
+        while True:
+            response = cloudwatch.get_metric_data(**params)
+            for result in response['MetricDataResults']:
+                timestamps, values = results.setdefault(result['Id'], ([], []))
+                timestamps.extend(int(ts.timestamp()) for ts in result.get('Timestamps', []))
+                values.extend(result.get('Values', []))
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+    return results
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {'count': 0}
+    summary = {
+        'count': len(ordered),
+        'min': round(ordered[0], 4),
+        'max': round(ordered[-1], 4),
+        'mean': round(sum(ordered) / len(ordered), 4),
+    }
+    summary.update({f"p{p}": round(percentile(ordered, p), 4) for p in PERCENTILES})
+    return summary
+
+
+def suggest_thresholds(metric_name, values):
+    """Warning and critical thresholds from every datapoint of a metric across the selected resources."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    warning = percentile(ordered, 95) * WARNING_HEADROOM
+    critical = max(percentile(ordered, 99) * CRITICAL_HEADROOM, warning)
+    if metric_name.endswith('Utilization'):
+        # Percentages cannot exceed 100; keep critical above warning
+        warning, critical = min(warning, 99), min(critical, 100)
+        critical = max(critical, warning + 1)
+    return {'warning': round(warning, 2), 'critical': round(critical, 2), 'basedOn': len(ordered)}
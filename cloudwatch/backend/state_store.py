@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configurations (
+    account TEXT NOT NULL,
+    region TEXT NOT NULL,
+    name TEXT NOT NULL,
+    service TEXT NOT NULL,
+    config TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, region, name)
+);
+CREATE TABLE IF NOT EXISTS artefacts (
+    account TEXT NOT NULL,
+    region TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    arn TEXT,
+    content_hash TEXT,
+    spec TEXT,
+    configuration TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, region, kind, name)
+);
+CREATE INDEX IF NOT EXISTS artefacts_by_configuration ON artefacts (account, region, configuration);
+"""
+
+
+def content_hash(value):
+    """SHA-256 of a canonical JSON rendering, so key order does not matter."""
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _arn_prefix(topic_arn):
+    # put_metric_alarm and put_dashboard return no ARN; partition and account number come from the topic's
+    parts = (topic_arn or '').split(':')
+    if len(parts) < 6:
+        return None, None
+    return parts[1], parts[4]
+
+
+def alarm_arn(topic_arn, region, name):
+    partition, account_number = _arn_prefix(topic_arn)
+    return f"arn:{partition}:cloudwatch:{region}:{account_number}:alarm:{name}" if account_number else None
+
+
+def dashboard_arn(topic_arn, name):
+    partition, account_number = _arn_prefix(topic_arn)
+    return f"arn:{partition}:cloudwatch::{account_number}:dashboard/{name}" if account_number else None
+
+
+class StateStore:
+    """Desired monitoring configurations and the AWS artefacts created for them, in SQLite.
+
+    A configuration is one ``/api/configure`` group: the topic, alarms and
+    dashboard of one account and region, keyed by its dashboard name. Each
+    artefact (``topic``, ``alarm`` or ``dashboard``) is stored with its ARN
+    and the hash of the request that last wrote it, so reconfiguration only
+    writes what changed. Alarms also keep that request as ``spec``. A single
+    connection is shared by the worker threads behind a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            logger.info(f"Opened monitoring state store {self.path}")
+        return self._conn
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def _write(self, sql, rows):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(sql, rows)
+
+    def artefacts(self, account, region, kind=None, configuration=None):
+        """Stored artefacts of one account and region, keyed by (kind, name)."""
+        sql = 'SELECT * FROM artefacts WHERE account = ? AND region = ?'
+        params = [account, region]
+        if kind:
+            sql += ' AND kind = ?'
+            params.append(kind)
+        if configuration:
+            sql += ' AND configuration = ?'
+            params.append(configuration)
+        return {(row['kind'], row['name']): row for row in self._query(sql, params)}
+
+    def record_artefacts(self, account, region, configuration, kind, items):
+        """Upsert ``(name, arn, content_hash, spec)`` items written for ``configuration``."""
+        now = time.time()
+        self._write(
+            'INSERT INTO artefacts (account, region, kind, name, arn, content_hash, spec, configuration, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (account, region, kind, name) DO UPDATE SET arn = excluded.arn, '
+            'content_hash = excluded.content_hash, spec = excluded.spec, configuration = excluded.configuration, '
+            'updated_at = excluded.updated_at',
+            [(account, region, kind, name, arn, digest, json.dumps(spec) if spec is not None else None, configuration,
+              now) for name, arn, digest, spec in items],
+        )
+
+    def remove_artefacts(self, account, region, kind, names):
+        self._write('DELETE FROM artefacts WHERE account = ? AND region = ? AND kind = ? AND name = ?',
+                    [(account, region, kind, name) for name in names])
+
+    def record_configuration(self, account, region, name, service, config):
+        self._write(
+            'INSERT INTO configurations (account, region, name, service, config, content_hash, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (account, region, name) DO UPDATE SET service = excluded.service, '
+            'config = excluded.config, content_hash = excluded.content_hash, updated_at = excluded.updated_at',
+            [(account, region, name, service, json.dumps(config, sort_keys=True), content_hash(config), time.time())],
+        )
+
+    def configurations(self, account=None, region=None, service=None):
+        """Stored configurations with their artefacts, optionally filtered."""
+        filters = {'account': account, 'region': region, 'service': service}
+        clauses = [f"{column} = ?" for column, value in filters.items() if value]
+        sql = 'SELECT * FROM configurations'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY account, region, name'
+        configurations = self._query(sql, [value for value in filters.values() if value])
+
+        artefacts = {}
+        for row in self._query('SELECT account, region, kind, name, arn, configuration, updated_at FROM artefacts '
+                               'ORDER BY kind, name'):
+            artefacts.setdefault((row['account'], row['region'], row.pop('configuration')), []).append(row)
+        for configuration in configurations:
+            configuration['config'] = json.loads(configuration['config'])
+            configuration['artefacts'] = artefacts.get(
+                (configuration['account'], configuration['region'], configuration['name']), []
+            )
+        return configurations
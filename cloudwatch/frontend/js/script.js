@@ -35,6 +35,7 @@ function setupEventListeners() {
     document.getElementById('enableAlerts').addEventListener('change', handleAlertsToggle);
     document.querySelector('.close').addEventListener('click', closeModal);
     document.getElementById('regionFilter').addEventListener('change', filterAndDisplayResources);
+    document.getElementById('accountFilter').addEventListener('change', filterAndDisplayResources);
 }
 
 async function fetchServices() {
@@ -129,10 +130,14 @@ function nextStep() {
                     if (!response.ok) {
                         throw new Error('Failed to fetch resources');
                     }
-                    return response.json();
+                    const failedRegions = response.headers.get('X-Failed-Regions');
+                    return response.json().then(resources => ({ resources, failedRegions }));
                 })
-                .then(resources => {
+                .then(({ resources, failedRegions }) => {
                     updateResourceList(resources);
+                    if (failedRegions) {
+                        showError(`Resources could not be listed in ${failedRegions.split(',').join(', ')}. The list may be incomplete.`);
+                    }
                     document.getElementById(`step${currentStep}`).style.display = 'none';
                     currentStep++;
                     document.getElementById(`step${currentStep}`).style.display = 'block';
@@ -169,12 +174,25 @@ function nextStep() {
 function updateResourceList(resources) {
     // Save full list of resources.
     allResources = resources;
-    // Populate the region filter dropdown using unique region values.
+    // Populate the account and region filter dropdowns using unique values.
+    populateAccountFilter();
     populateRegionFilter();
     // Initially display all resources.
     filterAndDisplayResources();
 }
 
+function populateAccountFilter() {
+    const accountFilter = document.getElementById('accountFilter');
+    accountFilter.innerHTML = `<option value="">All Accounts</option>`;
+    const accounts = new Map(allResources.map(r => [r.Account, r.AccountName || r.Account]));
+    Array.from(accounts.keys()).sort().forEach(account => {
+        const option = document.createElement('option');
+        option.value = account;
+        option.textContent = accounts.get(account);
+        accountFilter.appendChild(option);
+    });
+}
+
 function populateRegionFilter() {
     const regionFilter = document.getElementById('regionFilter');
     regionFilter.innerHTML = `<option value="">All Regions</option>`;
@@ -190,9 +208,13 @@ function populateRegionFilter() {
 function filterAndDisplayResources() {
     const regionFilter = document.getElementById('regionFilter');
     const selectedRegion = regionFilter.value;
+    const selectedAccount = document.getElementById('accountFilter').value;
     let filteredResources = allResources;
+    if (selectedAccount) {
+        filteredResources = filteredResources.filter(r => r.Account === selectedAccount);
+    }
     if (selectedRegion) {
-        filteredResources = allResources.filter(r => r.Region === selectedRegion);
+        filteredResources = filteredResources.filter(r => r.Region === selectedRegion);
     }
     updateResourceListUI(filteredResources);
 }
@@ -212,7 +234,7 @@ function updateResourceListUI(resources) {
             <input type="checkbox" id="${resource.Id}" value="${resource.Id}"
                    ${selectedResources.find(r => r.Id === resource.Id) ? 'checked' : ''}>
             <label for="${resource.Id}">
-                ${resource.Name} <small>(${resource.Region})</small>
+                ${resource.Name} <small>(${resource.AccountName ? resource.AccountName + ' / ' : ''}${resource.Region})</small>
                 <span class="resource-info">${resource.Id} - ${resource.Type}</span>
                 <span class="resource-ips">
                     Public: ${resource.PublicIpAddress ? resource.PublicIpAddress : 'N/A'} | 
@@ -318,6 +340,41 @@ function updateThresholdsDisplay() {
         
         thresholdsDiv.appendChild(container);
     });
+    loadThresholdSuggestions();
+}
+
+// Pre-set the sliders from recent datapoints of the selected resources, fetched in one request
+function loadThresholdSuggestions() {
+    fetch(`/cloudwatch/api/metrics/${selectedService}/preview`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ resources: selectedResources, metrics: selectedMetrics })
+    })
+        .then(response => response.ok ? response.json() : null)
+        .then(preview => {
+            if (!preview) {
+                return;
+            }
+            Object.entries(preview.suggestions || {}).forEach(([name, suggestion]) => {
+                const warningSlider = document.getElementById(`${name}-warning`);
+                const criticalSlider = document.getElementById(`${name}-critical`);
+                if (!suggestion || !warningSlider || !criticalSlider) {
+                    return;
+                }
+                const warning = Math.min(99, Math.max(0, Math.round(suggestion.warning)));
+                const critical = Math.min(100, Math.max(warning + 1, Math.round(suggestion.critical)));
+                warningSlider.value = warning;
+                criticalSlider.value = critical;
+                const container = warningSlider.closest('.metric-threshold-container');
+                container.querySelector('.warning-value').textContent = `${warning}%`;
+                container.querySelector('.critical-value').textContent = `${critical}%`;
+                const hint = document.createElement('p');
+                hint.className = 'threshold-hint';
+                hint.textContent = `Suggested from ${suggestion.basedOn} datapoints over the last ${Math.round((preview.end - preview.start) / 3600)}h`;
+                container.appendChild(hint);
+            });
+        })
+        .catch(() => {});
 }
 
 function prevStep() {
@@ -429,11 +486,29 @@ function showError(message) {
 function showSuccess(result) {
     const modal = document.getElementById('resultModal');
     const content = document.getElementById('modalContent');
+    // Resources from several accounts or regions get one topic and dashboard per account/region
+    if (result.groups && result.groups.length > 1) {
+        content.innerHTML = `
+            <div class="success-message">
+                <h3>Monitoring configuration completed successfully!</h3>
+                ${result.groups.map(group => `
+                    <p><strong>${group.account} / ${group.region}:</strong> ${group.dashboardName}
+                        (SNS topic "${group.topicName}")
+                        <a href="${group.dashboardUrl}" target="_blank">View Dashboard</a></p>
+                `).join('')}
+                <p><strong>Important:</strong> Please add subscribers to each SNS topic to receive alerts.</p>
+            </div>
+        `;
+        modal.style.display = 'block';
+        return;
+    }
     content.innerHTML = `
         <div class="success-message">
             <h3>Monitoring configuration completed successfully!</h3>
             <p><strong>Dashboard Name:</strong> ${result.dashboardName}</p>
             <p><strong>SNS Topic ARN:</strong> ${result.snsTopicArn}</p>
+            ${result.changes ? `<p><strong>Alarms:</strong> ${result.changes.alarmsWritten} written,
+                ${result.changes.alarmsUnchanged} unchanged, ${result.changes.alarmsDeleted} removed</p>` : ''}
             <p><strong>Important:</strong> Please add subscribers to the SNS topic "${result.topicName}" to receive alerts.</p>
             <div class="dashboard-link">
                 <a href="${result.dashboardUrl}" target="_blank" class="btn">View Dashboard</a>
@@ -0,0 +1,233 @@
+"""Process-wide adaptive rate limiting for boto3 calls.
+
+Every attempt of an AWS call first takes a token from a bucket keyed by
+(scope, service, region, operation class). The scope is usually the account,
+because AWS applies its limits per account and region. Reads (``Describe*``,
+``List*``, ``Get*``...) and writes have separate buckets. A bucket halves its
+rate when AWS answers with a throttling error and builds it back up slowly
+with every successful call.
+
+Callers waiting on the same bucket are served by priority, so an interactive
+discovery sweep is not queued behind a bulk alarm rollout. Work runs as
+``INTERACTIVE`` unless it is wrapped in ``with priority(BULK):``. Queue
+depth, wait time, current rate and backoffs are exported as Prometheus
+metrics.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.instrumentation import APP_NAME, THROTTLE_ERROR_CODES
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+READ_PREFIXES = ("Describe", "List", "Get", "Search", "Lookup", "Scan", "Query", "BatchGet", "Head", "Select")
+
+# (initial rate, burst, maximum rate) in requests per second, per bucket
+DEFAULT_LIMITS = {
+    "read": (20.0, 20, 50.0),
+    "write": (5.0, 5, 20.0),
+}
+MIN_RATE = 0.5
+BACKOFF_FACTOR = 0.5
+# Throttles from calls that were already in flight do not halve the rate again
+BACKOFF_COOLDOWN_SECONDS = 1.0
+# Added to the rate for every successful call, so recovery takes a few hundred calls
+RECOVERY_STEP = 0.05
+
+_priority = ContextVar("aws_rate_limit_priority", default=INTERACTIVE)
+
+QUEUE_DEPTH = Gauge(
+    "portal_aws_limiter_queue_depth",
+    "AWS call attempts waiting for a rate limiter token",
+    ["app", "service", "region", "op_class", "priority"],
+)
+WAIT_SECONDS = Histogram(
+    "portal_aws_limiter_wait_seconds",
+    "Time an AWS call attempt waited for a rate limiter token",
+    ["app", "service", "op_class", "priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")),
+)
+CURRENT_RATE = Gauge(
+    "portal_aws_limiter_rate",
+    "Current rate of an AWS rate limiter bucket, in requests per second",
+    ["app", "service", "region", "op_class"],
+)
+BACKOFFS = Counter(
+    "portal_aws_limiter_backoffs_total",
+    "Times a rate limiter bucket lowered its rate after a throttling response",
+    ["app", "service", "region", "op_class"],
+)
+
+
+def operation_class(operation):
+    return "read" if operation.startswith(READ_PREFIXES) else "write"
+
+
+@contextmanager
+def priority(level):
+    """Run the AWS calls made in this block (in this thread or context) at ``level``."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket with an AIMD rate and a priority queue of waiters."""
+
+    def __init__(self, rate, burst, max_rate, min_rate=MIN_RATE, labels=()):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.labels = labels
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_backoff = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, level=INTERACTIVE):
+        """Block until a token is available and no higher-priority or earlier caller is waiting."""
+        ticket = (level, next(self._sequence))
+        depth = QUEUE_DEPTH.labels(APP_NAME["value"], *self.labels, PRIORITY_NAMES.get(level, str(level)))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            depth.inc()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket:
+                        if self.tokens >= 1:
+                            heapq.heappop(self._waiters)
+                            self.tokens -= 1
+                            # The next caller in line may already have a token
+                            self._cond.notify_all()
+                            break
+                        self._cond.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            finally:
+                depth.dec()
+        service, _, op_class = self.labels
+        WAIT_SECONDS.labels(APP_NAME["value"], service, op_class, PRIORITY_NAMES.get(level, str(level))).observe(
+            time.monotonic() - start
+        )
+
+    def on_throttle(self):
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_backoff < BACKOFF_COOLDOWN_SECONDS:
+                return
+            self._last_backoff = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+            # Drop the accumulated burst so the lower rate applies straight away
+            self.tokens = min(self.tokens, 0.0)
+        BACKOFFS.labels(APP_NAME["value"], *self.labels).inc()
+        CURRENT_RATE.labels(APP_NAME["value"], *self.labels).set(self.rate)
+
+    def on_success(self):
+        if self.rate >= self.max_rate:
+            return
+        with self._cond:
+            self.rate = min(self.max_rate, self.rate + RECOVERY_STEP)
+        CURRENT_RATE.labels(APP_NAME["value"], *self.labels).set(self.rate)
+
+
+class RateLimiter:
+    """The buckets of one process, created on first use."""
+
+    def __init__(self, limits=None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._buckets = {}
+        self._guard = threading.Lock()
+
+    def bucket(self, scope, service, region, op_class):
+        key = (scope, service, region, op_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._guard:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    rate, burst, max_rate = self.limits.get(f"{service}.{op_class}", self.limits[op_class])
+                    bucket = TokenBucket(rate, burst, max_rate, labels=(service, region, op_class))
+                    self._buckets[key] = bucket
+                    CURRENT_RATE.labels(APP_NAME["value"], service, region, op_class).set(rate)
+        return bucket
+
+    def _bucket_for(self, scope, event_name, context):
+        _, service, operation = event_name.split(".", 2)
+        return self.bucket(scope, service, context.get("client_region") or "global", operation_class(operation))
+
+    def _request_created(self, scope, request, event_name, **kwargs):
+        # Fires before signing on every attempt, so retries wait for a token too
+        self._bucket_for(scope, event_name, request.context).acquire(_priority.get())
+
+    def _needs_retry(self, scope, response, request_dict, event_name, **kwargs):
+        if not response:
+            return None
+        bucket = self._bucket_for(scope, event_name, request_dict.get("context", {}))
+        code = (response[1] or {}).get("Error", {}).get("Code")
+        if code in THROTTLE_ERROR_CODES:
+            bucket.on_throttle()
+        elif not code:
+            bucket.on_success()
+        return None
+
+    def status(self):
+        """Current rate, free tokens and waiters of every bucket."""
+        return [
+            {
+                "scope": scope,
+                "service": service,
+                "region": region,
+                "op_class": op_class,
+                "rate": round(bucket.rate, 3),
+                "tokens": round(bucket.tokens, 3),
+                "waiting": len(bucket._waiters),
+            }
+            for (scope, service, region, op_class), bucket in sorted(self._buckets.items())
+        ]
+
+
+limiter = RateLimiter()
+
+
+def instrument_session(session, scope="default"):
+    """Route every AWS call made through a boto3 (or botocore) session through the limiter."""
+    events = session.events if hasattr(session, "events") else session.get_component("event_emitter")
+    events.register_first("request-created.*.*", partial(limiter._request_created, scope))
+    events.register("needs-retry.*.*", partial(limiter._needs_retry, scope))
+    return session
+
+
+def instrument_boto3(scope="default"):
+    """Limit the default boto3 session used by ``boto3.client(...)``."""
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    return instrument_session(boto3.DEFAULT_SESSION, scope)
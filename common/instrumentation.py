@@ -0,0 +1,203 @@
+"""Prometheus self-metrics shared by the portal's Flask apps.
+
+Each app calls ``init_app(app, "<name>")`` to get per-route request latency
+and a ``/metrics`` endpoint, ``instrument_boto3()`` for AWS call latency and
+throttling, and wraps scripts and SSH rollouts in ``track_subprocess`` /
+``track_ssh``, which also open tracing spans when a trace is active.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from common.tracing import span
+
+# Label applied to every series so the four apps can share one scrape job
+APP_NAME = {"value": "unknown"}
+
+THROTTLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+
+# Subprocess and SSH steps range from milliseconds to 20-minute deploys
+LONG_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, float("inf"))
+
+REQUEST_LATENCY = Histogram(
+    "portal_http_request_duration_seconds",
+    "Flask request latency by route",
+    ["app", "method", "route", "status"],
+)
+REQUEST_EXCEPTIONS = Counter(
+    "portal_http_request_exceptions_total",
+    "Unhandled exceptions raised by Flask routes",
+    ["app", "method", "route"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "portal_http_requests_in_progress",
+    "Flask requests currently being served",
+    ["app"],
+)
+AWS_CALL_LATENCY = Histogram(
+    "portal_aws_call_duration_seconds",
+    "boto3 API call latency including retries",
+    ["app", "service", "operation", "region", "outcome"],
+)
+AWS_THROTTLES = Counter(
+    "portal_aws_throttles_total",
+    "Throttling responses returned by AWS, counted per attempt",
+    ["app", "service", "operation", "region"],
+)
+SUBPROCESS_DURATION = Histogram(
+    "portal_subprocess_duration_seconds",
+    "Wall-clock time of scripts and commands run by the apps",
+    ["app", "script", "outcome"],
+    buckets=LONG_BUCKETS,
+)
+SSH_ROLLOUT_DURATION = Histogram(
+    "portal_ssh_rollout_duration_seconds",
+    "Wall-clock time of SSH rollout phases per host",
+    ["app", "phase", "outcome"],
+    buckets=LONG_BUCKETS,
+)
+
+
+def _route():
+    # The rule template keeps label cardinality bounded, unlike the raw path
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+def init_app(app, app_name):
+    """Time every request by route and mount ``/metrics`` on a Flask app."""
+    APP_NAME["value"] = app_name
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(app_name).inc()
+
+    @app.after_request
+    def _record_request(response):
+        # Also runs for the 500 response of a raising route; teardown still needs the start time
+        start = g.get("_metrics_start")
+        if start is not None:
+            REQUEST_LATENCY.labels(app_name, request.method, _route(), str(response.status_code)).observe(
+                time.perf_counter() - start
+            )
+        return response
+
+    @app.teardown_request
+    def _record_exception(error=None):
+        # Runs once per request, whether or not after_request did
+        if g.pop("_metrics_start", None) is None:
+            return
+        REQUESTS_IN_PROGRESS.labels(app_name).dec()
+        if error is not None:
+            REQUEST_EXCEPTIONS.labels(app_name, request.method, _route()).inc()
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+    return app
+
+
+def _before_call(model, context, **kwargs):
+    context["_metrics_start"] = time.perf_counter()
+
+
+def _labels(model, context):
+    return (
+        APP_NAME["value"],
+        model.service_model.service_name,
+        model.name,
+        context.get("client_region") or "global",
+    )
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    start = context.pop("_metrics_start", None)
+    if start is None:
+        return
+    code = (parsed or {}).get("Error", {}).get("Code")
+    outcome = "throttled" if code in THROTTLE_ERROR_CODES else ("error" if code else "ok")
+    AWS_CALL_LATENCY.labels(*_labels(model, context), outcome).observe(time.perf_counter() - start)
+
+
+def _after_call_error(exception, context, event_name, **kwargs):
+    # This event carries no operation model; service and operation come from its name
+    start = context.pop("_metrics_start", None)
+    if start is not None:
+        _, service, operation = event_name.split(".", 2)
+        region = context.get("client_region") or "global"
+        AWS_CALL_LATENCY.labels(APP_NAME["value"], service, operation, region, "error").observe(
+            time.perf_counter() - start
+        )
+
+
+def _needs_retry(response, operation, request_dict, **kwargs):
+    # Fires once per attempt, so retried throttles are counted individually
+    if not response:
+        return None
+    code = (response[1] or {}).get("Error", {}).get("Code")
+    if code in THROTTLE_ERROR_CODES:
+        context = request_dict.get("context", {})
+        AWS_THROTTLES.labels(*_labels(operation, context)).inc()
+    return None
+
+
+def instrument_session(session):
+    """Register latency and throttle hooks on a boto3 (or botocore) session."""
+    events = session.events if hasattr(session, "events") else session.get_component("event_emitter")
+    events.register("before-call.*.*", _before_call)
+    events.register("after-call.*.*", _after_call)
+    events.register("after-call-error.*.*", _after_call_error)
+    events.register("needs-retry.*.*", _needs_retry)
+    return session
+
+
+def instrument_boto3():
+    """Instrument the default boto3 session used by ``boto3.client(...)``."""
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    return instrument_session(boto3.DEFAULT_SESSION)
+
+
+@contextmanager
+def track_subprocess(script):
+    """Time a script or command; the outcome is ``error`` if the block raises."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with span(f"subprocess.{script}", script=script):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        SUBPROCESS_DURATION.labels(APP_NAME["value"], script, outcome).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_ssh(phase):
+    """Time one SSH rollout phase (connect, check, upload, install) for a host."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with span(f"ssh.{phase}"):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        SSH_ROLLOUT_DURATION.labels(APP_NAME["value"], phase, outcome).observe(time.perf_counter() - start)
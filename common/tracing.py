@@ -0,0 +1,309 @@
+"""Lightweight, OpenTelemetry-style tracing for multi-step portal jobs.
+
+A job opens a trace with ``start_trace``; nested ``span`` blocks, and every
+boto3 call once ``instrument_boto3()`` has run, become child spans. When the
+trace ends it is written as JSON to ``TRACE_DIR/<trace_id>.json`` and, if
+``OTEL_EXPORTER_OTLP_ENDPOINT`` is set, posted to that collector in OTLP/HTTP
+JSON format.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR = os.environ.get("TRACE_DIR", os.path.join(os.getcwd(), "traces"))
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+SERVICE_NAME = {"value": "observability-portal"}
+SLOWEST_LIMIT = 10
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, trace, name, parent=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time_ns()
+        self.end = None
+        self.status = "ok"
+        self.message = ""
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = "error"
+        self.message = str(message)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time_ns()
+            self.trace.add(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_unix_nano": self.start,
+            "end_unix_nano": self.end,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "message": self.message,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Critical path from the root plus the slowest spans, hosts and AWS operations."""
+        spans = sorted(self.spans, key=lambda s: s.start)
+        children = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+
+        # Walk back from the parent's end: the child finishing last, then the
+        # last one to finish before that child started, and so on
+        critical_path = []
+
+        def walk(node, depth):
+            critical_path.append({"name": node.name, "depth": depth, "duration_ms": round(node.duration_ms, 3),
+                                  "attributes": node.attributes})
+            cursor, selected = node.end, []
+            for kid in sorted(children.get(node.span_id, []), key=lambda s: s.end, reverse=True):
+                if kid.end <= cursor:
+                    selected.append(kid)
+                    cursor = kid.start
+            for kid in reversed(selected):
+                walk(kid, depth + 1)
+
+        for root in children.get(None, []):
+            walk(root, 0)
+
+        by_host, by_operation = {}, {}
+        for s in spans:
+            if "host" in s.attributes:
+                by_host[s.attributes["host"]] = by_host.get(s.attributes["host"], 0) + s.duration_ms
+            if "aws.operation" in s.attributes:
+                key = f"{s.attributes.get('aws.service')}.{s.attributes['aws.operation']}"
+                by_operation[key] = by_operation.get(key, 0) + s.duration_ms
+
+        def top(totals):
+            return [{"name": k, "total_ms": round(v, 3)}
+                    for k, v in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:SLOWEST_LIMIT]]
+
+        return {
+            "critical_path": critical_path,
+            "slowest_spans": [{"name": s.name, "duration_ms": round(s.duration_ms, 3), "attributes": s.attributes}
+                              for s in sorted(spans, key=lambda s: s.duration_ms, reverse=True)[1:SLOWEST_LIMIT + 1]],
+            "slowest_hosts": top(by_host),
+            "slowest_aws_operations": top(by_operation),
+        }
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "service": SERVICE_NAME["value"],
+            "summary": self.summary(),
+            "spans": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.start)],
+        }
+
+    def to_otlp(self):
+        def attrs(values):
+            return [{"key": k, "value": {"stringValue": str(v)}} for k, v in values.items()]
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": attrs({"service.name": SERVICE_NAME["value"]})},
+            "scopeSpans": [{
+                "scope": {"name": "observability-portal"},
+                "spans": [{
+                    "traceId": self.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start),
+                    "endTimeUnixNano": str(s.end),
+                    "attributes": attrs(s.attributes),
+                    "status": {"code": 2 if s.status == "error" else 1, "message": s.message},
+                } for s in self.spans],
+            }],
+        }]}
+
+
+def configure(service_name):
+    SERVICE_NAME["value"] = service_name
+
+
+def export(trace):
+    """Write the trace as JSON and, in the background, send it to the OTLP collector."""
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f"{trace.trace_id}.json"), "w") as f:
+            json.dump(trace.to_dict(), f, indent=2, default=str)
+    except Exception as e:
+        logger.warning(f"Could not write trace {trace.trace_id}: {str(e)}")
+
+    if OTLP_ENDPOINT:
+        def send():
+            try:
+                req = urllib.request.Request(
+                    OTLP_ENDPOINT.rstrip("/") + "/v1/traces",
+                    data=json.dumps(trace.to_otlp()).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST",
+                )
+                urllib.request.urlopen(req, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"Could not export trace {trace.trace_id} to {OTLP_ENDPOINT}: {str(e)}")
+        threading.Thread(target=send, daemon=True).start()
+
+
+def load_trace(trace_id):
+    """Read an exported trace back, for the trace API endpoints."""
+    if not trace_id or not all(c in "0123456789abcdef" for c in trace_id):
+        return None
+    try:
+        with open(os.path.join(TRACE_DIR, f"{trace_id}.json"), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    """Open the root span of a job; the trace is exported when the block exits."""
+    trace = Trace(name)
+    root = Span(trace, name, attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield trace
+    except BaseException as e:
+        root.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        root.finish()
+        export(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current span; a no-op outside a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def traced(name, **attribute_args):
+    """Run the decorated function in a span.
+
+    ``attribute_args`` maps span attribute names to the function's argument
+    names, e.g. ``@traced("iam.ensure_instance_role", host="instance_id")``.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            attributes = {attr: bound[arg] for attr, arg in attribute_args.items() if arg in bound}
+            with span(name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    return _current_span.get()
+
+
+def bind(fn):
+    """Carry the current span into a worker thread (ThreadPoolExecutor.submit(bind(fn), ...))."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _before_call(model, context, **kwargs):
+    parent = _current_span.get()
+    if parent is not None:
+        context["_trace_span"] = Span(parent.trace, f"aws.{model.service_model.service_name}.{model.name}", parent, {
+            "aws.service": model.service_model.service_name,
+            "aws.operation": model.name,
+            "aws.region": context.get("client_region") or "global",
+        })
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    aws_span = context.pop("_trace_span", None)
+    if aws_span is not None:
+        code = (parsed or {}).get("Error", {}).get("Code")
+        if code:
+            aws_span.set_error(code)
+        aws_span.finish()
+
+
+def _after_call_error(exception, context, **kwargs):
+    aws_span = context.pop("_trace_span", None)
+    if aws_span is not None:
+        aws_span.set_error(exception)
+        aws_span.finish()
+
+
+def instrument_session(session):
+    """Turn every call made by a boto3 session's clients inside a trace into a child span."""
+    events = session.events
+    events.register("before-call.*.*", _before_call)
+    events.register("after-call.*.*", _after_call)
+    events.register("after-call-error.*.*", _after_call_error)
+    return session
+
+
+def instrument_boto3():
+    """Instrument the default boto3 session used by ``boto3.client(...)``."""
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    return instrument_session(boto3.DEFAULT_SESSION)
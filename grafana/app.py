@@ -1,25 +1,41 @@
 from flask import Flask, render_template, request, redirect, url_for, flash
 import subprocess
 import os
+import sys
 import yaml
 import shutil
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import init_app, track_subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cardinality
+
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
+init_app(app, "grafana")
 
 PROMETHEUS_CONFIG_PATH = '/etc/prometheus/prometheus.yml'
 ALERT_RULES_FILE_PATH = '/etc/prometheus/alert.rules.yml'
 ALERTMANAGER_CONFIG_PATH = "/etc/alertmanager/alertmanager.yml"
 EMAIL_TEMPLATE_PATH = "/etc/alertmanager/templates/email.tmpl"
+# Node Exporter collector profiles of scripts/install_node_exporter.sh, with their series per host
+NODE_EXPORTER_PROFILES = {
+    'minimal': 'Minimal: CPU, memory, load, filesystems, disks and network (~200 series)',
+    'standard': 'Standard: defaults without hardware and kernel-internals collectors (~450 series)',
+    'full': 'Full: every default collector (~1,200 series)',
+}
+DEFAULT_NODE_EXPORTER_PROFILE = 'standard'
 
 def install_prometheus():
     """Install Prometheus and handle the installation process."""
     try:
         # Run installation commands with output capture
-        subprocess.run(["apt-get", "update"], check=True, capture_output=True, text=True)
-        subprocess.run(["apt-get", "install", "-y", "prometheus"], check=True, capture_output=True, text=True)
-        subprocess.run(["systemctl", "enable", "prometheus"], check=True, capture_output=True, text=True)
-        subprocess.run(["systemctl", "start", "prometheus"], check=True, capture_output=True, text=True)
+        with track_subprocess("install_prometheus"):
+            subprocess.run(["apt-get", "update"], check=True, capture_output=True, text=True)
+            subprocess.run(["apt-get", "install", "-y", "prometheus"], check=True, capture_output=True, text=True)
+            subprocess.run(["systemctl", "enable", "prometheus"], check=True, capture_output=True, text=True)
+            subprocess.run(["systemctl", "start", "prometheus"], check=True, capture_output=True, text=True)
         
         # Verify installation
         status = subprocess.run(["systemctl", "is-active", "prometheus"], capture_output=True, text=True)
@@ -70,7 +86,8 @@ def install_grafana_route():
         
         try:
             # Run the Grafana installation script
-            subprocess.run(["bash", "./scripts/install_grafana.sh"], check=True, capture_output=True, text=True)
+            with track_subprocess("install_grafana.sh"):
+                subprocess.run(["bash", "./scripts/install_grafana.sh"], check=True, capture_output=True, text=True)
             flash('Grafana installed and started successfully!', 'success')
             return redirect(url_for('install_grafana_route'))
         except subprocess.CalledProcessError as e:
@@ -94,7 +111,8 @@ def install_node_exporter(remote_ip, username, key_file):
 @app.route('/node_exporter')
 def node_exporter():
     """Render the Node Exporter installation page."""
-    return render_template('node_exporter.html')
+    return render_template('node_exporter.html', profiles=NODE_EXPORTER_PROFILES,
+                           default_profile=DEFAULT_NODE_EXPORTER_PROFILE)
 
 @app.route('/install_node_exporter', methods=['POST'])
 def install_node_exporter():
@@ -102,6 +120,10 @@ def install_node_exporter():
         server_ip = request.form['server_ip']  # Check if this is being accessed correctly
         username = request.form['username']
         key_pair = request.files['key_pair']
+        profile = request.form.get('profile', DEFAULT_NODE_EXPORTER_PROFILE)
+        if profile not in NODE_EXPORTER_PROFILES:
+            flash(f'Unknown collector profile: {profile}', 'error')
+            return redirect(url_for('node_exporter'))
         
         # Save the uploaded key to a temporary location
         key_pair_path = f"/tmp/{key_pair.filename}"
@@ -111,8 +133,10 @@ def install_node_exporter():
         os.chmod(key_pair_path, 0o400)
         
         # Call your installation script with necessary parameters
-        subprocess.run(["bash", "./scripts/install_node_exporter.sh", server_ip, username, key_pair_path], check=True)
-        flash('Node Exporter installed successfully!', 'success')
+        with track_subprocess("install_node_exporter.sh"):
+            subprocess.run(["bash", "./scripts/install_node_exporter.sh", server_ip, username, key_pair_path, profile],
+                           check=True)
+        flash(f'Node Exporter installed successfully with the {profile} collector profile!', 'success')
     except KeyError as e:
         flash(f'Missing field: {e}', 'error')
     except subprocess.CalledProcessError as e:
@@ -178,9 +202,68 @@ def add_targets():
         return redirect(url_for('index'))
     return render_template('add_targets.html')
 
+def read_prometheus_config():
+    with open(PROMETHEUS_CONFIG_PATH, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+
+def apply_relabel_rules(rules, savings):
+    """Add metric_relabel_configs drop rules to prometheus.yml and restart Prometheus."""
+    try:
+        config = read_prometheus_config()
+        changed = cardinality.merge_relabel_rules(config, rules)
+        if not changed:
+            flash('The selected drop rules are already in the Prometheus configuration.', 'success')
+            return
+        with open(PROMETHEUS_CONFIG_PATH, 'w') as f:
+            yaml.safe_dump(config, f, sort_keys=False, default_flow_style=False)
+        subprocess.run(["systemctl", "restart", "prometheus"], check=True)
+        flash(f"Drop rules added to {', '.join(changed)}: about {savings['series']} fewer series and "
+              f"{savings['memory_bytes'] // (1024 * 1024)} MiB less head memory.", 'success')
+    except Exception as e:
+        flash(f'Error applying relabel rules: {e}', 'error')
+
+
+@app.route('/cardinality', methods=['GET', 'POST'])
+def cardinality_report():
+    """Report the largest metrics and labels, then preview or apply drop rules for the selected ones."""
+    if request.method == 'GET':
+        return render_template('cardinality.html', report=None, selection=None,
+                               prometheus_url=cardinality.PROMETHEUS_URL)
+
+    # Never a URL from the form: the server would fetch whatever it is given
+    prometheus_url = cardinality.PROMETHEUS_URL
+    try:
+        limit = int(request.form.get('limit') or cardinality.TSDB_STATUS_LIMIT)
+        report = cardinality.analyze(prometheus_url, limit)
+    except (cardinality.PrometheusAPIError, ValueError) as e:
+        flash(f'Error reading Prometheus TSDB status: {e}', 'error')
+        return render_template('cardinality.html', report=None, selection=None, prometheus_url=prometheus_url)
+
+    try:
+        intervals = cardinality.scrape_intervals(read_prometheus_config())
+    except Exception:
+        intervals = {}
+
+    # A fresh report starts from the suggestions; preview and apply use the ticked boxes
+    action = request.form.get('action', 'analyze')
+    if action == 'analyze':
+        pairs = [(job, metric['name']) for metric in report['metrics'] if metric['suggested'] for job in metric['jobs']]
+    else:
+        pairs = [tuple(value.split('|', 1)) for value in request.form.getlist('drop') if '|' in value]
+    selection = cardinality.plan(report, pairs, intervals)
+    selection['selected'] = {f"{job}|{metric}" for job, metric in pairs}
+
+    if action == 'apply' and selection['rules']:
+        apply_relabel_rules(selection['rules'], selection['savings'])
+        return redirect(url_for('cardinality_report'))
+    return render_template('cardinality.html', report=report, selection=selection, prometheus_url=prometheus_url)
+
+
 def install_alertmanager():
     try:
-        subprocess.run(["bash", "./scripts/alert.sh"], check=True)  # Script path correct?
+        with track_subprocess("alert.sh"):
+            subprocess.run(["bash", "./scripts/alert.sh"], check=True)  # Script path correct?
         update_prometheus_for_alertmanager()
         flash("Alertmanager installed successfully!", "success")
     except subprocess.CalledProcessError as e:
@@ -233,7 +316,7 @@ def apply_alert_rules():
 
     # Define source and destination paths
     source_rules_path = './scripts/alert.rules.yml'
-    destination_rules_path = '/etc/prometheus/alert.rules.yml'
+    destination_rules_path = ALERT_RULES_FILE_PATH
 
     predefined_rules = {
         "High CPU Usage": {
@@ -0,0 +1,279 @@
+"""Series cardinality report and relabel rules for the local Prometheus.
+
+The report reads Prometheus' TSDB status API (head block statistics), then
+asks which jobs the largest metrics come from. Dropping a metric is
+estimated in active series, samples per second and head memory. Memory per
+series is Prometheus' own resident memory divided by its head series, or
+DEFAULT_BYTES_PER_SERIES when its /metrics cannot be read.
+"""
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+
+import yaml
+from prometheus_client.parser import text_string_to_metric_families
+
+PROMETHEUS_URL = os.environ.get('PROMETHEUS_URL', 'http://localhost:9090')
+TSDB_STATUS_LIMIT = 20
+REQUEST_TIMEOUT_SECONDS = 10
+# Typical head memory per active series, including its chunks and index entries
+DEFAULT_BYTES_PER_SERIES = 4096
+DEFAULT_SCRAPE_INTERVAL_SECONDS = 15
+# Suggest dropping a noisy metric once it holds this share of all head series
+SUGGEST_MIN_SHARE = 0.01
+PROCESS_GROUPS_TO_KEEP = 15
+PROCESS_METRIC_PREFIX = 'namedprocess_namegroup_'
+
+# Metrics that are rarely queried compared with how many series they create
+NOISY_METRICS = [
+    (r'node_cpu_guest_seconds_total', 'guest CPU time, always zero outside hypervisors'),
+    (r'node_softnet_.+', 'one series per CPU for softirq counters'),
+    (r'node_netstat_.+', 'kernel protocol counters, mostly unused'),
+    (r'node_sockstat_.+', 'socket counts per protocol'),
+    (r'node_scrape_collector_.+', 'per-collector scrape timing'),
+    (r'node_network_(address_assign_type|carrier_changes_total|device_id|dormant|flags|iface_id|iface_link|'
+     r'iface_link_mode|name_assign_type|net_dev_group|protocol_type|transmit_queue_length)',
+     'static interface attributes'),
+    (r'node_(arp|timex|entropy|schedstat)_.+', 'collectors without dashboards or alerts'),
+    (r'go_(gc|memstats|sched)_.+', 'Go runtime internals of the exporters'),
+    (r'promhttp_.+', 'exporter HTTP handler statistics'),
+    (PROCESS_METRIC_PREFIX + r'(context_switches_total|major_page_faults_total|minor_page_faults_total|'
+     r'thread_.+|states)', 'per-process counters multiplied by every process group'),
+]
+
+
+class PrometheusAPIError(Exception):
+    pass
+
+
+def _get(base_url, path, params=None, raw=False):
+    url = base_url.rstrip('/') + path
+    if params:
+        url += '?' + urllib.parse.urlencode(params)
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            body = response.read().decode('utf-8')
+    except Exception as e:
+        raise PrometheusAPIError(f"Could not read {url}: {e}")
+    if raw:
+        return body
+    payload = json.loads(body)
+    if payload.get('status') != 'success':
+        raise PrometheusAPIError(f"{url} returned {payload.get('error', payload.get('status'))}")
+    return payload['data']
+
+
+def query(base_url, promql):
+    return _get(base_url, '/api/v1/query', {'query': promql})['result']
+
+
+def tsdb_status(base_url, limit=TSDB_STATUS_LIMIT):
+    return _get(base_url, '/api/v1/status/tsdb', {'limit': limit})
+
+
+def series_by_job(base_url, metric_names):
+    """Head series of each metric per job: {metric: {job: count}}."""
+    if not metric_names:
+        return {}
+    pattern = '|'.join(metric_names)
+    result = {}
+    for sample in query(base_url, f'count by (__name__, job) ({{__name__=~"{pattern}"}})'):
+        labels = sample['metric']
+        result.setdefault(labels.get('__name__'), {})[labels.get('job', '')] = int(float(sample['value'][1]))
+    return result
+
+
+def bytes_per_series(base_url, head_series):
+    """Prometheus' resident memory per head series, from its own /metrics."""
+    if head_series:
+        try:
+            for family in text_string_to_metric_families(_get(base_url, '/metrics', raw=True)):
+                if family.name == 'process_resident_memory_bytes':
+                    return family.samples[0].value / head_series, True
+        except (PrometheusAPIError, ValueError, IndexError):
+            pass
+    return DEFAULT_BYTES_PER_SERIES, False
+
+
+def noisy_reason(metric_name):
+    for pattern, reason in NOISY_METRICS:
+        if re.fullmatch(pattern, metric_name):
+            return reason
+    return None
+
+
+def relabel_rules(drops):
+    """``metric_relabel_configs`` per job from {job: [metric names]}."""
+    return {
+        job: [{
+            'source_labels': ['__name__'],
+            'regex': '(' + '|'.join(sorted(set(names))) + ')',
+            'action': 'drop',
+        }]
+        for job, names in sorted(drops.items()) if names
+    }
+
+
+def parse_duration(value, default=DEFAULT_SCRAPE_INTERVAL_SECONDS):
+    """Seconds in a Prometheus duration such as ``10s``, ``1m`` or ``1m30s``."""
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000}
+    parts = re.findall(r'(\d+)(ms|s|m|h|d|w|y)', str(value or ''))
+    return sum(int(number) * units[unit] for number, unit in parts) or default
+
+
+def scrape_intervals(config):
+    """Scrape interval in seconds per job label of a parsed prometheus.yml."""
+    default = parse_duration((config.get('global') or {}).get('scrape_interval'))
+    intervals = {}
+    for job in config.get('scrape_configs') or []:
+        # Jobs split by scrape interval share a label; the plain job comes first and holds most targets
+        intervals.setdefault(job_label(job), parse_duration(job.get('scrape_interval'), default))
+    return intervals
+
+
+def estimate_savings(series, samples_per_second, bytes_each, head_series):
+    return {
+        'series': series,
+        'share': round(series / head_series, 4) if head_series else 0,
+        'memory_bytes': int(series * bytes_each),
+        'samples_per_second': round(samples_per_second, 1),
+    }
+
+
+def process_groupings(base_url, keep=PROCESS_GROUPS_TO_KEEP):
+    """A tighter process_exporter config: the busiest process names, and one group for the rest.
+
+    Returns None when process_exporter is not scraped.
+    """
+    totals = query(base_url, f'count({{__name__=~"{PROCESS_METRIC_PREFIX}.+"}})')
+    groups = query(base_url, f'count(count by (groupname) ({PROCESS_METRIC_PREFIX}num_procs))')
+    if not totals or not groups:
+        return None
+    series, group_count = int(float(totals[0]['value'][1])), int(float(groups[0]['value'][1]))
+    busiest = query(base_url, f'topk({keep}, sum by (groupname) '
+                              f'(rate({PROCESS_METRIC_PREFIX}cpu_seconds_total[5m])))')
+    names = sorted({sample['metric'].get('groupname') for sample in busiest} - {None, ''})
+    config = {'process_names': [
+        {'name': '{{.Comm}}', 'comm': names},
+        # Everything else is summed into a single group instead of one group per command
+        {'name': 'other', 'cmdline': ['.+']},
+    ]}
+    kept_groups = min(group_count, len(names) + 1)
+    return {
+        'groups': group_count,
+        'kept_groups': kept_groups,
+        'series': series,
+        'saved_series': series - round(series / group_count * kept_groups) if group_count else 0,
+        'config': yaml.safe_dump(config, sort_keys=False, default_flow_style=False),
+    }
+
+
+def analyze(base_url=PROMETHEUS_URL, limit=TSDB_STATUS_LIMIT):
+    """Top metrics and labels by series count, with suggested drops and their estimated saving."""
+    status = tsdb_status(base_url, limit)
+    head_series = status.get('headStats', {}).get('numSeries', 0)
+    bytes_each, measured = bytes_per_series(base_url, head_series)
+    top = status.get('seriesCountByMetricName', [])
+    jobs = series_by_job(base_url, [entry['name'] for entry in top])
+
+    metrics = []
+    for entry in top:
+        reason = noisy_reason(entry['name'])
+        share = entry['value'] / head_series if head_series else 0
+        metrics.append({
+            'name': entry['name'],
+            'series': entry['value'],
+            'share': round(share, 4),
+            'jobs': jobs.get(entry['name'], {}),
+            'reason': reason,
+            'suggested': bool(reason) and share >= SUGGEST_MIN_SHARE,
+        })
+
+    memory_by_label = {entry['name']: entry['value'] for entry in status.get('memoryInBytesByLabelName', [])}
+    labels = [{
+        'name': entry['name'],
+        'value_count': entry['value'],
+        'memory_bytes': memory_by_label.get(entry['name'], 0),
+    } for entry in status.get('labelValueCountByLabelName', [])]
+
+    try:
+        processes = process_groupings(base_url)
+    except PrometheusAPIError:
+        processes = None
+
+    return {
+        'prometheus_url': base_url,
+        'head_series': head_series,
+        'label_pairs': status.get('headStats', {}).get('numLabelPairs', 0),
+        'bytes_per_series': int(bytes_each),
+        'bytes_per_series_measured': measured,
+        'metrics': metrics,
+        'labels': labels,
+        'label_pairs_top': status.get('seriesCountByLabelValuePair', []),
+        'processes': processes,
+    }
+
+
+def plan(report, selected, intervals=None):
+    """Rules and estimated saving for the selected ``(job, metric)`` pairs of a report.
+
+    ``intervals`` maps job labels to their scrape interval in seconds.
+    """
+    intervals = intervals or {}
+    series_of = {(job, metric['name']): count for metric in report['metrics'] for job, count in metric['jobs'].items()}
+    drops = {}
+    for job, metric in selected:
+        if (job, metric) in series_of:
+            drops.setdefault(job, []).append(metric)
+    rules = relabel_rules(drops)
+    saved = sum(series_of[(job, metric)] for job, names in drops.items() for metric in names)
+    samples = sum(series_of[(job, metric)] / intervals.get(job, DEFAULT_SCRAPE_INTERVAL_SECONDS)
+                  for job, names in drops.items() for metric in names)
+    return {
+        'rules': rules,
+        'rules_yaml': yaml.safe_dump(
+            [{'job_name': job, 'metric_relabel_configs': job_rules} for job, job_rules in rules.items()],
+            sort_keys=False, default_flow_style=False) if rules else '',
+        'savings': estimate_savings(saved, samples, report['bytes_per_series'], report['head_series']),
+    }
+
+
+def job_label(scrape_config):
+    """The ``job`` label a scrape config produces; jobs split by scrape interval relabel it back."""
+    for rule in scrape_config.get('relabel_configs') or []:
+        if rule.get('target_label') == 'job' and not rule.get('source_labels') and 'replacement' in rule:
+            return rule['replacement']
+    return scrape_config.get('job_name')
+
+
+def federated_rules(rules):
+    """The drop rules of {job: rules} for a federation job, which keeps each series' own job label."""
+    return [{
+        'source_labels': ['job'] + rule['source_labels'],
+        'regex': re.escape(job) + ';' + rule['regex'],
+        'action': rule['action'],
+    } for job, job_rules in sorted(rules.items()) for rule in job_rules]
+
+
+def merge_relabel_rules(config, rules):
+    """Add drop rules to the scrape jobs of a parsed prometheus.yml, by job label; returns the jobs changed.
+
+    The series of other scrape shards arrive through ``/federate`` jobs under their
+    original job label, so those jobs drop them too.
+    """
+    changed = []
+    for job in config.get('scrape_configs') or []:
+        if job.get('metrics_path') == '/federate':
+            new_rules = federated_rules(rules)
+        else:
+            new_rules = rules.get(job_label(job))
+        if not new_rules:
+            continue
+        existing = job.setdefault('metric_relabel_configs', [])
+        added = [rule for rule in new_rules if rule not in existing]
+        if added:
+            existing.extend(added)
+            changed.append(job['job_name'])
+    return changed
@@ -3,20 +3,54 @@
 # Install Node Exporter on a remote server
 set -e
 
-# Usage: ./install_node_exporter.sh <remote_ip> <username> <key_path>
+# Usage: ./install_node_exporter.sh <remote_ip> <username> <key_path> [minimal|standard|full]
 
 REMOTE_IP=$1
 USERNAME=$2
 KEY_PATH=$3
+PROFILE=${4:-standard}
 
-echo "Installing Node Exporter on $REMOTE_IP..."
+echo "Installing Node Exporter on $REMOTE_IP with the $PROFILE collector profile..."
 
-# Download and install Node Exporter
-ssh -o "StrictHostKeyChecking no" -i "$KEY_PATH" "$USERNAME@$REMOTE_IP" << 'ENDSSH'
-    wget https://github.com/prometheus/node_exporter/releases/download/v1.3.1/node_exporter-1.3.1.linux-amd64.tar.gz
-    tar xvf node_exporter-1.3.1.linux-amd64.tar.gz
-    cd node_exporter-1.3.1.linux-amd64
-    nohup ./node_exporter &> node_exporter.log &
+# Download and install Node Exporter; the profile is the remote script's first argument
+ssh -o "StrictHostKeyChecking no" -i "$KEY_PATH" "$USERNAME@$REMOTE_IP" bash -s -- "$PROFILE" << 'ENDSSH'
+    set -e -f
+    PROFILE=$1
+    # Collector profiles, the same as node_exporter_profiles in ansible/vars.yml
+    EXCLUDES=' --collector.filesystem.fs-types-exclude=^(autofs|binfmt_misc|bpf|cgroup2?|configfs|debugfs|devpts|devtmpfs|fusectl|hugetlbfs|iso9660|mqueue|nsfs|overlay|proc|procfs|pstore|rpc_pipefs|securityfs|selinuxfs|squashfs|sysfs|tmpfs|tracefs)$'
+    EXCLUDES+=' --collector.netdev.device-exclude=^(lo|veth.*|docker.*|br-.*|cni.*|flannel.*)$'
+    case "$PROFILE" in
+        minimal)
+            # ~200 series: CPU, memory, load, filesystems, disks and network only
+            FLAGS='--collector.disable-defaults --collector.cpu --collector.meminfo --collector.loadavg --collector.filesystem'
+            FLAGS+=' --collector.diskstats --collector.netdev --collector.stat --collector.uname --web.disable-exporter-metrics'
+            FLAGS+="$EXCLUDES"
+            ;;
+        standard)
+            # ~450 series: the defaults without hardware, kernel-internals and per-protocol collectors
+            FLAGS=''
+            for collector in arp bcache bonding btrfs edac entropy fibrechannel hwmon infiniband ipvs mdadm netclass nfs nfsd \
+                    nvme powersupplyclass rapl schedstat sockstat softnet tapestats thermal_zone timex udp_queues xfs zfs; do
+                FLAGS+="--no-collector.$collector "
+            done
+            FLAGS+='--web.disable-exporter-metrics'
+            FLAGS+=' --collector.netstat.fields=^(Tcp_(ActiveOpens|PassiveOpens|CurrEstab|RetransSegs|InErrs)|Udp_(InDatagrams|OutDatagrams|InErrors|NoPorts))$'
+            FLAGS+="$EXCLUDES"
+            ;;
+        full)
+            # ~1,200 series: every default collector
+            FLAGS=''
+            ;;
+        *)
+            echo "Unknown profile '$PROFILE', expected minimal, standard or full" >&2
+            exit 1
+            ;;
+    esac
+
+    wget https://github.com/prometheus/node_exporter/releases/download/v1.8.2/node_exporter-1.8.2.linux-amd64.tar.gz
+    tar xvf node_exporter-1.8.2.linux-amd64.tar.gz
+    cd node_exporter-1.8.2.linux-amd64
+    nohup ./node_exporter $FLAGS &> node_exporter.log &
     sudo cp node_exporter /usr/local/bin
 ENDSSH
 
@@ -1,9 +1,16 @@
 import os
+import sys
+import json
+import time
 import subprocess
-from flask import Flask, render_template, redirect, url_for, request, jsonify
+from flask import Flask, render_template, redirect, url_for, request, jsonify, Response
 import socket
 import logging
 from logging.handlers import RotatingFileHandler
+from service_monitor import ServiceMonitor, MONITORED_SERVICES
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import init_app, track_subprocess
 
 # Application setup
 BASE_DIR = "/opt/observability/main"
@@ -26,6 +33,13 @@ logger.addHandler(handler)
 app = Flask(__name__, 
             static_folder=STATIC_DIR,
             template_folder=TEMPLATES_DIR)
+init_app(app, "main")
+
+service_monitor = ServiceMonitor()
+
+# How often the SSE stream checks for status changes, and sends a keep-alive when idle
+STATUS_STREAM_INTERVAL = 2
+STATUS_STREAM_HEARTBEAT = 15
 
 # Helper function to get server IP
 def get_server_ip():
@@ -45,12 +59,14 @@ def start_service(service_name):
     """Start a systemd service and return status"""
     try:
         logger.info(f"Starting service: {service_name}")
-        result = subprocess.run(
-            ["sudo", "systemctl", "start", service_name],
-            capture_output=True,
-            text=True
-        )
+        with track_subprocess(f"systemctl start {service_name}"):
+            result = subprocess.run(
+                ["sudo", "systemctl", "start", service_name],
+                capture_output=True,
+                text=True
+            )
         
+        service_monitor.invalidate()
         if result.returncode == 0:
             logger.info(f"Successfully started {service_name}")
             return True, "Service started successfully"
@@ -64,16 +80,7 @@ def start_service(service_name):
 
 def check_service_status(service_name):
     """Check if a service is running"""
-    try:
-        result = subprocess.run(
-            ["systemctl", "is-active", service_name],
-            capture_output=True,
-            text=True
-        )
-        return result.stdout.strip() == "active"
-    except Exception as e:
-        logger.error(f"Error checking service status: {e}")
-        return False
+    return service_monitor.status(service_name) == "running"
 
 # Routes
 @app.route('/')
@@ -106,14 +113,7 @@ def eks_monitoring_page():
 @app.route('/start_service/<service_name>', methods=['POST'])
 def start_monitoring_service(service_name):
     """API endpoint to start a monitoring service"""
-    valid_services = {
-        "grafanamonitoring", 
-        "ansiblemonitoring", 
-        "cloudwatch_monitoring", 
-        "eksmonitoring"
-    }
-    
-    if service_name not in valid_services:
+    if service_name not in MONITORED_SERVICES:
         logger.warning(f"Invalid service name requested: {service_name}")
         return jsonify({
             "success": False,
@@ -152,21 +152,37 @@ def eks_page():
     status = "running" if check_service_status("eksmonitoring") else "stopped"
     return render_template('eks_setup.html', service_status=status)
 
+@app.route('/service_status')
+def all_service_status():
+    """API endpoint returning the status of every monitoring service"""
+    return jsonify({"services": service_monitor.statuses()})
+
+@app.route('/service_status/stream')
+def service_status_stream():
+    """Server-sent events: the full status map on connect, then on every change"""
+    def generate():
+        last = None
+        last_sent = 0
+        while True:
+            statuses = service_monitor.statuses()
+            if statuses != last:
+                last = statuses
+                last_sent = time.time()
+                yield f"data: {json.dumps({'services': statuses})}\n\n"
+            elif time.time() - last_sent >= STATUS_STREAM_HEARTBEAT:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(STATUS_STREAM_INTERVAL)
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/service_status/<service_name>')
 def service_status(service_name):
     """API endpoint to check service status"""
-    valid_services = {
-        "grafanamonitoring", 
-        "ansiblemonitoring", 
-        "cloudwatch_monitoring", 
-        "eksmonitoring"
-    }
-    
-    if service_name not in valid_services:
+    if service_name not in MONITORED_SERVICES:
         return jsonify({"status": "unknown", "error": "Invalid service name"}), 400
     
-    status = "running" if check_service_status(service_name) else "stopped"
-    return jsonify({"status": status})
+    return jsonify({"status": service_monitor.status(service_name)})
 
 if __name__ == '__main__':
     server_ip = get_server_ip()
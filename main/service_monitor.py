@@ -0,0 +1,68 @@
+import subprocess
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MONITORED_SERVICES = (
+    "grafanamonitoring",
+    "ansiblemonitoring",
+    "cloudwatch_monitoring",
+    "eksmonitoring"
+)
+
+# Status results are shared by every page load, poll and SSE client for this long
+STATUS_TTL_SECONDS = 2
+
+
+class ServiceMonitor:
+    """Batched, briefly cached systemd status for the portal's services.
+
+    All services are queried with a single ``systemctl show`` call, so the
+    number of processes forked no longer grows with page loads or pollers.
+    """
+
+    def __init__(self, services=MONITORED_SERVICES, ttl=STATUS_TTL_SECONDS):
+        self.services = tuple(services)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._checked_at = 0
+
+    def _query(self):
+        statuses = {name: "stopped" for name in self.services}
+        try:
+            result = subprocess.run(
+                ["systemctl", "show", "--property=Id,ActiveState", *[f"{name}.service" for name in self.services]],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+        except Exception as e:
+            logger.error(f"Error checking service status: {e}")
+            return statuses
+
+        # One block of KEY=value lines per unit, separated by blank lines
+        for block in result.stdout.strip().split("\n\n"):
+            properties = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+            name = properties.get("Id", "").removesuffix(".service")
+            if name in statuses:
+                statuses[name] = "running" if properties.get("ActiveState") == "active" else "stopped"
+        return statuses
+
+    def statuses(self):
+        """Return {service: "running"|"stopped"}, refreshed at most once per TTL."""
+        with self._lock:
+            if time.time() - self._checked_at >= self.ttl:
+                self._statuses = self._query()
+                self._checked_at = time.time()
+            return dict(self._statuses)
+
+    def status(self, service_name):
+        return self.statuses().get(service_name, "stopped")
+
+    def invalidate(self):
+        """Force the next read to query systemd, e.g. after starting a service."""
+        with self._lock:
+            self._checked_at = 0
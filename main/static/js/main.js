@@ -16,9 +16,17 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // For demonstration purposes, check status of services periodically
+    // Follow service status changes pushed by the server, falling back to polling
     if (document.querySelector('.status-indicator')) {
-        setInterval(checkServiceStatus, 10000);
+        if (window.EventSource) {
+            const statusStream = new EventSource('/service_status/stream');
+            statusStream.onmessage = function(event) {
+                const data = JSON.parse(event.data);
+                updateStatusIndicator(data.services[currentServiceName()]);
+            };
+        } else {
+            setInterval(checkServiceStatus, 10000);
+        }
     }
 });
 
@@ -47,24 +55,32 @@ function startService(serviceName) {
     });
 }
 
-function checkServiceStatus() {
+function currentServiceName() {
+    return document.querySelector('.detail-value:nth-child(2)').textContent.trim();
+}
+
+function updateStatusIndicator(status) {
     const statusIndicator = document.querySelector('.status-indicator');
-    if (!statusIndicator) return;
-    
-    const serviceName = document.querySelector('.detail-value:nth-child(2)').textContent.trim();
-    
-    fetch('/service_status/' + serviceName)
+    if (!statusIndicator || !status) return;
+
+    if (status === 'running') {
+        statusIndicator.classList.add('active');
+        statusIndicator.classList.remove('inactive');
+        statusIndicator.querySelector('.status-text').textContent = 'Running';
+    } else {
+        statusIndicator.classList.add('inactive');
+        statusIndicator.classList.remove('active');
+        statusIndicator.querySelector('.status-text').textContent = 'Stopped';
+    }
+}
+
+function checkServiceStatus() {
+    if (!document.querySelector('.status-indicator')) return;
+
+    fetch('/service_status')
         .then(response => response.json())
         .then(data => {
-            if (data.status === 'running') {
-                statusIndicator.classList.add('active');
-                statusIndicator.classList.remove('inactive');
-                statusIndicator.querySelector('.status-text').textContent = 'Running';
-            } else {
-                statusIndicator.classList.add('inactive');
-                statusIndicator.classList.remove('active');
-                statusIndicator.querySelector('.status-text').textContent = 'Stopped';
-            }
+            updateStatusIndicator(data.services[currentServiceName()]);
         })
         .catch(error => {
             console.error('Error checking service status:', error);
@@ -4,7 +4,7 @@
 sudo add-apt-repository -y ppa:deadsnakes/ppa
 sudo apt update
 # Install common utilities and Python dependencies
-sudo apt install -y unzip wget nginx python3 python3-pip python3-flask-cors python3-paramiko python3-scp python3-flask python3-boto3
+sudo apt install -y unzip wget nginx python3 python3-pip python3-flask-cors python3-paramiko python3-scp python3-flask python3-boto3 python3-prometheus-client
 
 # Install AWS CLI (Corrected)
 curl "https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip" -o "awscliv2.zip"